@@ -0,0 +1,149 @@
+"""
+Microbenchmark de los codecs de asyncpg (db/codecs.py).
+
+Compara por fila, para el camino de execute_property_sql (filas → dicts
+serializables → JSON):
+- antes: valores como los entrega asyncpg por defecto (Decimal, UUID,
+  datetime) + el recorrido de serialize_rows con hasattr/isinstance/str por celda
+- después: valores ya convertidos por los codecs + serialize_rows sin recorrido
+
+El costo de los decoders de los codecs (float/str sobre el texto del
+servidor, ISO desde el tuple binario) se mide aparte y se suma al "después";
+los decoders binarios propios de asyncpg (en C) se cuentan como gratis, así
+que el ahorro reportado es conservador.
+
+Uso:
+    python -m benchmarks.codec_bench --rows 200 --repeat 200
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Any, List, Callable
+
+from db.codecs import decode_timestamptz, encode_timestamptz
+from tools.sql_tools import serialize_rows
+
+
+def legacy_serialize_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """serialize_rows tal como estaba antes de los codecs."""
+    serializable_results = []
+    for row in rows:
+        row_dict = {}
+        for key, value in row.items():
+            if hasattr(value, 'isoformat'):
+                row_dict[key] = value.isoformat()
+            elif isinstance(value, (int, float, str, bool, type(None))):
+                row_dict[key] = value
+            else:
+                row_dict[key] = str(value)
+        serializable_results.append(row_dict)
+    return serializable_results
+
+
+def driver_row(index: int) -> Dict[str, Any]:
+    """Fila de propiedad + edificio como la entrega asyncpg sin codecs."""
+    return {
+        "id": uuid.UUID(int=index + 1),
+        "edificio_id": uuid.UUID(int=10_000 + index % 40),
+        "numero": str(100 + index),
+        "piso": index % 20,
+        "tipo": "DEPARTAMENTO",
+        "area": Decimal("85.50") + index,
+        "dormitorios": 2,
+        "banios": 2,
+        "balcon": True,
+        "terraza": False,
+        "amoblado": False,
+        "permite_mascotas": True,
+        "valor_comercial": Decimal("450000.00") + index * 1000,
+        "mantenimiento_mensual": Decimal("350.00"),
+        "estado": "PLANOS",
+        "created_at": datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc),
+        "edificio_nombre": "Torre Miraflores",
+        "edificio_direccion": "Av. Larco 123",
+        "edificio_distrito": "Miraflores",
+    }
+
+
+# Lo que el servidor envía para cada columna con codec (texto o tuple binario)
+WIRE_DECODERS: Dict[str, Callable] = {
+    "id": str,
+    "edificio_id": str,
+    "area": float,
+    "valor_comercial": float,
+    "mantenimiento_mensual": float,
+    "created_at": decode_timestamptz,
+}
+
+
+def wire_values(row: Dict[str, Any]) -> Dict[str, Any]:
+    wire = {}
+    for key in WIRE_DECODERS:
+        value = row[key]
+        wire[key] = encode_timestamptz(value) if isinstance(value, datetime) else str(value)
+    return wire
+
+
+def codec_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """La misma fila como la entregan los codecs."""
+    decoded = dict(row)
+    for key, value in wire_values(row).items():
+        decoded[key] = WIRE_DECODERS[key](value)
+    return decoded
+
+
+def per_row_us(func: Callable, rows: int, repeat: int) -> float:
+    for _ in range(10):
+        func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / (repeat * rows) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark de codecs de asyncpg")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    legacy_rows = [driver_row(index) for index in range(args.rows)]
+    codec_rows = [codec_row(row) for row in legacy_rows]
+    wire_rows = [wire_values(row) for row in legacy_rows]
+
+    # Mismo JSON salvo numeric (antes string, ahora número)
+    legacy_json = json.loads(json.dumps(legacy_serialize_rows(legacy_rows)))
+    codec_json = json.loads(json.dumps(serialize_rows(codec_rows)))
+    for before, after in zip(legacy_json, codec_json):
+        for key, value in before.items():
+            expected = float(value) if key in ("area", "valor_comercial", "mantenimiento_mensual") else value
+            assert after[key] == expected, f"{key}: {value!r} vs {after[key]!r}"
+
+    def decode_with_codecs():
+        for wire in wire_rows:
+            for key, value in wire.items():
+                WIRE_DECODERS[key](value)
+
+    legacy_us = per_row_us(lambda: json.dumps(legacy_serialize_rows(legacy_rows)), args.rows, args.repeat)
+    codec_us = per_row_us(lambda: json.dumps(serialize_rows(codec_rows)), args.rows, args.repeat)
+    decode_us = per_row_us(decode_with_codecs, args.rows, args.repeat)
+    legacy_convert_us = per_row_us(lambda: legacy_serialize_rows(legacy_rows), args.rows, args.repeat)
+
+    after_us = codec_us + decode_us
+    print(f"\n{args.rows} filas x {args.repeat} repeticiones ({len(legacy_rows[0])} columnas, "
+          f"{len(WIRE_DECODERS)} con codec)")
+    print(f"\n{'camino':<44}{'µs/fila':>10}")
+    print("-" * 54)
+    print(f"{'antes: serialize_rows por celda':<44}{legacy_convert_us:>10.2f}")
+    print(f"{'antes: serialize_rows + json.dumps':<44}{legacy_us:>10.2f}")
+    print(f"{'después: decoders de los codecs':<44}{decode_us:>10.2f}")
+    print(f"{'después: serialize_rows + json.dumps':<44}{codec_us:>10.2f}")
+    print(f"{'después: total':<44}{after_us:>10.2f}")
+    print(f"\nAhorro: {legacy_us - after_us:.2f} µs/fila ({(1 - after_us / legacy_us) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
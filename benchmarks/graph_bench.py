@@ -0,0 +1,144 @@
+"""
+Benchmark end to end de property_search_graph con el LLM grabado en un cassette.
+
+Corre conversaciones guionadas turno por turno con process_user_message (grafo
+completo: nodos, gateway, prompts, búsqueda) sin red hacia el LLM:
+
+- --record: llama a los backends de LLM_BACKENDS y graba el cassette
+- replay (default): sirve las respuestas grabadas con su latencia original
+  (--latency-scale 0 para medir solo CPU)
+
+Las búsquedas van a la base de DATABASE_URL si está disponible; sin base esos
+turnos terminan con error y el resto de la conversación se mide igual. Grabar y
+reproducir contra el mismo inventario (o ambos sin base): los prompts incluyen
+resultados y catálogo, y un prompt distinto es un miss del cassette.
+
+Uso:
+    python -m benchmarks.graph_bench --record
+    python -m benchmarks.graph_bench --iterations 20
+    python -m benchmarks.graph_bench --iterations 20 --latency-scale 0
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List
+
+from db import db
+from llm.cassette import llm_cassette, RECORD, REPLAY
+from llm.gateway import llm_gateway
+from pipeline import process_user_message, session_manager
+from tools.speculative_search import speculative_search
+
+
+CONVERSATIONS: List[List[str]] = [
+    [
+        "Hola, busco un departamento en Miraflores",
+        "de mínimo 80 m2",
+        "que esté en planos",
+        "mi presupuesto máximo es 300 mil",
+        "2 dormitorios",
+        "no, así está bien, búscalo",
+    ],
+    [
+        "Busco en San Isidro, 120 m2, entrega inmediata, máximo 600 mil, 3 dormitorios",
+        "que acepte mascotas y tenga balcón",
+        "búscalo",
+    ],
+    [
+        "Quiero algo en Barranco de 2 dormitorios",
+        "60 m2 como mínimo, en construcción, hasta 250 mil",
+        "búscalo",
+        "mejor con terraza",
+    ],
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))]
+
+
+async def run_conversation(messages: List[str], turns: List[float], nodes: Dict[str, List[float]]):
+    session_id = f"bench-{uuid.uuid4()}"
+    for message in messages:
+        state = await process_user_message(session_id, message)
+        turns.append(state.turn_wall_ms)
+        for node, ms in state.turn_timings.items():
+            nodes[node].append(ms)
+    session_manager.delete_session(session_id)
+
+
+async def run(iterations: int, concurrency: int, verbose: bool):
+    try:
+        await db.connect()
+        await db.catalog.load()
+    except Exception as e:
+        print(f"⚠️ Sin base de datos ({e}): los turnos de búsqueda terminan con error")
+    # La búsqueda especulativa corre fuera del turno y no se mide aquí
+    speculative_search.enabled = False
+
+    turns: List[float] = []
+    nodes: Dict[str, List[float]] = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(messages: List[str]):
+        async with semaphore:
+            await run_conversation(messages, turns, nodes)
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    with output:
+        await asyncio.gather(*(one(messages) for _ in range(iterations) for messages in CONVERSATIONS))
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    try:
+        await db.disconnect()
+    except Exception:
+        pass
+    return turns, nodes, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de property_search_graph con cassettes de LLM")
+    parser.add_argument("--record", action="store_true", help="Llamar al LLM real y grabar el cassette")
+    parser.add_argument("--cassette", default=None, help="Archivo del cassette (default: LLM_CASSETTE_PATH)")
+    parser.add_argument("--latency-scale", type=float, default=None, help="Factor sobre la latencia grabada (0 = solo CPU)")
+    parser.add_argument("--iterations", type=int, default=5, help="Veces que se corre cada conversación")
+    parser.add_argument("--concurrency", type=int, default=1, help="Conversaciones en paralelo")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los logs del pipeline")
+    args = parser.parse_args()
+
+    if args.latency_scale is not None:
+        llm_cassette.latency_scale = args.latency_scale
+    llm_cassette.open(RECORD if args.record else REPLAY, args.cassette)
+    iterations = 1 if args.record and args.iterations == parser.get_default("iterations") else args.iterations
+
+    turns, nodes, wall, cpu = asyncio.run(run(iterations, args.concurrency, args.verbose))
+    llm_cassette.save()
+
+    cassette = llm_cassette.get_metrics()
+    mode = "record" if args.record else f"replay x{llm_cassette.latency_scale:g}"
+    print(f"\n{len(CONVERSATIONS) * iterations} conversaciones, {len(turns)} turnos ({mode}, concurrencia {args.concurrency})")
+    print(f"wall {wall:.2f} s · CPU {cpu:.2f} s · {len(turns) / wall:.1f} turnos/s")
+    print(f"cassette: {cassette['hits']} hits, {cassette['misses']} misses, {cassette['recorded']} grabadas · "
+          f"gateway: {llm_gateway.calls} llamadas, {llm_gateway.unavailable} sin respuesta")
+
+    print(f"\n{'nodo':<34}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'media ms':>10}")
+    print("-" * 70)
+    for name, values in sorted(nodes.items(), key=lambda item: -sum(item[1])):
+        print(f"{name:<34}{len(values):>6}{percentile(values, 0.5):>10.1f}"
+              f"{percentile(values, 0.95):>10.1f}{statistics.fmean(values):>10.1f}")
+    if turns:
+        print(f"{'turno completo':<34}{len(turns):>6}{percentile(turns, 0.5):>10.1f}"
+              f"{percentile(turns, 0.95):>10.1f}{statistics.fmean(turns):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
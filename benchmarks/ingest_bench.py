@@ -0,0 +1,94 @@
+"""
+Benchmark del lado Python de la ingesta (tools/ingest.py).
+
+Mide cuántas filas por minuto puede entregar el proceso al COPY: lectura del
+stream en bloques, parseo CSV/NDJSON, lotes y armado de los records para
+copy_records_to_table. El COPY y los upserts corren en PostgreSQL y no se
+miden aquí (necesitan una base); esta cifra es el techo del lado del proceso.
+
+Uso:
+    python -m benchmarks.ingest_bench --rows 100000
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import time
+from typing import AsyncIterator
+
+from tools.ingest import IngestPlan, read_batches, CSV, NDJSON
+
+PROPIEDAD = {
+    "id": "uuid", "edificio_id": "uuid", "numero": "varchar", "piso": "integer",
+    "area": "numeric", "dormitorios": "integer", "banios": "integer", "balcon": "boolean",
+    "terraza": "boolean", "valor_comercial": "numeric", "estado": "varchar",
+}
+EDIFICIO = {"id": "uuid", "nombre": "varchar", "direccion": "text", "distrito": "varchar"}
+
+
+def feed_row(index: int) -> dict:
+    return {
+        "id": f"00000000-0000-0000-0000-{index:012d}",
+        "edificio_id": f"00000000-0000-0000-0001-{index % 500:012d}",
+        "numero": str(100 + index % 900),
+        "piso": index % 20,
+        "area": 60.5 + index % 90,
+        "dormitorios": 1 + index % 4,
+        "banios": 1 + index % 3,
+        "balcon": index % 2 == 0,
+        "terraza": index % 5 == 0,
+        "valor_comercial": 250000.0 + index % 1000 * 500,
+        "estado": "TERMINADO",
+        "edificio_nombre": f"Torre {index % 500}",
+        "edificio_direccion": "Av. Larco 123, piso 1",
+        "edificio_distrito": "Miraflores",
+    }
+
+
+def build_feed(rows: int, feed_format: str) -> bytes:
+    if feed_format == NDJSON:
+        return "".join(json.dumps(feed_row(index)) + "\n" for index in range(rows)).encode()
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=list(feed_row(0)))
+    writer.writeheader()
+    for index in range(rows):
+        writer.writerow(feed_row(index))
+    return output.getvalue().encode()
+
+
+async def chunks(data: bytes, size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def run(data: bytes, feed_format: str, batch_size: int) -> int:
+    plan = None
+    rows = 0
+    async for header, batch in read_batches(chunks(data), feed_format, batch_size):
+        plan = plan or IngestPlan(header, {"propiedad": PROPIEDAD, "edificio": EDIFICIO}, "bench")
+        plan.records(batch, rows)
+        rows += len(batch)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del parseo de la ingesta")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"\n{args.rows} filas, lotes de {args.batch_size}")
+    print(f"\n{'formato':<10}{'MB':>8}{'segundos':>12}{'filas/min':>14}")
+    print("-" * 44)
+    for feed_format in (CSV, NDJSON):
+        data = build_feed(args.rows, feed_format)
+        start = time.perf_counter()
+        rows = asyncio.run(run(data, feed_format, args.batch_size))
+        seconds = time.perf_counter() - start
+        assert rows == args.rows
+        print(f"{feed_format:<10}{len(data) / 1e6:>8.1f}{seconds:>12.2f}{rows / seconds * 60:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
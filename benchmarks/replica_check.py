@@ -0,0 +1,222 @@
+"""
+Chequeo de ruteo y failover de réplicas contra servidores PostgreSQL reales.
+
+Levanta un DatabaseManager con el primario de DATABASE_URL y las réplicas de
+DATABASE_REPLICA_URLS (o las de --replica) y verifica:
+
+1. las lecturas read_only se reparten entre las réplicas y no tocan el primario
+2. las queries sin read_only van siempre al primario
+3. una query lenta que cancela el statement_timeout en la réplica NO se repite
+   en el primario ni saca a la réplica de la rotación
+4. si se cortan las conexiones de una réplica, esa lectura se repite una vez en
+   el primario, la réplica queda fuera de la rotación y vuelve tras el chequeo de lag
+5. una réplica inalcanzable al arrancar no bloquea el arranque ni recibe lecturas,
+   y el monitor reintenta conectarla con backoff creciente
+
+Sirven instancias locales independientes (no hace falta replicación real: una
+instancia que no está en recovery reporta lag 0), por ejemplo:
+
+    docker run -d -p 5433:5432 -e POSTGRES_PASSWORD=pg postgres:16
+    docker run -d -p 5434:5432 -e POSTGRES_PASSWORD=pg postgres:16
+    docker run -d -p 5435:5432 -e POSTGRES_PASSWORD=pg postgres:16
+
+Uso:
+    python -m benchmarks.replica_check \\
+        --primary postgresql://postgres:pg@localhost:5433/postgres \\
+        --replica postgresql://postgres:pg@localhost:5434/postgres \\
+        --replica postgresql://postgres:pg@localhost:5435/postgres
+
+Termina con código 1 si algún chequeo falla.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Dict, List
+
+import asyncpg
+
+from db.admission import QueryClass
+from db.connection import DatabaseManager, nodes_from_settings
+from db.replicas import DatabaseNode
+from models.settings import settings
+
+
+class Checks:
+    """Acumula el resultado de cada verificación."""
+
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, condition: bool, description: str):
+        if condition:
+            print(f"  ✅ {description}")
+        else:
+            self.failed += 1
+            print(f"  ❌ {description}")
+
+
+def build_nodes(primary: str, replicas: List[str]) -> List[DatabaseNode]:
+    if not primary and not replicas:
+        return nodes_from_settings()
+    nodes = [DatabaseNode(primary or settings.database_url, DatabaseNode.PRIMARY, name="primary")]
+    for index, url in enumerate(replicas, start=1):
+        nodes.append(DatabaseNode(url, DatabaseNode.REPLICA, name=f"replica-{index}"))
+    return nodes
+
+
+def requests_by_node(database: DatabaseManager) -> Dict[str, int]:
+    return {node.name: node.requests for node in [database.primary, *database.replicas]}
+
+
+def delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {name: after[name] - before[name] for name in after}
+
+
+async def check_routing(database: DatabaseManager, checks: Checks, reads: int):
+    print(f"\n1. Ruteo de {reads} lecturas concurrentes")
+    before = requests_by_node(database)
+    await asyncio.gather(*(
+        database.fetch_val("SELECT pg_sleep(0.01)::text", read_only=True) for _ in range(reads)
+    ))
+    served = delta(before, requests_by_node(database))
+    print(f"     reparto: {served}")
+    checks.expect(served["primary"] == 0, "el primario no recibió lecturas read_only")
+    checks.expect(all(served[node.name] > 0 for node in database.replicas), "todas las réplicas recibieron lecturas")
+
+    print("\n2. Queries sin read_only")
+    before = requests_by_node(database)
+    await database.fetch_val("SELECT 1")
+    served = delta(before, requests_by_node(database))
+    checks.expect(served["primary"] == 1 and sum(served.values()) == 1, "fueron al primario")
+
+
+async def check_slow_query(database: DatabaseManager, checks: Checks):
+    print("\n3. Query lenta en una réplica (statement_timeout)")
+    database.query_classes["replica_check"] = QueryClass("replica_check", statement_timeout_ms=100)
+    before = requests_by_node(database)
+    fallbacks = database.router.fallbacks_to_primary
+    try:
+        await database.fetch_val("SELECT pg_sleep(1)::text", read_only=True, query_class="replica_check")
+        checks.expect(False, "la query se canceló por statement_timeout")
+    except asyncpg.QueryCanceledError:
+        checks.expect(True, "la query se canceló por statement_timeout")
+    finally:
+        del database.query_classes["replica_check"]
+    served = delta(before, requests_by_node(database))
+    checks.expect(served["primary"] == 0, "no se repitió en el primario")
+    checks.expect(database.router.fallbacks_to_primary == fallbacks, "no contó como failover")
+    checks.expect(all(node.healthy for node in database.replicas), "las réplicas siguen en rotación")
+
+
+async def check_failover(database: DatabaseManager, checks: Checks):
+    print("\n4. Failover al cortar las conexiones de una réplica")
+    cut, others = database.replicas[0], database.replicas[1:]
+    cut.pool.terminate()
+    before = requests_by_node(database)
+    fallbacks = database.router.fallbacks_to_primary
+    # Lecturas secuenciales hasta que el router elija la réplica cortada
+    values = []
+    for _ in range(10 * len(database.replicas)):
+        values.append(await database.fetch_val("SELECT 'ok'", read_only=True))
+        if not cut.healthy:
+            break
+    served = delta(before, requests_by_node(database))
+    checks.expect(all(value == "ok" for value in values), "todas las lecturas se resolvieron")
+    checks.expect(not cut.healthy, f"{cut.name} quedó fuera de rotación")
+    checks.expect(served["primary"] == 1, "la lectura fallida se repitió una vez en el primario")
+    checks.expect(database.router.fallbacks_to_primary == fallbacks + 1, "se contó el failover")
+    checks.expect(all(node.healthy for node in others), "el resto de las réplicas sigue en rotación")
+
+    before = requests_by_node(database)
+    await asyncio.gather(*(database.fetch_val("SELECT 1", read_only=True) for _ in range(20)))
+    served = delta(before, requests_by_node(database))
+    checks.expect(served[cut.name] == 0, f"las lecturas siguientes no pasan por {cut.name}")
+    if others:
+        checks.expect(served["primary"] == 0, "las lecturas siguientes van a las otras réplicas")
+    else:
+        checks.expect(served["primary"] == 20, "sin otra réplica, las lecturas siguientes van al primario")
+
+    # Sin pool el monitor lo vuelve a crear en background y chequea el lag
+    cut.pool = None
+    await database.router.check_lag(cut)
+    await wait_until(lambda: cut.healthy)
+    checks.expect(cut.healthy, f"{cut.name} se reconecta y vuelve tras el chequeo de lag")
+    before = requests_by_node(database)
+    await asyncio.gather(*(database.fetch_val("SELECT pg_sleep(0.01)::text", read_only=True) for _ in range(20)))
+    served = delta(before, requests_by_node(database))
+    checks.expect(served[cut.name] > 0 and served["primary"] == 0, f"{cut.name} vuelve a recibir lecturas")
+
+
+async def wait_until(condition, timeout: float = 5.0):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.05)
+
+
+async def check_dead_replica(primary: DatabaseNode, dead_dsn: str, checks: Checks):
+    print(f"\n5. Réplica inalcanzable al arrancar ({dead_dsn.rsplit('@', 1)[-1]})")
+    database = DatabaseManager([
+        DatabaseNode(primary.dsn, DatabaseNode.PRIMARY, name="primary"),
+        DatabaseNode(dead_dsn, DatabaseNode.REPLICA, name="dead-replica"),
+    ])
+    try:
+        await database.connect()
+        dead = database.replicas[0]
+        checks.expect(not dead.healthy, "arranca con la réplica fuera de rotación")
+        await database.fetch_val("SELECT 1", read_only=True)
+        checks.expect(database.primary.requests == 1 and dead.requests == 0, "las lecturas van al primario")
+
+        # Adelantar el próximo reintento en vez de esperar el intervalo del monitor
+        first_delay = dead.next_reconnect_at - time.monotonic()
+        dead.next_reconnect_at = 0.0
+        await database.router.check_lag(dead)
+        try:
+            await wait_until(lambda: dead.reconnect_failures >= 2, timeout=70)
+        except TimeoutError:
+            pass
+        checks.expect(dead.reconnect_failures == 2, "el monitor reintenta la conexión")
+        checks.expect(dead.next_reconnect_at - time.monotonic() > first_delay, "con backoff creciente")
+    finally:
+        await database.disconnect()
+
+
+async def run(args) -> int:
+    nodes = build_nodes(args.primary, args.replica)
+    database = DatabaseManager(nodes)
+    if not database.replicas:
+        print("❌ Hace falta al menos una réplica (DATABASE_REPLICA_URLS o --replica)")
+        return 2
+
+    checks = Checks()
+    await database.connect()
+    # Sin monitor de fondo: el chequeo controla cuándo se revisa el lag
+    await database.router.stop()
+    try:
+        if not all(node.healthy for node in database.replicas):
+            print("❌ Alguna réplica no respondió al conectar")
+            return 2
+        await check_routing(database, checks, args.reads)
+        await check_slow_query(database, checks)
+        await check_failover(database, checks)
+    finally:
+        await database.disconnect()
+    await check_dead_replica(database.primary, args.dead_dsn, checks)
+
+    print(f"\n{'✅ Todo OK' if not checks.failed else f'❌ {checks.failed} chequeos fallidos'}")
+    return 1 if checks.failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chequeo de ruteo y failover de réplicas de PostgreSQL")
+    parser.add_argument("--primary", default="", help="DSN del primario (default: DATABASE_URL)")
+    parser.add_argument("--replica", action="append", default=[], help="DSN de una réplica (repetible; default: DATABASE_REPLICA_URLS)")
+    parser.add_argument("--reads", type=int, default=200, help="Lecturas concurrentes para el chequeo de ruteo")
+    parser.add_argument("--dead-dsn", default="postgresql://postgres@127.0.0.1:1/postgres",
+                        help="DSN sin servidor para el chequeo de réplica caída")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
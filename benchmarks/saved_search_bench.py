@@ -0,0 +1,106 @@
+"""
+Benchmark del matcher de búsquedas guardadas.
+
+Genera N suscripciones aleatorias (filtros con la misma forma que
+PropertyFilters) y mide cuánto tarda evaluar una propiedad nueva contra todas:
+índice invertido de tools/saved_searches.py vs recorrer las suscripciones con
+matches_filters. Verifica que ambos caminos retornen las mismas búsquedas.
+
+Uso:
+    python -m benchmarks.saved_search_bench --searches 100000 --rows 500
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Dict, Any, List
+
+from tools.query_builder import matches_filters
+from tools.saved_searches import SavedSearchIndex
+
+
+DISTRITOS = [
+    "Miraflores", "San Isidro", "Santiago de Surco", "Barranco", "La Molina",
+    "San Borja", "Jesús María", "Lince", "Magdalena del Mar", "Pueblo Libre",
+    "San Miguel", "Surquillo", "Chorrillos", "Lima", "Breña",
+]
+ESTADOS = ["PLANOS", "CONSTRUCCION", "ENTREGA_INMEDIATA"]
+AMENITIES = ["permite_mascotas", "balcon", "terraza", "amoblado"]
+
+
+def random_filters(rng: random.Random) -> Dict[str, Any]:
+    """Esenciales completos y 0-3 opcionales, como al terminar una conversación."""
+    filters = {
+        "distrito": rng.choice(DISTRITOS),
+        "area_min": float(rng.randrange(40, 200, 5)),
+        "estado_propiedad": rng.choice(ESTADOS),
+        "monto_maximo": float(rng.randrange(150000, 1500000, 10000)),
+        "dormitorios": rng.randint(1, 4),
+    }
+    for name in rng.sample(AMENITIES + ["banios"], rng.randint(0, 3)):
+        filters[name] = rng.randint(1, 3) if name == "banios" else rng.random() < 0.7
+    return filters
+
+
+def random_row(rng: random.Random, index: int) -> Dict[str, Any]:
+    """Fila con la forma de SEARCH_SELECT."""
+    return {
+        "id": f"bench-{index}",
+        "edificio_distrito": rng.choice(DISTRITOS),
+        "area": round(rng.uniform(35, 220), 1),
+        "estado": rng.choice(ESTADOS),
+        "valor_comercial": float(rng.randrange(120000, 1600000, 1000)),
+        "dormitorios": rng.randint(1, 4),
+        "banios": rng.randint(1, 3),
+        "permite_mascotas": rng.random() < 0.5,
+        "balcon": rng.random() < 0.5,
+        "terraza": rng.random() < 0.3,
+        "amoblado": rng.random() < 0.2,
+    }
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del matcher de búsquedas guardadas")
+    parser.add_argument("--searches", type=int, default=100000)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    searches = {search_id: random_filters(rng) for search_id in range(1, args.searches + 1)}
+    rows = [random_row(rng, index) for index in range(args.rows)]
+
+    start = time.perf_counter()
+    index = SavedSearchIndex()
+    index.rebuild(searches.items())
+    build_ms = (time.perf_counter() - start) * 1000
+
+    indexed_ms, linear_ms, matched = [], [], []
+    for row in rows:
+        start = time.perf_counter()
+        result = index.match(row)
+        indexed_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        expected = [search_id for search_id, filters in searches.items() if matches_filters(row, filters)]
+        linear_ms.append((time.perf_counter() - start) * 1000)
+
+        assert sorted(result) == expected, f"Resultados distintos para {row['id']}"
+        matched.append(len(result))
+
+    print(f"\n{args.searches} búsquedas guardadas, {args.rows} propiedades nuevas")
+    print(f"Construcción del índice: {build_ms:.0f} ms")
+    print(f"Coincidencias por propiedad: promedio {statistics.mean(matched):.1f}, máximo {max(matched)}")
+    print(f"\n{'matcher':<10}{'p50 ms':>10}{'p95 ms':>10}{'máx ms':>10}")
+    print("-" * 40)
+    for name, samples in (("lineal", linear_ms), ("índice", indexed_ms)):
+        print(f"{name:<10}{percentile(samples, 0.5):>10.3f}{percentile(samples, 0.95):>10.3f}{max(samples):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Benchmark de serialización de responses (CPU por request).
+
+Compara, para /chat y /properties, el camino anterior (modelos pydantic
+armados campo por campo + re-validación contra response_model + json de
+Starlette) con la capa de models/serialization.py (dicts precalculados +
+orjson, sin re-validación). Cada variante corre como ruta de FastAPI real y
+se mide con time.process_time() sobre requests ASGI en proceso.
+
+Uso:
+    python -m benchmarks.serialization_bench --requests 2000 --rows 5 50
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, Any
+
+import httpx
+from fastapi import FastAPI
+
+from models.state import AgentState, PropertyFilters
+from models.schemas import ChatResponse, PropertiesListResponse, PropertyResponse, PropertyFiltersResponse
+from models.serialization import FastJSONResponse, chat_payload, properties_list_payload
+
+
+def make_state(rows: int) -> AgentState:
+    state = AgentState(session_id="bench-session")
+    state.filters = PropertyFilters(
+        distrito="Miraflores", area_min=80, estado_propiedad="PLANOS",
+        monto_maximo=500000, dormitorios=2, permite_mascotas=True
+    )
+    state.ready_to_search = True
+    state.query_executed = True
+    state.generated_sql = "SELECT p.*, e.nombre AS edificio_nombre FROM propiedad p JOIN edificio e ON ... LIMIT 5"
+    state.query_results = [
+        {
+            "id": f"123e4567-e89b-12d3-a456-{index:012d}",
+            "numero": str(100 + index),
+            "piso": index % 20,
+            "tipo": "DEPARTAMENTO",
+            "area": 85.5 + index,
+            "dormitorios": 2,
+            "banios": 2,
+            "balcon": True,
+            "terraza": False,
+            "amoblado": False,
+            "permite_mascotas": True,
+            "valor_comercial": 450000.0 + index * 1000,
+            "mantenimiento_mensual": 350.0,
+            "estado": "PLANOS",
+            "edificio_nombre": "Torre Miraflores",
+            "edificio_direccion": "Av. Larco 123",
+            "edificio_distrito": "Miraflores",
+        }
+        for index in range(rows)
+    ]
+    state.add_message("user", "búscalo")
+    state.add_message("assistant", f"¡Encontré {rows} propiedades que cumplen tus criterios!")
+    return state
+
+
+# === Camino anterior (tal como estaba en main.py) ===
+
+def legacy_filters(state: AgentState) -> PropertyFiltersResponse:
+    return PropertyFiltersResponse(
+        distrito=state.filters.distrito,
+        area_min=state.filters.area_min,
+        estado_propiedad=state.filters.estado_propiedad,
+        monto_maximo=state.filters.monto_maximo,
+        dormitorios=state.filters.dormitorios,
+        permite_mascotas=state.filters.permite_mascotas,
+        balcon=state.filters.balcon,
+        terraza=state.filters.terraza,
+        amoblado=state.filters.amoblado,
+        banios=state.filters.banios,
+        essential_count=state.filters.count_essential_filters(),
+        optional_count=state.filters.count_optional_filters(),
+        is_complete=state.filters.is_complete()
+    )
+
+
+def legacy_chat(state: AgentState) -> ChatResponse:
+    assistant_response = next(
+        (msg["content"] for msg in reversed(state.messages) if msg.get("role") == "assistant"), None
+    )
+    return ChatResponse(
+        session_id=state.session_id,
+        response=assistant_response,
+        filters=legacy_filters(state),
+        ready_to_search=state.ready_to_search,
+        properties_found=len(state.query_results) if state.query_results is not None else None
+    )
+
+
+def legacy_properties(state: AgentState) -> PropertiesListResponse:
+    properties = []
+    for prop in state.query_results:
+        properties.append(PropertyResponse(
+            id=str(prop.get("id")),
+            numero=prop.get("numero"),
+            piso=prop.get("piso"),
+            tipo=prop.get("tipo"),
+            area=prop.get("area"),
+            dormitorios=prop.get("dormitorios"),
+            banios=prop.get("banios"),
+            balcon=prop.get("balcon", False),
+            terraza=prop.get("terraza", False),
+            amoblado=prop.get("amoblado", False),
+            permite_mascotas=prop.get("permite_mascotas", False),
+            valor_comercial=prop.get("valor_comercial"),
+            mantenimiento_mensual=prop.get("mantenimiento_mensual"),
+            estado=prop.get("estado"),
+            edificio_nombre=prop.get("edificio_nombre"),
+            edificio_direccion=prop.get("edificio_direccion"),
+            edificio_distrito=prop.get("edificio_distrito")
+        ))
+    return PropertiesListResponse(
+        session_id=state.session_id,
+        count=len(properties),
+        properties=properties,
+        filters_used=legacy_filters(state),
+        sql_query=state.generated_sql
+    )
+
+
+def build_app(state: AgentState) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/legacy/chat", response_model=ChatResponse)
+    async def legacy_chat_route():
+        return legacy_chat(state)
+
+    @app.get("/legacy/properties", response_model=PropertiesListResponse)
+    async def legacy_properties_route():
+        return legacy_properties(state)
+
+    @app.get("/fast/chat", response_model=ChatResponse)
+    async def fast_chat_route():
+        return FastJSONResponse(chat_payload(state.session_id, state))
+
+    @app.get("/fast/properties", response_model=PropertiesListResponse)
+    async def fast_properties_route():
+        return FastJSONResponse(properties_list_payload(state.session_id, state))
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int) -> float:
+    """CPU promedio por request en microsegundos."""
+    for _ in range(50):
+        await client.get(path)
+    start = time.process_time()
+    for _ in range(requests):
+        await client.get(path)
+    return (time.process_time() - start) / requests * 1e6
+
+
+async def run(requests: int, row_counts) -> Dict[str, Any]:
+    results = {}
+    for rows in row_counts:
+        state = make_state(rows)
+        app = build_app(state)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            # Mismo contenido en ambos caminos
+            for endpoint in ("chat", "properties"):
+                legacy = (await client.get(f"/legacy/{endpoint}")).json()
+                fast = (await client.get(f"/fast/{endpoint}")).json()
+                assert legacy == fast, f"Payloads distintos para {endpoint}"
+
+            for endpoint in ("chat", "properties"):
+                legacy_us = await measure(client, f"/legacy/{endpoint}", requests)
+                fast_us = await measure(client, f"/fast/{endpoint}", requests)
+                results[(endpoint, rows)] = (legacy_us, fast_us)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialización de responses")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rows", type=int, nargs="+", default=[5, 50])
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.requests, args.rows))
+
+    print(f"\n{'endpoint':<12}{'filas':>6}{'antes µs':>12}{'después µs':>13}{'ahorro':>9}")
+    print("-" * 52)
+    for (endpoint, rows), (legacy_us, fast_us) in sorted(results.items()):
+        saving = (1 - fast_us / legacy_us) * 100
+        print(f"{endpoint:<12}{rows:>6}{legacy_us:>12.1f}{fast_us:>13.1f}{saving:>8.0f}%")
+    print("\n(CPU por request incluyendo el stack ASGI/httpx, igual en ambos caminos)")
+
+
+if __name__ == "__main__":
+    main()
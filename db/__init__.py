@@ -1,3 +1,18 @@
 from db.connection import DatabaseManager, db
+from db.replicas import DatabaseNode
+from db.catalog import SchemaCatalog
+from db.search_view import SearchView
+from db.change_feed import ChangeFeed, ChangeEvent
+from db.admission import QueryClass, QueryRejectedError
 
-__all__ = ['db', 'DatabaseManager']
\ No newline at end of file
+__all__ = [
+    'db',
+    'DatabaseManager',
+    'DatabaseNode',
+    'SchemaCatalog',
+    'SearchView',
+    'ChangeFeed',
+    'ChangeEvent',
+    'QueryClass',
+    'QueryRejectedError',
+]
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Control de admisión por clase de query (timeout de statement + concurrencia)
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any
+
+
+class QueryRejectedError(Exception):
+    """La query se descartó porque su clase está saturada."""
+
+
+class QueryClass:
+    """
+    Límites para una clase de queries (p.ej. búsquedas generadas por el LLM).
+
+    - statement_timeout_ms: se aplica con SET LOCAL en la transacción de cada query
+    - max_concurrency: queries simultáneas permitidas para la clase
+    - queue_timeout: segundos que una query espera turno antes de descartarse
+      (0 = descartar de inmediato si no hay cupo)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        statement_timeout_ms: int,
+        max_concurrency: Optional[int] = None,
+        queue_timeout: float = 0.0
+    ):
+        self.name = name
+        self.statement_timeout_ms = statement_timeout_ms
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        # Métricas
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserva un cupo de la clase o lanza QueryRejectedError si no llega a tiempo."""
+        if self._semaphore is None:
+            self.admitted += 1
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+            return
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            if self.queue_timeout > 0:
+                # asyncio.timeout y no wait_for: en 3.11 wait_for puede perder un
+                # cupo ya otorgado si el timeout coincide con el acquire
+                async with asyncio.timeout(self.queue_timeout):
+                    await self._semaphore.acquire()
+            elif self._semaphore.locked():
+                raise asyncio.TimeoutError()
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            print(f"🚫 Query '{self.name}' descartada: {self.max_concurrency} en curso")
+            raise QueryRejectedError(f"Clase '{self.name}' saturada, intenta más tarde")
+        finally:
+            self.waiting -= 1
+
+        wait = time.perf_counter() - start
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "statement_timeout_ms": self.statement_timeout_ms,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else None,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
@@ -0,0 +1,313 @@
+"""
+Catálogo del schema de búsqueda (columnas, estados y distritos) cacheado en memoria
+"""
+import asyncio
+import time
+from typing import Optional, List, Dict, Any, Callable, TYPE_CHECKING
+from models.settings import settings
+
+if TYPE_CHECKING:
+    from db.connection import DatabaseManager
+
+
+SEARCH_TABLES = ["propiedad", "edificio"]
+
+# Huella barata del catálogo, solo DDL: OID + xmin de pg_class cambian con
+# ALTER/DROP/CREATE de las tablas, y los OIDs de pg_enum de sus columnas con
+# ALTER TYPE ... ADD VALUE. Los inserts/updates/deletes no la mueven.
+FINGERPRINT_QUERY = """
+SELECT md5(
+    (SELECT string_agg(c.oid::text || ':' || c.xmin::text, ',' ORDER BY c.relname)
+     FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+     WHERE n.nspname = $1 AND c.relname = ANY($2::text[]))
+    || '|' ||
+    COALESCE((SELECT string_agg(e.oid::text, ',' ORDER BY e.oid)
+     FROM pg_catalog.pg_attribute a
+     JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+     JOIN pg_catalog.pg_enum e ON e.enumtypid = a.atttypid
+     WHERE n.nspname = $1 AND c.relname = ANY($2::text[])
+       AND a.attnum > 0 AND NOT a.attisdropped), '')
+)
+"""
+
+COLUMNS_QUERY = """
+SELECT table_name, column_name, data_type, udt_name, is_nullable
+FROM information_schema.columns
+WHERE table_schema = $1 AND table_name = ANY($2::text[])
+ORDER BY table_name, ordinal_position
+"""
+
+ENUM_VALUES_QUERY = """
+SELECT e.enumlabel
+FROM pg_catalog.pg_enum e
+JOIN pg_catalog.pg_type t ON t.oid = e.enumtypid
+WHERE t.typname = $1
+ORDER BY e.enumsortorder
+"""
+
+# Alias y descripciones usados al describir el schema en el prompt de SQL
+TABLE_ALIASES = {"propiedad": "p", "edificio": "e"}
+
+COLUMN_NOTES = {
+    "id": "PRIMARY KEY",
+    "edificio_id": "FOREIGN KEY → edificio.id",
+    "numero": "número de departamento",
+    "tipo": "tipo de propiedad",
+    "area": "área en m²",
+    "valor_comercial": "precio de la propiedad",
+    "distrito": "ubicación del edificio",
+}
+
+
+class SchemaCatalog:
+    """
+    Cache del schema de propiedad/edificio.
+
+    Se carga una vez al iniciar y solo se recarga completo cuando cambia la
+    huella del catálogo (DDL). Los valores que salen de los datos se recargan
+    aparte cada SCHEMA_CATALOG_VALUES_INTERVAL: los distritos además con los
+    eventos de edificio del change feed (y entonces sin timer), los estados
+    sin enum solo por timer.
+    """
+
+    def __init__(self, database: "DatabaseManager"):
+        """
+        Args:
+            database: DatabaseManager desde el que se lee el catálogo
+        """
+        self.db = database
+        self.schema = settings.database_schema
+        self.check_interval = settings.schema_catalog_check_interval
+        self.values_interval = settings.schema_catalog_values_interval
+
+        self.fingerprint: Optional[str] = None
+        self.columns: Dict[str, List[Dict[str, Any]]] = {}
+        self.estados: List[str] = []
+        self.distritos: List[str] = []
+        self._values_loaded_at = 0.0
+
+        # Métricas
+        self.reloads = 0
+        self.value_refreshes = 0
+
+        self._listeners: List[Callable[["SchemaCatalog"], None]] = []
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.fingerprint is not None
+
+    def on_change(self, callback: Callable[["SchemaCatalog"], None]):
+        """Registra un callback que se ejecuta tras cada (re)carga del catálogo o cambio de distritos/estados."""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"❌ Error en listener del catálogo: {e}")
+
+    async def _fetch_fingerprint(self) -> str:
+        return await self.db.fetch_val(FINGERPRINT_QUERY, self.schema, SEARCH_TABLES)
+
+    def _estado_column(self) -> Optional[Dict[str, Any]]:
+        return next(
+            (col for col in self.columns.get("propiedad", []) if col["column_name"] == "estado"),
+            None
+        )
+
+    @property
+    def estados_from_data(self) -> bool:
+        """¿Los estados salen de los datos (columna sin enum) y no del catálogo?"""
+        column = self._estado_column()
+        return not (column and column["data_type"] == "USER-DEFINED")
+
+    async def _fetch_estados(self) -> List[str]:
+        if not self.estados_from_data:
+            rows = await self.db.fetch_all(ENUM_VALUES_QUERY, self._estado_column()["udt_name"])
+            return [row["enumlabel"] for row in rows]
+
+        rows = await self.db.fetch_all(
+            f"SELECT DISTINCT estado::text AS estado FROM {self.schema}.propiedad "
+            f"WHERE estado IS NOT NULL ORDER BY 1"
+        )
+        return [row["estado"] for row in rows]
+
+    async def _fetch_distritos(self) -> List[str]:
+        rows = await self.db.fetch_all(
+            f"SELECT DISTINCT distrito FROM {self.schema}.edificio "
+            f"WHERE distrito IS NOT NULL ORDER BY 1"
+        )
+        return [row["distrito"] for row in rows]
+
+    async def load(self):
+        """Carga columnas, estados y distritos desde la base de datos."""
+        fingerprint = await self._fetch_fingerprint()
+
+        rows = await self.db.fetch_all(COLUMNS_QUERY, self.schema, SEARCH_TABLES)
+        columns: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            columns.setdefault(row["table_name"], []).append(row)
+        self.columns = columns
+
+        self.estados = await self._fetch_estados()
+        self.distritos = await self._fetch_distritos()
+        self._values_loaded_at = time.monotonic()
+
+        self.fingerprint = fingerprint
+        self.reloads += 1
+
+        print(f"📚 Catálogo cargado: {sum(len(cols) for cols in columns.values())} columnas, "
+              f"{len(self.estados)} estados, {len(self.distritos)} distritos")
+
+        self._notify()
+
+    async def refresh_values(self, include_estados: bool = True) -> bool:
+        """
+        Recarga solo los valores que salen de los datos (distritos y, sin enum,
+        estados), sin tocar columnas. Avisa a los listeners solo si cambiaron.
+
+        Args:
+            include_estados: False para releer solo distritos (tabla edificio)
+
+        Returns:
+            True si cambió alguno
+        """
+        if not self.is_loaded:
+            await self.load()
+            return True
+
+        distritos = await self._fetch_distritos()
+        estados = self.estados
+        if include_estados and self.estados_from_data:
+            estados = await self._fetch_estados()
+        # El timer se reinicia solo si esta recarga cubrió todo lo que él relee
+        if include_estados or not self.estados_from_data:
+            self._values_loaded_at = time.monotonic()
+        self.value_refreshes += 1
+
+        if distritos == self.distritos and estados == self.estados:
+            return False
+
+        self.distritos = distritos
+        self.estados = estados
+        print(f"📚 Valores del catálogo actualizados: {len(estados)} estados, {len(distritos)} distritos")
+        self._notify()
+        return True
+
+    async def refresh_if_changed(self) -> bool:
+        """
+        Recarga el catálogo solo si cambió su huella.
+
+        Returns:
+            True si se recargó
+        """
+        if not self.is_loaded:
+            await self.load()
+            return True
+
+        fingerprint = await self._fetch_fingerprint()
+        if fingerprint == self.fingerprint:
+            return False
+
+        print("🔄 Cambio detectado en el catálogo, recargando...")
+        await self.load()
+        return True
+
+    def on_data_change(self, event) -> int:
+        """
+        Cambio de inventario (db.change_feed): si puede agregar o quitar
+        distritos, recarga los valores. Los cambios de propiedad no: releer
+        estados sin enum recorre la tabla grande (queda para el timer).
+        """
+        if not event.full:
+            if event.table != "edificio":
+                return 0
+            if event.op == "INSERT" and all(d in self.distritos for d in event.distritos):
+                return 0
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh_values(include_estados=False))
+        return 1
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                if not await self.refresh_if_changed():
+                    # Sin change feed nadie avisa de distritos nuevos, y los
+                    # estados sin enum solo se releen aquí
+                    stale = time.monotonic() - self._values_loaded_at >= self.values_interval
+                    if stale and (self.estados_from_data or not self.db.change_feed.is_live):
+                        await self.refresh_values()
+            except Exception as e:
+                print(f"❌ Error verificando catálogo: {e}")
+
+    def start(self):
+        """Inicia la verificación periódica de la huella en background."""
+        if self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        """Detiene la verificación periódica."""
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.is_loaded,
+            "reloads": self.reloads,
+            "value_refreshes": self.value_refreshes,
+            "estados": len(self.estados),
+            "distritos": len(self.distritos),
+        }
+
+    def column_names(self, table: str) -> List[str]:
+        """Nombres de columnas de una tabla de búsqueda."""
+        return [col["column_name"] for col in self.columns.get(table, [])]
+
+    def render_schema(self) -> str:
+        """Describe el schema como texto legible (para debug y get_schema_info)."""
+        lines = [f"Database Schema: {self.schema}", ""]
+
+        for table, columns in self.columns.items():
+            lines.append(f"Table: {table}")
+            lines.append("-" * 50)
+            for col in columns:
+                nullable = "NULL" if col["is_nullable"] == "YES" else "NOT NULL"
+                lines.append(f"  {col['column_name']}: {col['data_type']} ({nullable})")
+            lines.append("")
+
+        return "\n".join(lines)
+
+    def render_prompt_schema(self) -> str:
+        """Describe el schema en el formato que usa GENERATE_SQL_PROMPT."""
+        lines = [f"Schema: {self.schema}"]
+
+        for table in SEARCH_TABLES:
+            columns = self.columns.get(table, [])
+            if not columns:
+                continue
+
+            lines.append("")
+            lines.append(f"Tabla: {table} (alias: {TABLE_ALIASES[table]})")
+            for col in columns:
+                name = col["column_name"]
+                data_type = col["udt_name"] if col["data_type"] == "USER-DEFINED" else col["data_type"]
+                line = f"- {name} ({data_type})"
+
+                if name == "estado" and self.estados:
+                    line += f" - {', '.join(self.estados)}"
+                elif name in COLUMN_NOTES:
+                    line += f" - {COLUMN_NOTES[name]}"
+                lines.append(line)
+
+        return "\n".join(lines)
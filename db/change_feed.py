@@ -0,0 +1,343 @@
+"""
+Change feed de inventario vía LISTEN/NOTIFY
+
+Los triggers de db/migrations/002_change_feed.sql publican en el canal
+`property_changes` cada statement que modifica propiedad/edificio (ids y
+distritos afectados) y lo registran en property_change_log. ChangeFeed escucha
+en una conexión asyncpg dedicada (fuera del pool) y reparte invalidaciones
+dirigidas a los caches registrados con `subscribe`.
+
+Si la conexión se cae se reconecta con backoff y se pone al día leyendo el
+registro desde el último cambio visto (con solapamiento: invalidar dos veces
+es inocuo). Si estuvo desconectado más que la retención del registro, o hay
+demasiados cambios pendientes, se emite una invalidación total.
+
+Uso:
+    python -m db.change_feed install   # crea registro, función y triggers
+    python -m db.change_feed status
+"""
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable, TYPE_CHECKING
+import asyncpg
+from models.settings import settings
+
+if TYPE_CHECKING:
+    from db.connection import DatabaseManager
+
+
+CHANNEL = "property_changes"
+MIGRATION_FILE = Path(__file__).parent / "migrations" / "002_change_feed.sql"
+
+# Cambios que se vuelven a leer antes del último visto al ponerse al día
+# (transacciones que confirmaron fuera de orden de secuencia)
+CATCHUP_OVERLAP = 1000
+# Más cambios pendientes que esto: invalidación total en vez de uno por uno
+CATCHUP_LIMIT = 10000
+
+CATCHUP_QUERY = """
+SELECT id, table_name, op, ids, distritos, EXTRACT(EPOCH FROM changed_at)::float8 AS ts
+FROM {schema}.property_change_log
+WHERE id > $1
+ORDER BY id
+LIMIT $2
+"""
+
+PRUNE_QUERY = """
+DELETE FROM {schema}.property_change_log
+WHERE changed_at < now() - make_interval(secs => $1)
+"""
+
+
+class ChangeEvent:
+    """
+    Un cambio en propiedad/edificio.
+
+    `ids` son ids de la tabla modificada (None = desconocidos) y `distritos` los
+    distritos afectados (antes y después del cambio). Un evento `full` pide
+    invalidar todo.
+    """
+
+    def __init__(
+        self,
+        table: Optional[str],
+        op: str,
+        ids: Optional[List[str]] = None,
+        distritos: Optional[List[str]] = None,
+        seq: Optional[int] = None,
+        ts: Optional[float] = None
+    ):
+        self.table = table
+        self.op = op
+        self.ids = ids
+        self.distritos = distritos or []
+        self.seq = seq
+        self.ts = ts
+
+    @classmethod
+    def full_invalidation(cls, reason: str) -> "ChangeEvent":
+        return cls(None, reason)
+
+    @classmethod
+    def from_payload(cls, data: Dict[str, Any]) -> "ChangeEvent":
+        return cls(
+            table=data.get("table") or data.get("table_name"),
+            op=data.get("op", ""),
+            ids=data.get("ids"),
+            distritos=data.get("distritos"),
+            seq=data.get("seq") or data.get("id"),
+            ts=data.get("ts"),
+        )
+
+    @property
+    def full(self) -> bool:
+        """Sin ids ni distritos no se puede acotar la invalidación."""
+        return self.ids is None and not self.distritos
+
+    @property
+    def property_ids(self) -> List[str]:
+        return (self.ids or []) if self.table == "propiedad" else []
+
+    @property
+    def edificio_ids(self) -> List[str]:
+        return (self.ids or []) if self.table == "edificio" else []
+
+    def __repr__(self) -> str:
+        if self.full:
+            return f"ChangeEvent(full, {self.op})"
+        return f"ChangeEvent({self.table} {self.op} #{self.seq}, ids={self.ids}, distritos={self.distritos})"
+
+
+class ChangeFeed:
+    """Suscripción LISTEN en conexión dedicada con reconexión y puesta al día."""
+
+    def __init__(self, database: "DatabaseManager"):
+        """
+        Args:
+            database: DatabaseManager (el feed escucha en su primario)
+        """
+        self.db = database
+        self.schema = settings.database_schema
+        self.enabled = settings.change_feed_enabled
+        self.keepalive_interval = settings.change_feed_keepalive_interval
+        self.retention = settings.change_feed_retention
+        self.max_reconnect_delay = settings.change_feed_max_reconnect_delay
+
+        self._subscribers: Dict[str, Callable[[ChangeEvent], Optional[int]]] = {}
+        self._conn: Optional[asyncpg.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lost: Optional[asyncio.Event] = None
+        self.last_seq: Optional[int] = None
+        self.disconnected_at: Optional[float] = None
+        self._last_prune = 0.0
+
+        # Métricas
+        self.notifications = 0
+        self.caught_up = 0
+        self.full_invalidations = 0
+        self.reconnects = 0
+        self.errors = 0
+        self.last_lag_ms: Optional[float] = None
+        self.invalidated: Dict[str, int] = {}
+
+    @property
+    def is_live(self) -> bool:
+        """¿Los caches reciben invalidaciones ahora mismo?"""
+        return self._conn is not None and not self._conn.is_closed()
+
+    def subscribe(self, name: str, callback: Callable[[ChangeEvent], Optional[int]]):
+        """
+        Registra un cache. `callback(event)` se ejecuta en el event loop por cada
+        cambio (debe ser rápido) y puede retornar cuántas entradas invalidó.
+        """
+        self._subscribers[name] = callback
+        self.invalidated.setdefault(name, 0)
+
+    def publish(self, event: ChangeEvent):
+        """Reparte un cambio a todos los caches suscritos."""
+        if event.seq is not None:
+            self.last_seq = max(self.last_seq or 0, event.seq)
+        if event.full:
+            self.full_invalidations += 1
+            print(f"🧹 Invalidación total de caches ({event.op})")
+
+        for name, callback in self._subscribers.items():
+            try:
+                self.invalidated[name] += callback(event) or 0
+            except Exception as e:
+                print(f"❌ Error invalidando cache '{name}': {e}")
+
+    def _on_notification(self, _conn, _pid, _channel, payload: str):
+        self.notifications += 1
+        try:
+            event = ChangeEvent.from_payload(json.loads(payload))
+        except (ValueError, TypeError) as e:
+            print(f"⚠️ Notificación inválida en {CHANNEL}: {e}")
+            event = ChangeEvent.full_invalidation("payload inválido")
+        if event.ts is not None:
+            self.last_lag_ms = max(0.0, (time.time() - event.ts) * 1000)
+        self.publish(event)
+
+    def _on_termination(self, _conn):
+        if self._lost is not None:
+            self._lost.set()
+
+    async def _reset(self, conn: asyncpg.Connection, reason: str):
+        """Invalidación total y continuar desde el último cambio registrado."""
+        self.publish(ChangeEvent.full_invalidation(reason))
+        self.last_seq = await conn.fetchval(
+            f"SELECT COALESCE(MAX(id), 0) FROM {self.schema}.property_change_log"
+        )
+
+    async def _catch_up(self, conn: asyncpg.Connection):
+        """Aplica los cambios del registro perdidos mientras no se escuchaba."""
+        if self.last_seq is None:
+            # Primer arranque: los caches aún están vacíos
+            self.last_seq = await conn.fetchval(
+                f"SELECT COALESCE(MAX(id), 0) FROM {self.schema}.property_change_log"
+            )
+            return
+
+        if self.disconnected_at is not None and time.monotonic() - self.disconnected_at > self.retention:
+            await self._reset(conn, "desconexión más larga que la retención")
+            return
+
+        rows = await conn.fetch(
+            CATCHUP_QUERY.format(schema=self.schema),
+            max(0, self.last_seq - CATCHUP_OVERLAP),
+            CATCHUP_LIMIT + 1
+        )
+        if len(rows) > CATCHUP_LIMIT:
+            await self._reset(conn, "demasiados cambios pendientes")
+            return
+
+        for row in rows:
+            self.publish(ChangeEvent.from_payload(dict(row)))
+        self.caught_up += len(rows)
+        if rows:
+            print(f"📥 Change feed al día: {len(rows)} cambios releídos del registro")
+
+    async def _connect(self) -> asyncpg.Connection:
+        conn = await asyncpg.connect(dsn=self.db.primary.dsn)
+        try:
+            self._lost = asyncio.Event()
+            conn.add_termination_listener(self._on_termination)
+            # LISTEN antes de leer el registro: nada queda entre ambos
+            await conn.add_listener(CHANNEL, self._on_notification)
+            await self._catch_up(conn)
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    async def _prune(self):
+        """Purga el registro más viejo que la retención (a lo sumo cada hora)."""
+        now = time.monotonic()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        await self.db.execute_query(PRUNE_QUERY.format(schema=self.schema), float(self.retention))
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                self._conn = await self._connect()
+                if self.disconnected_at is not None:
+                    self.reconnects += 1
+                    print(f"🔌 Change feed reconectado")
+                else:
+                    print(f"👂 Escuchando cambios de inventario en '{CHANNEL}'")
+                self.disconnected_at = None
+                delay = 1.0
+
+                # Keepalive: una conexión medio abierta no dispara la terminación
+                while not self._conn.is_closed():
+                    try:
+                        await asyncio.wait_for(self._lost.wait(), timeout=self.keepalive_interval)
+                        break
+                    except asyncio.TimeoutError:
+                        await self._conn.fetchval("SELECT 1", timeout=self.keepalive_interval)
+                        await self._prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Change feed desconectado: {e}")
+
+            if self.disconnected_at is None:
+                self.disconnected_at = time.monotonic()
+            await self._close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            try:
+                await conn.close(timeout=2)
+            except Exception:
+                conn.terminate()
+
+    async def install(self):
+        """Aplica el DDL de registro y triggers (idempotente)."""
+        ddl = MIGRATION_FILE.read_text(encoding="utf-8").format(schema=self.schema)
+        async with self.db.get_connection() as conn:
+            await conn.execute(ddl)
+        print(f"✅ Change feed instalado en {self.schema} (canal '{CHANNEL}')")
+
+    def start(self):
+        """Inicia la escucha en background (si está habilitada)."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Detiene la escucha y cierra la conexión dedicada."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "live": self.is_live,
+            "last_seq": self.last_seq,
+            "notifications": self.notifications,
+            "caught_up": self.caught_up,
+            "full_invalidations": self.full_invalidations,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+            "last_lag_ms": round(self.last_lag_ms, 2) if self.last_lag_ms is not None else None,
+            "invalidated": dict(self.invalidated),
+        }
+
+
+async def _main(command: str):
+    from db.connection import db
+
+    await db.connect()
+    try:
+        if command == "install":
+            await db.change_feed.install()
+        count = await db.fetch_val(
+            f"SELECT count(*) FROM {db.schema}.property_change_log"
+        )
+        print(f"📊 Cambios en el registro: {count}")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command not in ("install", "status"):
+        print("Uso: python -m db.change_feed [install|status]")
+        sys.exit(1)
+    asyncio.run(_main(command))
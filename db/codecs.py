@@ -0,0 +1,103 @@
+"""
+Codecs de tipos a nivel de conexión (registrados en cada conexión de los pools)
+
+Las filas salen del driver ya en su forma final para la API / JSON, sin
+recorrer cada valor después:
+- numeric → float (no Decimal)
+- uuid → str
+- timestamp / timestamptz / date → string ISO 8601 (mismo formato que isoformat())
+
+Los parámetros siguen aceptando los tipos de Python habituales (Decimal,
+float, UUID, datetime, date) además de strings.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Tuple
+import asyncpg
+
+
+PG_EPOCH = datetime(2000, 1, 1)
+PG_EPOCH_UTC = PG_EPOCH.replace(tzinfo=timezone.utc)
+PG_EPOCH_ORDINAL = date(2000, 1, 1).toordinal()
+
+# Infinitos en el formato binario de PostgreSQL
+TIMESTAMP_INFINITY = 2 ** 63 - 1
+TIMESTAMP_NEGATIVE_INFINITY = -2 ** 63
+DATE_INFINITY = 2 ** 31 - 1
+DATE_NEGATIVE_INFINITY = -2 ** 31
+
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _infinity(value: int, positive: int, negative: int):
+    if value == positive:
+        return "infinity"
+    if value == negative:
+        return "-infinity"
+    return None
+
+
+def decode_timestamp(value: Tuple[int]) -> str:
+    (microseconds,) = value
+    return (
+        _infinity(microseconds, TIMESTAMP_INFINITY, TIMESTAMP_NEGATIVE_INFINITY)
+        or (PG_EPOCH + timedelta(microseconds=microseconds)).isoformat()
+    )
+
+
+def decode_timestamptz(value: Tuple[int]) -> str:
+    (microseconds,) = value
+    return (
+        _infinity(microseconds, TIMESTAMP_INFINITY, TIMESTAMP_NEGATIVE_INFINITY)
+        or (PG_EPOCH_UTC + timedelta(microseconds=microseconds)).isoformat()
+    )
+
+
+def decode_date(value: Tuple[int]) -> str:
+    (days,) = value
+    return (
+        _infinity(days, DATE_INFINITY, DATE_NEGATIVE_INFINITY)
+        or date.fromordinal(PG_EPOCH_ORDINAL + days).isoformat()
+    )
+
+
+def _as_datetime(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value
+
+
+def encode_timestamp(value) -> Tuple[int]:
+    value = _as_datetime(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return ((value - PG_EPOCH) // MICROSECOND,)
+
+
+def encode_timestamptz(value) -> Tuple[int]:
+    value = _as_datetime(value)
+    if value.tzinfo is None:
+        # Igual que asyncpg: sin zona horaria se interpreta como hora local
+        value = value.astimezone()
+    return ((value - PG_EPOCH_UTC) // MICROSECOND,)
+
+
+def encode_date(value) -> Tuple[int]:
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return (value.toordinal() - PG_EPOCH_ORDINAL,)
+
+
+async def register_codecs(conn: asyncpg.Connection):
+    """Registra los codecs en una conexión (`init` de asyncpg.create_pool)."""
+    # float y str son builtins: el driver los llama sin frames de Python
+    await conn.set_type_codec("numeric", schema="pg_catalog", encoder=str, decoder=float, format="text")
+    await conn.set_type_codec("uuid", schema="pg_catalog", encoder=str, decoder=str, format="text")
+    await conn.set_type_codec(
+        "timestamp", schema="pg_catalog", encoder=encode_timestamp, decoder=decode_timestamp, format="tuple"
+    )
+    await conn.set_type_codec(
+        "timestamptz", schema="pg_catalog", encoder=encode_timestamptz, decoder=decode_timestamptz, format="tuple"
+    )
+    await conn.set_type_codec("date", schema="pg_catalog", encoder=encode_date, decoder=decode_date, format="tuple")
@@ -1,107 +1,381 @@
 """
 Gestor de conexiones a PostgreSQL usando asyncpg
 """
+import time
+import asyncio
 import asyncpg
 from typing import Optional, List, Dict, Any
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, nullcontext
 from models.settings import settings
+from db.replicas import DatabaseNode, ReplicaRouter, NodeUnavailableError, CONNECTION_ERRORS
+from db.catalog import SchemaCatalog
+from db.search_view import SearchView
+from db.change_feed import ChangeFeed
+from db.admission import QueryClass
+from db.codecs import register_codecs
+from models.budget import current_budget, RequestDeadlineExceeded
+
+
+def nodes_from_settings() -> List[DatabaseNode]:
+    """Construye la lista de nodos (primario + réplicas) desde la configuración."""
+    nodes = [DatabaseNode(settings.database_url, DatabaseNode.PRIMARY, name="primary")]
+    
+    replica_urls = [url.strip() for url in settings.database_replica_urls.split(",") if url.strip()]
+    for index, url in enumerate(replica_urls, start=1):
+        nodes.append(DatabaseNode(url, DatabaseNode.REPLICA, name=f"replica-{index}"))
+    
+    return nodes
 
 
 class DatabaseManager:
-    """Gestor de conexiones a PostgreSQL."""
+    """
+    Gestor de conexiones a PostgreSQL.
+    
+    Acepta un primario y cero o más réplicas de solo lectura. Las lecturas
+    marcadas con read_only=True se reparten entre réplicas; todo lo demás
+    (y cualquier lectura cuando no hay réplica sana) va al primario.
+    """
     
-    def __init__(self):
-        self.pool: Optional[asyncpg.Pool] = None
+    def __init__(self, nodes: Optional[List[DatabaseNode]] = None):
+        """
+        Args:
+            nodes: Nodos con sus roles (default: DATABASE_URL + DATABASE_REPLICA_URLS)
+        """
+        nodes = nodes if nodes is not None else nodes_from_settings()
+        
+        primaries = [node for node in nodes if node.role == DatabaseNode.PRIMARY]
+        if len(primaries) != 1:
+            raise ValueError("DatabaseManager requiere exactamente un nodo primary")
+        
+        self.primary = primaries[0]
+        self.replicas = [node for node in nodes if node.is_replica]
+        self.router = ReplicaRouter(
+            self.replicas,
+            max_lag_seconds=settings.db_replica_max_lag_seconds,
+            check_interval=settings.db_replica_check_interval,
+            connect=self._create_pool
+        )
         self.schema = settings.database_schema
+        self.catalog = SchemaCatalog(self)
+        self.search_view = SearchView(self)
+        
+        # Cambios de inventario (LISTEN/NOTIFY) para invalidar caches
+        self.change_feed = ChangeFeed(self)
+        self.change_feed.subscribe("catalog", self.catalog.on_data_change)
+        self.change_feed.subscribe("search_view", self.search_view.on_data_change)
+        
+        # Límites por clase de query (el resto usa solo db_command_timeout)
+        self.query_classes: Dict[str, QueryClass] = {
+            "search": QueryClass(
+                "search",
+                statement_timeout_ms=settings.db_search_statement_timeout_ms,
+                max_concurrency=settings.db_search_max_concurrency,
+                queue_timeout=settings.db_search_queue_timeout
+            ),
+            # Exportaciones: cada una retiene una conexión mientras dura el stream
+            "export": QueryClass(
+                "export",
+                statement_timeout_ms=settings.db_export_statement_timeout_ms,
+                max_concurrency=settings.db_export_max_concurrency
+            ),
+            # Ingesta de inventario: una a la vez, statement_timeout por lote
+            "ingest": QueryClass(
+                "ingest",
+                statement_timeout_ms=settings.db_ingest_statement_timeout_ms,
+                max_concurrency=1
+            ),
+            "explain": QueryClass(
+                "explain",
+                statement_timeout_ms=settings.db_explain_statement_timeout_ms
+            ),
+        }
+    
+    @property
+    def pool(self) -> Optional[asyncpg.Pool]:
+        """Pool del primario (compatibilidad con el código existente)."""
+        return self.primary.pool
+    
+    async def _create_pool(self, node: DatabaseNode):
+        # Codecs por conexión: numeric/uuid/timestamps salen ya serializables
+        node.pool = await asyncpg.create_pool(
+            dsn=node.dsn,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            command_timeout=settings.db_command_timeout,
+            init=register_codecs
+        )
     
     async def connect(self):
-        """Crea el pool de conexiones a la base de datos."""
-        if self.pool is None:
+        """Crea los pools de conexiones (primario y réplicas)."""
+        if self.primary.pool is None:
             try:
-                self.pool = await asyncpg.create_pool(
-                    dsn=settings.database_url,
-                    min_size=settings.db_pool_min_size,
-                    max_size=settings.db_pool_max_size,
-                    command_timeout=settings.db_command_timeout
-                )
+                await self._create_pool(self.primary)
                 print(f"✅ Pool de conexiones creado exitosamente")
                 print(f"📊 Schema: {self.schema}")
             except Exception as e:
                 print(f"❌ Error al conectar con la base de datos: {e}")
                 raise
+        
+        # Una réplica caída no impide arrancar: las lecturas van al primario
+        # y el monitor reintenta conectarla
+        for node in self.replicas:
+            if node.pool is None:
+                try:
+                    await self._create_pool(node)
+                except Exception as e:
+                    self.router.schedule_reconnect(node, e)
+                    continue
+                await self.router.check_lag(node)
+                print(f"✅ Réplica conectada: {node.name}")
+        
+        self.router.start()
     
     async def disconnect(self):
-        """Cierra el pool de conexiones."""
-        if self.pool:
-            await self.pool.close()
-            self.pool = None
+        """Cierra los pools de conexiones."""
+        await self.router.stop()
+        
+        for node in self.replicas:
+            if node.pool:
+                await node.pool.close()
+                node.pool = None
+        
+        if self.primary.pool:
+            await self.primary.pool.close()
+            self.primary.pool = None
             print("🔌 Pool de conexiones cerrado")
     
     @asynccontextmanager
-    async def get_connection(self):
-        """Context manager para obtener una conexión del pool."""
-        if self.pool is None:
+    async def get_connection(self, read_only: bool = False):
+        """
+        Context manager para obtener una conexión del pool.
+        
+        Args:
+            read_only: Si True, toma la conexión de una réplica (si hay alguna sana)
+        """
+        if self.primary.pool is None:
             await self.connect()
         
-        async with self.pool.acquire() as connection:
+        node = (self.router.choose() if read_only else None) or self.primary
+        
+        async with node.pool.acquire() as connection:
             yield connection
     
+    async def _run_on(
+        self,
+        node: DatabaseNode,
+        method: str,
+        query: str,
+        *args,
+        statement_timeout_ms: Optional[int] = None
+    ) -> Any:
+        """Ejecuta un método de asyncpg sobre un nodo registrando sus métricas."""
+        node.outstanding += 1
+        start = time.perf_counter()
+        ok = False
+        try:
+            try:
+                conn = await node.pool.acquire()
+            except asyncio.TimeoutError as e:
+                # Timeout al conectar (no de la query): el nodo no responde
+                raise NodeUnavailableError(f"Sin conexión a {node.name}: timeout al conectar") from e
+            try:
+                if statement_timeout_ms:
+                    # SET LOCAL solo vive dentro de la transacción: no contamina el pool
+                    async with conn.transaction(readonly=node.is_replica):
+                        await conn.execute(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}")
+                        result = await getattr(conn, method)(query, *args)
+                else:
+                    result = await getattr(conn, method)(query, *args)
+            finally:
+                await node.pool.release(conn)
+            ok = True
+            return result
+        finally:
+            node.outstanding -= 1
+            node.record(time.perf_counter() - start, ok)
+    
+    async def _run_routed(self, method: str, query: str, *args, read_only: bool = False, **kwargs) -> Any:
+        """
+        Ejecuta en una réplica si read_only=True, con failover al primario
+        cuando la réplica no responde. Los errores de la query se propagan.
+        """
+        if self.primary.pool is None:
+            await self.connect()
+        
+        if read_only:
+            replica = self.router.choose()
+            if replica is not None:
+                try:
+                    return await self._run_on(replica, method, query, *args, **kwargs)
+                except asyncio.TimeoutError:
+                    # command_timeout de la query (TimeoutError es un OSError): no es failover
+                    raise
+                except CONNECTION_ERRORS as e:
+                    replica.mark_unhealthy(e)
+                    self.router.fallbacks_to_primary += 1
+                    print(f"↩️ Failover de {replica.name} al primario")
+        
+        return await self._run_on(self.primary, method, query, *args, **kwargs)
+    
+    async def _run(
+        self,
+        method: str,
+        query: str,
+        *args,
+        read_only: bool = False,
+        query_class: Optional[str] = None
+    ) -> Any:
+        """
+        Ejecuta una query aplicando (si se indica) los límites de su clase:
+        admisión por concurrencia y statement_timeout por transacción.
+        Dentro de un request de /chat nunca espera más que su tiempo restante.
+        """
+        budget = current_budget.get()
+        if budget is None:
+            return await self._run_limited(method, query, *args, read_only=read_only, query_class=query_class)
+        
+        remaining = budget.remaining()
+        if remaining <= 0:
+            raise RequestDeadlineExceeded("Sin tiempo restante para consultar la base de datos")
+        budget.db_queries += 1
+        deadline = asyncio.timeout(remaining)
+        try:
+            async with deadline:
+                return await self._run_limited(
+                    method, query, *args,
+                    read_only=read_only,
+                    query_class=query_class,
+                    max_statement_timeout_ms=int(remaining * 1000)
+                )
+        except TimeoutError as e:
+            # Solo el vencimiento del request; command_timeout de asyncpg u
+            # otros timeouts internos se propagan tal cual
+            if deadline.expired():
+                raise RequestDeadlineExceeded("La query superó el tiempo restante del request") from e
+            raise
+    
+    async def _run_limited(
+        self,
+        method: str,
+        query: str,
+        *args,
+        read_only: bool = False,
+        query_class: Optional[str] = None,
+        max_statement_timeout_ms: Optional[int] = None
+    ) -> Any:
+        if query_class is None:
+            return await self._run_routed(method, query, *args, read_only=read_only)
+        
+        limits = self.query_classes[query_class]
+        statement_timeout_ms = limits.statement_timeout_ms
+        if statement_timeout_ms and max_statement_timeout_ms is not None:
+            statement_timeout_ms = max(1, min(statement_timeout_ms, max_statement_timeout_ms))
+        
+        async with limits.admit():
+            try:
+                return await self._run_routed(
+                    method, query, *args,
+                    read_only=read_only,
+                    statement_timeout_ms=statement_timeout_ms
+                )
+            except asyncpg.QueryCanceledError:
+                limits.timeouts += 1
+                print(f"⏱️ Query '{query_class}' cancelada por statement_timeout ({statement_timeout_ms} ms)")
+                raise
+    
     async def execute_query(self, query: str, *args) -> str:
         """Ejecuta una query que no retorna resultados (INSERT, UPDATE, DELETE)."""
-        async with self.get_connection() as conn:
-            result = await conn.execute(query, *args)
-            return result
+        return await self._run("execute", query, *args)
     
-    async def fetch_all(self, query: str, *args) -> List[Dict[str, Any]]:
-        """Ejecuta una query y retorna todos los resultados como lista de dicts."""
-        async with self.get_connection() as conn:
-            rows = await conn.fetch(query, *args)
-            # Convertir asyncpg.Record a dict
-            return [dict(row) for row in rows]
+    async def fetch_all(
+        self,
+        query: str,
+        *args,
+        read_only: bool = False,
+        query_class: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ejecuta una query y retorna todos los resultados como lista de dicts.
+        
+        Args:
+            query: Query SQL
+            *args: Parámetros posicionales ($1, $2, ...)
+            read_only: Si True, puede ejecutarse en una réplica
+            query_class: Clase de query ("search", "explain") cuyos límites aplicar
+        
+        Raises:
+            QueryRejectedError si la clase está saturada
+        """
+        rows = await self._run("fetch", query, *args, read_only=read_only, query_class=query_class)
+        # Convertir asyncpg.Record a dict
+        return [dict(row) for row in rows]
     
-    async def fetch_one(self, query: str, *args) -> Optional[Dict[str, Any]]:
+    async def fetch_one(
+        self,
+        query: str,
+        *args,
+        read_only: bool = False,
+        query_class: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """Ejecuta una query y retorna un solo resultado como dict."""
-        async with self.get_connection() as conn:
-            row = await conn.fetchrow(query, *args)
-            return dict(row) if row else None
+        row = await self._run("fetchrow", query, *args, read_only=read_only, query_class=query_class)
+        return dict(row) if row else None
     
-    async def fetch_val(self, query: str, *args) -> Any:
+    async def fetch_val(
+        self,
+        query: str,
+        *args,
+        read_only: bool = False,
+        query_class: Optional[str] = None
+    ) -> Any:
         """Ejecuta una query y retorna un solo valor."""
-        async with self.get_connection() as conn:
-            value = await conn.fetchval(query, *args)
-            return value
-    
+        return await self._run("fetchval", query, *args, read_only=read_only, query_class=query_class)
+
+    @asynccontextmanager
+    async def streaming_connection(self, read_only: bool = False, query_class: Optional[str] = None):
+        """
+        Conexión reservada durante todo un stream (COPY TO STDOUT o cursor de
+        servidor), dentro de una transacción con el statement_timeout de la clase.
+
+        A diferencia de _run no hay failover a mitad de camino (las filas ya
+        enviadas no se pueden repetir) y la duración del stream no entra en
+        las latencias del nodo que usa el router.
+
+        Raises:
+            QueryRejectedError si la clase está saturada
+        """
+        if self.primary.pool is None:
+            await self.connect()
+
+        limits = self.query_classes[query_class] if query_class else None
+        async with (limits.admit() if limits else nullcontext()):
+            node = (self.router.choose() if read_only else None) or self.primary
+            node.outstanding += 1
+            try:
+                async with node.pool.acquire() as conn:
+                    async with conn.transaction(readonly=node.is_replica):
+                        if limits and limits.statement_timeout_ms:
+                            await conn.execute(f"SET LOCAL statement_timeout = {int(limits.statement_timeout_ms)}")
+                        try:
+                            yield conn
+                        except asyncpg.QueryCanceledError:
+                            if limits:
+                                limits.timeouts += 1
+                            print(f"⏱️ Stream '{query_class}' cancelado por statement_timeout")
+                            raise
+            finally:
+                node.outstanding -= 1
+
     async def get_schema_info(self) -> str:
-        """Obtiene información del schema de property_infrastructure."""
-        query = f"""
-        SELECT 
-            table_name,
-            column_name,
-            data_type,
-            is_nullable
-        FROM information_schema.columns
-        WHERE table_schema = '{self.schema}'
-        AND table_name IN ('propiedad', 'edificio')
-        ORDER BY table_name, ordinal_position;
         """
-        
+        Obtiene información del schema de property_infrastructure.
+        Usa el catálogo en memoria; solo consulta la base si aún no está cargado.
+        """
         try:
-            rows = await self.fetch_all(query)
-            
-            # Formatear como texto legible
-            schema_info = f"Database Schema: {self.schema}\n\n"
+            if not self.catalog.is_loaded:
+                await self.catalog.load()
             
-            current_table = None
-            for row in rows:
-                if row['table_name'] != current_table:
-                    current_table = row['table_name']
-                    schema_info += f"\nTable: {current_table}\n"
-                    schema_info += "-" * 50 + "\n"
-                
-                nullable = "NULL" if row['is_nullable'] == 'YES' else "NOT NULL"
-                schema_info += f"  {row['column_name']}: {row['data_type']} ({nullable})\n"
-            
-            return schema_info
+            return self.catalog.render_schema()
             
         except Exception as e:
             return f"Error getting schema: {e}"
@@ -116,6 +390,21 @@ class DatabaseManager:
         except Exception as e:
             print(f"❌ Error en prueba de conexión: {e}")
             return False
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas de latencia y ruteo por nodo (primario y réplicas)."""
+        return {
+            "primary": self.primary.get_metrics(),
+            "replicas": [node.get_metrics() for node in self.replicas],
+            "fallbacks_to_primary": self.router.fallbacks_to_primary,
+            "replica_reconnects": self.router.reconnects,
+            "query_classes": {
+                name: limits.get_metrics() for name, limits in self.query_classes.items()
+            },
+            "catalog": self.catalog.get_metrics(),
+            "search_view": self.search_view.get_metrics(),
+            "change_feed": self.change_feed.get_metrics(),
+        }
 
 
 # Instancia global del gestor de base de datos
@@ -0,0 +1,40 @@
+-- Vista materializada de búsqueda: propiedad con las columnas de edificio ya
+-- unidas, para que la búsqueda determinística no pague el JOIN.
+--
+-- Aplicar con:  python -m db.search_view install
+-- (el schema de las tablas se toma de DATABASE_SCHEMA)
+--
+-- Si cambian las columnas de propiedad/edificio hay que recrearla:
+--   DROP MATERIALIZED VIEW {schema}.propiedad_busqueda;  y volver a instalar
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS {schema}.propiedad_busqueda AS
+SELECT
+    p.*,
+    e.nombre AS edificio_nombre,
+    e.direccion AS edificio_direccion,
+    e.distrito AS edificio_distrito
+FROM {schema}.propiedad p
+JOIN {schema}.edificio e ON p.edificio_id = e.id
+WITH DATA;
+
+-- Índice único: requerido por REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS propiedad_busqueda_id_idx
+    ON {schema}.propiedad_busqueda (id);
+
+-- Filtros esenciales de igualdad primero y el rango de precio al final
+CREATE INDEX IF NOT EXISTS propiedad_busqueda_esenciales_idx
+    ON {schema}.propiedad_busqueda (edificio_distrito, estado, dormitorios, valor_comercial);
+
+-- Búsquedas sin distrito (por área o precio)
+CREATE INDEX IF NOT EXISTS propiedad_busqueda_area_idx
+    ON {schema}.propiedad_busqueda (area);
+CREATE INDEX IF NOT EXISTS propiedad_busqueda_valor_idx
+    ON {schema}.propiedad_busqueda (valor_comercial);
+
+-- Último refresco (compartido entre instancias de la app)
+CREATE TABLE IF NOT EXISTS {schema}.search_view_refresh (
+    view_name text PRIMARY KEY,
+    refreshed_at timestamptz NOT NULL,
+    source_changes bigint NOT NULL,
+    duration_ms double precision
+);
@@ -0,0 +1,133 @@
+-- Change feed de inventario: triggers por statement en propiedad/edificio que
+-- registran cada cambio en property_change_log y lo publican con
+-- NOTIFY property_changes (ids y distritos afectados), para invalidar caches.
+--
+-- Aplicar con:  python -m db.change_feed install
+-- (el schema de las tablas se toma de DATABASE_SCHEMA)
+
+-- Registro para ponerse al día tras una reconexión (se purga por antigüedad)
+CREATE TABLE IF NOT EXISTS {schema}.property_change_log (
+    id bigserial PRIMARY KEY,
+    changed_at timestamptz NOT NULL DEFAULT now(),
+    table_name text NOT NULL,
+    op text NOT NULL,
+    ids text[],                 -- NULL = alcance desconocido (TRUNCATE)
+    distritos text[] NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS property_change_log_changed_at_idx
+    ON {schema}.property_change_log (changed_at);
+
+CREATE OR REPLACE FUNCTION {schema}.notify_property_change() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    changed_ids text[] := ARRAY[]::text[];
+    changed_distritos text[] := ARRAY[]::text[];
+    batch_ids text[];
+    batch_distritos text[];
+    change_id bigint;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        changed_ids := NULL;
+    ELSE
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF TG_TABLE_NAME = 'propiedad' THEN
+                SELECT array_agg(r.id::text), array_agg(e.distrito)
+                INTO batch_ids, batch_distritos
+                FROM new_rows r
+                LEFT JOIN {schema}.edificio e ON e.id = r.edificio_id;
+            ELSE
+                SELECT array_agg(r.id::text), array_agg(r.distrito)
+                INTO batch_ids, batch_distritos
+                FROM new_rows r;
+            END IF;
+            changed_ids := changed_ids || COALESCE(batch_ids, ARRAY[]::text[]);
+            changed_distritos := changed_distritos || COALESCE(batch_distritos, ARRAY[]::text[]);
+        END IF;
+
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            IF TG_TABLE_NAME = 'propiedad' THEN
+                SELECT array_agg(r.id::text), array_agg(e.distrito)
+                INTO batch_ids, batch_distritos
+                FROM old_rows r
+                LEFT JOIN {schema}.edificio e ON e.id = r.edificio_id;
+            ELSE
+                SELECT array_agg(r.id::text), array_agg(r.distrito)
+                INTO batch_ids, batch_distritos
+                FROM old_rows r;
+            END IF;
+            changed_ids := changed_ids || COALESCE(batch_ids, ARRAY[]::text[]);
+            changed_distritos := changed_distritos || COALESCE(batch_distritos, ARRAY[]::text[]);
+        END IF;
+
+        -- Statement sin filas afectadas: nada que avisar
+        IF cardinality(changed_ids) = 0 THEN
+            RETURN NULL;
+        END IF;
+
+        SELECT array_agg(DISTINCT x) INTO changed_ids FROM unnest(changed_ids) AS x;
+    END IF;
+
+    SELECT COALESCE(array_agg(DISTINCT x), ARRAY[]::text[])
+    INTO changed_distritos
+    FROM unnest(changed_distritos) AS x
+    WHERE x IS NOT NULL;
+
+    INSERT INTO {schema}.property_change_log (table_name, op, ids, distritos)
+    VALUES (TG_TABLE_NAME, TG_OP, changed_ids, changed_distritos)
+    RETURNING id INTO change_id;
+
+    -- El payload de NOTIFY tiene un límite de 8000 bytes: con muchos ids se
+    -- omiten y el listener invalida por distrito
+    PERFORM pg_notify('property_changes', json_build_object(
+        'seq', change_id,
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'ids', CASE WHEN cardinality(changed_ids) <= 100 THEN changed_ids END,
+        'distritos', changed_distritos,
+        'ts', extract(epoch FROM clock_timestamp())
+    )::text);
+
+    RETURN NULL;
+END;
+$$;
+
+-- Triggers por statement con tablas de transición (un solo NOTIFY por
+-- INSERT/UPDATE/DELETE/COPY, sin importar cuántas filas toque)
+DROP TRIGGER IF EXISTS propiedad_change_insert ON {schema}.propiedad;
+CREATE TRIGGER propiedad_change_insert AFTER INSERT ON {schema}.propiedad
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {schema}.notify_property_change();
+
+DROP TRIGGER IF EXISTS propiedad_change_update ON {schema}.propiedad;
+CREATE TRIGGER propiedad_change_update AFTER UPDATE ON {schema}.propiedad
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {schema}.notify_property_change();
+
+DROP TRIGGER IF EXISTS propiedad_change_delete ON {schema}.propiedad;
+CREATE TRIGGER propiedad_change_delete AFTER DELETE ON {schema}.propiedad
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {schema}.notify_property_change();
+
+DROP TRIGGER IF EXISTS propiedad_change_truncate ON {schema}.propiedad;
+CREATE TRIGGER propiedad_change_truncate AFTER TRUNCATE ON {schema}.propiedad
+    FOR EACH STATEMENT EXECUTE FUNCTION {schema}.notify_property_change();
+
+DROP TRIGGER IF EXISTS edificio_change_insert ON {schema}.edificio;
+CREATE TRIGGER edificio_change_insert AFTER INSERT ON {schema}.edificio
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {schema}.notify_property_change();
+
+DROP TRIGGER IF EXISTS edificio_change_update ON {schema}.edificio;
+CREATE TRIGGER edificio_change_update AFTER UPDATE ON {schema}.edificio
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {schema}.notify_property_change();
+
+DROP TRIGGER IF EXISTS edificio_change_delete ON {schema}.edificio;
+CREATE TRIGGER edificio_change_delete AFTER DELETE ON {schema}.edificio
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {schema}.notify_property_change();
+
+DROP TRIGGER IF EXISTS edificio_change_truncate ON {schema}.edificio;
+CREATE TRIGGER edificio_change_truncate AFTER TRUNCATE ON {schema}.edificio
+    FOR EACH STATEMENT EXECUTE FUNCTION {schema}.notify_property_change();
@@ -0,0 +1,29 @@
+-- Búsquedas guardadas y outbox de coincidencias con propiedades nuevas o
+-- actualizadas (las evalúa tools/saved_searches.py a partir del change feed).
+--
+-- Aplicar con:  python -m tools.saved_searches install
+-- (el schema de las tablas se toma de DATABASE_SCHEMA)
+
+CREATE TABLE IF NOT EXISTS {schema}.saved_search (
+    id bigserial PRIMARY KEY,
+    session_id text NOT NULL,
+    filters jsonb NOT NULL,           -- PropertyFilters (sin None)
+    created_at timestamptz NOT NULL DEFAULT now(),
+    active boolean NOT NULL DEFAULT true
+);
+
+CREATE INDEX IF NOT EXISTS saved_search_session_idx
+    ON {schema}.saved_search (session_id) WHERE active;
+
+-- Outbox local: una fila por (búsqueda, propiedad); la entrega la hace otro proceso
+CREATE TABLE IF NOT EXISTS {schema}.saved_search_match (
+    id bigserial PRIMARY KEY,
+    saved_search_id bigint NOT NULL REFERENCES {schema}.saved_search (id) ON DELETE CASCADE,
+    propiedad_id text NOT NULL,
+    matched_at timestamptz NOT NULL DEFAULT now(),
+    delivered_at timestamptz,
+    UNIQUE (saved_search_id, propiedad_id)
+);
+
+CREATE INDEX IF NOT EXISTS saved_search_match_pending_idx
+    ON {schema}.saved_search_match (matched_at) WHERE delivered_at IS NULL;
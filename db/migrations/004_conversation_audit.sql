@@ -0,0 +1,29 @@
+-- Registro de auditoría de conversaciones: una fila por turno de /chat o del
+-- WebSocket (tools/audit_log.py las escribe por lotes con COPY, fuera del request).
+--
+-- Aplicar con:  python -m tools.audit_log install
+-- (el schema de la tabla se toma de DATABASE_SCHEMA)
+
+CREATE TABLE IF NOT EXISTS {schema}.conversation_audit (
+    id bigserial PRIMARY KEY,
+    recorded_at timestamptz NOT NULL,
+    session_id text NOT NULL,
+    outcome text NOT NULL,            -- completed | deadline_exceeded | client_disconnected | failed
+    user_message text NOT NULL,
+    assistant_message text,
+    node text,                        -- último nodo del grafo en el turno
+    filters jsonb NOT NULL,           -- PropertyFilters (sin None) al terminar el turno
+    generated_sql text,
+    result_count integer,             -- NULL = el turno no ejecutó búsqueda
+    wall_ms double precision,
+    timings jsonb NOT NULL,           -- ms por nodo / tarea en paralelo
+    llm_calls integer NOT NULL,       -- acumuladas en la conversación
+    error text
+);
+
+-- Solo se agregan filas en orden de tiempo: BRIN es mínimo y alcanza para rangos
+CREATE INDEX IF NOT EXISTS conversation_audit_recorded_at_idx
+    ON {schema}.conversation_audit USING brin (recorded_at);
+
+CREATE INDEX IF NOT EXISTS conversation_audit_session_idx
+    ON {schema}.conversation_audit (session_id, recorded_at);
@@ -0,0 +1,235 @@
+"""
+Nodos de base de datos (primario / réplicas) y ruteo de lecturas
+"""
+import asyncio
+import time
+import asyncpg
+from collections import deque
+from typing import Optional, List, Dict, Any, Callable, Awaitable
+
+
+class NodeUnavailableError(Exception):
+    """No se obtuvo una conexión del nodo a tiempo (el servidor no responde)."""
+
+
+# Errores que indican que el nodo no está disponible (y justifican failover).
+# Los errores de la query en sí (sintaxis, permisos) NO entran aquí, y tampoco
+# un timeout de la query: una query lenta en la réplica también lo sería en el
+# primario, y repetirla ahí duplica el trabajo justo cuando hay carga.
+# Ojo: TimeoutError hereda de OSError, quien capture estos errores debe
+# dejar pasar antes el timeout de la query.
+CONNECTION_ERRORS = (
+    OSError,
+    NodeUnavailableError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.CannotConnectNowError,
+)
+
+# Espera máxima entre reintentos de conexión a una réplica sin pool
+MAX_RECONNECT_BACKOFF = 300.0
+
+# Lag de replicación en segundos. Si la réplica ya aplicó todo lo recibido
+# se considera al día (evita falsos positivos cuando el primario está inactivo).
+REPLICATION_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class DatabaseNode:
+    """Un servidor PostgreSQL con su pool y sus métricas de latencia."""
+
+    PRIMARY = "primary"
+    REPLICA = "replica"
+
+    def __init__(self, dsn: str, role: str = PRIMARY, name: Optional[str] = None):
+        """
+        Args:
+            dsn: Connection string del servidor
+            role: "primary" o "replica"
+            name: Nombre para logs y métricas (default: rol + host)
+        """
+        if role not in (self.PRIMARY, self.REPLICA):
+            raise ValueError(f"Rol de base de datos inválido: {role}")
+
+        self.dsn = dsn
+        self.role = role
+        self.name = name or f"{role}@{dsn.rsplit('@', 1)[-1]}"
+        self.pool: Optional[asyncpg.Pool] = None
+
+        # Estado de salud
+        self.healthy = True
+        self.lag_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+        # Reintentos de conexión cuando el pool no se pudo crear
+        self.reconnect_failures = 0
+        self.next_reconnect_at = 0.0
+
+        # Métricas
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.recent_latencies: deque = deque(maxlen=256)
+
+    @property
+    def is_replica(self) -> bool:
+        return self.role == self.REPLICA
+
+    def record(self, latency: float, ok: bool = True):
+        """Registra la latencia (en segundos) de una operación."""
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.recent_latencies.append(latency)
+
+    def mark_unhealthy(self, error: Exception):
+        """Saca al nodo de la rotación hasta el próximo chequeo de lag exitoso."""
+        self.healthy = False
+        self.last_error = str(error)
+        print(f"⚠️ Nodo {self.name} marcado como no disponible: {error}")
+
+    def _percentile(self, pct: float) -> Optional[float]:
+        if not self.recent_latencies:
+            return None
+        ordered = sorted(self.recent_latencies)
+        index = min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))
+        return ordered[index]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Retorna las métricas del nodo (latencias en ms)."""
+        p50 = self._percentile(0.50)
+        p95 = self._percentile(0.95)
+        return {
+            "name": self.name,
+            "role": self.role,
+            "connected": self.pool is not None,
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag_seconds, 3),
+            "reconnect_failures": self.reconnect_failures,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_latency / self.requests * 1000, 2) if self.requests else None,
+            "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            "max_ms": round(self.max_latency * 1000, 2),
+            "last_error": self.last_error,
+        }
+
+
+class ReplicaRouter:
+    """
+    Elige la réplica para cada lectura usando least-outstanding-requests.
+    Solo considera réplicas conectadas, sanas y con lag dentro del umbral.
+    """
+
+    def __init__(
+        self,
+        replicas: List[DatabaseNode],
+        max_lag_seconds: float,
+        check_interval: float,
+        connect: Optional[Callable[[DatabaseNode], Awaitable[None]]] = None
+    ):
+        """
+        Args:
+            replicas: Nodos con rol replica
+            max_lag_seconds: Lag máximo tolerado antes de volver al primario
+            check_interval: Segundos entre chequeos de lag
+            connect: Crea el pool de un nodo (para reintentar réplicas que no conectaron)
+        """
+        self.replicas = replicas
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.connect = connect
+        self.fallbacks_to_primary = 0
+        self.reconnects = 0
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._reconnect_tasks: Dict[str, asyncio.Task] = {}
+
+    def choose(self) -> Optional[DatabaseNode]:
+        """Retorna la réplica con menos requests en curso, o None si ninguna sirve."""
+        eligible = [
+            node for node in self.replicas
+            if node.pool is not None
+            and node.healthy
+            and node.lag_seconds <= self.max_lag_seconds
+        ]
+
+        if not eligible:
+            if self.replicas:
+                self.fallbacks_to_primary += 1
+            return None
+
+        # Desempate por la latencia reciente más baja
+        return min(eligible, key=lambda node: (node.outstanding, node._percentile(0.5) or 0.0))
+
+    def schedule_reconnect(self, node: DatabaseNode, error: Exception):
+        """Deja la réplica sin pool fuera de rotación y agenda el próximo intento (backoff exponencial)."""
+        node.reconnect_failures += 1
+        delay = min(self.check_interval * 2 ** (node.reconnect_failures - 1), MAX_RECONNECT_BACKOFF)
+        node.next_reconnect_at = time.monotonic() + delay
+        node.healthy = False
+        node.last_error = str(error)
+        print(f"⚠️ Réplica {node.name} sin conexión: {error} (reintento en {delay:.0f}s)")
+
+    async def _reconnect(self, node: DatabaseNode):
+        try:
+            await self.connect(node)
+        except Exception as e:
+            self.schedule_reconnect(node, e)
+            return
+        node.reconnect_failures = 0
+        self.reconnects += 1
+        print(f"🔌 Réplica {node.name} conectada")
+        await self.check_lag(node)
+
+    async def check_lag(self, node: DatabaseNode):
+        """Actualiza el lag de una réplica y su estado de salud."""
+        if node.pool is None:
+            # No conectó (p.ej. caída al arrancar): reintentar en background, así
+            # un host que no responde no retrasa el chequeo de las demás réplicas
+            task = self._reconnect_tasks.get(node.name)
+            if self.connect is not None and (task is None or task.done()) and time.monotonic() >= node.next_reconnect_at:
+                self._reconnect_tasks[node.name] = asyncio.create_task(self._reconnect(node))
+            return
+
+        try:
+            lag = await node.pool.fetchval(REPLICATION_LAG_QUERY, timeout=self.check_interval)
+            node.lag_seconds = float(lag or 0)
+
+            if not node.healthy:
+                print(f"✅ Réplica {node.name} disponible nuevamente")
+            node.healthy = True
+
+            if node.lag_seconds > self.max_lag_seconds:
+                print(f"⚠️ Réplica {node.name} con lag de {node.lag_seconds:.1f}s (máx {self.max_lag_seconds}s)")
+        except Exception as e:
+            node.mark_unhealthy(e)
+
+    async def _monitor(self):
+        while True:
+            await asyncio.gather(*(self.check_lag(node) for node in self.replicas))
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        """Inicia el chequeo periódico de lag en background."""
+        if self.replicas and self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        """Detiene el chequeo periódico de lag y los reintentos de conexión."""
+        tasks = [task for task in [self._monitor_task, *self._reconnect_tasks.values()] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._monitor_task = None
+        self._reconnect_tasks.clear()
@@ -0,0 +1,300 @@
+"""
+Vista materializada de búsqueda (propiedad + edificio desnormalizados)
+
+La vista `propiedad_busqueda` (DDL en db/migrations/001_search_view.sql) evita
+el JOIN en la búsqueda determinística. Un loop en background detecta cambios
+en las tablas base (contadores de pg_stat) y la refresca con
+REFRESH MATERIALIZED VIEW CONCURRENTLY; el constructor de queries la usa solo
+mientras esté fresca (sin cambios pendientes o refrescada hace menos de
+SEARCH_VIEW_MAX_STALENESS segundos), si no vuelve a las tablas base. Con el
+change feed activo un cambio en las tablas base adelanta el refresco.
+
+Uso:
+    python -m db.search_view install   # crea vista, índices y tabla de control
+    python -m db.search_view refresh   # refresca ahora
+    python -m db.search_view status
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, TYPE_CHECKING
+from models.settings import settings
+
+if TYPE_CHECKING:
+    from db.connection import DatabaseManager
+
+
+VIEW_NAME = "propiedad_busqueda"
+SOURCE_TABLES = ["propiedad", "edificio"]
+MIGRATION_FILE = Path(__file__).parent / "migrations" / "001_search_view.sql"
+
+# Clave del advisory lock: una sola instancia refresca a la vez
+REFRESH_LOCK_KEY = 4207001
+
+# Contador de cambios en las tablas base (inserts + updates + deletes)
+SOURCE_CHANGES_QUERY = """
+SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)::bigint
+FROM pg_catalog.pg_stat_user_tables
+WHERE schemaname = $1 AND relname = ANY($2::text[])
+"""
+
+REFRESH_STATE_QUERY = """
+SELECT
+    refreshed_at,
+    source_changes,
+    duration_ms,
+    EXTRACT(EPOCH FROM (now() - refreshed_at))::float8 AS age_seconds
+FROM {schema}.search_view_refresh
+WHERE view_name = $1
+"""
+
+RECORD_REFRESH_QUERY = """
+INSERT INTO {schema}.search_view_refresh (view_name, refreshed_at, source_changes, duration_ms)
+VALUES ($1, now(), $2, $3)
+ON CONFLICT (view_name) DO UPDATE
+SET refreshed_at = EXCLUDED.refreshed_at,
+    source_changes = EXCLUDED.source_changes,
+    duration_ms = EXCLUDED.duration_ms
+"""
+
+
+class SearchView:
+    """
+    Estado y refresco de la vista materializada de búsqueda.
+
+    La frescura se decide en memoria (`is_fresh`) para no agregar una query al
+    camino caliente: el loop de background la actualiza cada
+    SEARCH_VIEW_REFRESH_INTERVAL segundos.
+    """
+
+    def __init__(self, database: "DatabaseManager"):
+        """
+        Args:
+            database: DatabaseManager donde vive la vista
+        """
+        self.db = database
+        self.schema = settings.database_schema
+        self.enabled = settings.search_view_enabled
+        self.refresh_interval = settings.search_view_refresh_interval
+        self.max_staleness = settings.search_view_max_staleness
+        self.refresh_timeout_ms = settings.search_view_refresh_timeout_ms
+
+        self.exists = False
+        self.pending_changes = False
+        self._refreshed_at: Optional[float] = None  # time.monotonic() equivalente
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+
+        # Métricas
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_refresh_ms: Optional[float] = None
+        self.queries_on_view = 0
+        self.queries_on_tables = 0
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.schema}.{VIEW_NAME}"
+
+    @property
+    def staleness(self) -> Optional[float]:
+        """
+        Cota superior (segundos) de cuánto puede estar atrasada la vista:
+        0 si no hay cambios pendientes, si no el tiempo desde el último refresco.
+        """
+        if self._refreshed_at is None:
+            return None
+        if not self.pending_changes:
+            return 0.0
+        return time.monotonic() - self._refreshed_at
+
+    @property
+    def is_fresh(self) -> bool:
+        """¿Se puede buscar sobre la vista en lugar de las tablas base?"""
+        if not (self.enabled and self.exists):
+            return False
+        staleness = self.staleness
+        return staleness is not None and staleness <= self.max_staleness
+
+    def record_query(self, on_view: bool):
+        if on_view:
+            self.queries_on_view += 1
+        else:
+            self.queries_on_tables += 1
+
+    async def install(self):
+        """Aplica el DDL de la vista (idempotente)."""
+        ddl = MIGRATION_FILE.read_text(encoding="utf-8").format(schema=self.schema)
+        async with self.db.get_connection() as conn:
+            await conn.execute(ddl)
+        print(f"✅ Vista de búsqueda instalada: {self.qualified_name}")
+        await self.check()
+
+    async def _fetch_source_changes(self) -> int:
+        return await self.db.fetch_val(SOURCE_CHANGES_QUERY, self.schema, SOURCE_TABLES)
+
+    async def _fetch_refresh_state(self) -> Optional[Dict[str, Any]]:
+        return await self.db.fetch_one(REFRESH_STATE_QUERY.format(schema=self.schema), VIEW_NAME)
+
+    async def check(self) -> bool:
+        """
+        Actualiza existencia, último refresco y cambios pendientes.
+
+        Returns:
+            True si hay cambios en las tablas base posteriores al último refresco
+        """
+        self.exists = await self.db.fetch_val("SELECT to_regclass($1) IS NOT NULL", self.qualified_name)
+        if not self.exists:
+            self._refreshed_at = None
+            self.pending_changes = False
+            return False
+
+        state = await self._fetch_refresh_state()
+        if state is None:
+            # Creada pero nunca refrescada por el scheduler: contenido de origen desconocido
+            self._refreshed_at = None
+            self.pending_changes = True
+            return True
+
+        changes = await self._fetch_source_changes()
+        self._refreshed_at = time.monotonic() - state["age_seconds"]
+        self.last_refresh_ms = state["duration_ms"]
+        self.pending_changes = changes != state["source_changes"]
+        return self.pending_changes
+
+    async def refresh(self) -> bool:
+        """
+        REFRESH MATERIALIZED VIEW CONCURRENTLY (las búsquedas siguen leyendo la
+        versión anterior mientras tanto).
+
+        Returns:
+            False si otra instancia está refrescando
+        """
+        # El contador se toma antes: cambios durante el refresco quedan pendientes
+        changes = await self._fetch_source_changes()
+        start = time.perf_counter()
+
+        async with self.db.get_connection() as conn:
+            async with conn.transaction():
+                locked = await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", REFRESH_LOCK_KEY)
+                if not locked:
+                    return False
+                await conn.execute(f"SET LOCAL statement_timeout = {int(self.refresh_timeout_ms)}")
+                await conn.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self.qualified_name}")
+                duration_ms = (time.perf_counter() - start) * 1000
+                await conn.execute(
+                    RECORD_REFRESH_QUERY.format(schema=self.schema), VIEW_NAME, changes, duration_ms
+                )
+
+        self.refreshes += 1
+        self.last_refresh_ms = duration_ms
+        self._refreshed_at = time.monotonic()
+        self.pending_changes = False
+        print(f"🔄 Vista de búsqueda refrescada en {duration_ms:.0f} ms")
+        return True
+
+    async def refresh_if_changed(self) -> bool:
+        """Refresca solo si las tablas base cambiaron desde el último refresco."""
+        if await self.check():
+            return await self.refresh()
+        return False
+
+    def on_data_change(self, event) -> int:
+        """Cambio en las tablas base (db.change_feed): refrescar sin esperar el intervalo."""
+        if not self.exists:
+            return 0
+        self.pending_changes = True
+        if self._wake is not None:
+            self._wake.set()
+        return 1
+
+    async def _monitor(self):
+        notified = False
+        while True:
+            try:
+                # Un aviso del change feed llega antes que los contadores de pg_stat
+                if notified:
+                    await self.refresh()
+                else:
+                    await self.refresh_if_changed()
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"❌ Error refrescando vista de búsqueda: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refresh_interval)
+                notified = True
+            except asyncio.TimeoutError:
+                notified = False
+            self._wake.clear()
+
+    async def start(self):
+        """Verifica la vista e inicia el refresco periódico (si está habilitada)."""
+        if not self.enabled:
+            return
+
+        await self.check()
+        if not self.exists:
+            print(f"⚠️ Vista {self.qualified_name} no existe, las búsquedas usan las tablas base "
+                  f"(instalar con: python -m db.search_view install)")
+            return
+
+        if self._monitor_task is None:
+            self._wake = asyncio.Event()
+            self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        """Detiene el refresco periódico."""
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        staleness = self.staleness
+        return {
+            "enabled": self.enabled,
+            "exists": self.exists,
+            "fresh": self.is_fresh,
+            "pending_changes": self.pending_changes,
+            "staleness_seconds": round(staleness, 1) if staleness is not None else None,
+            "max_staleness_seconds": self.max_staleness,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "last_refresh_ms": round(self.last_refresh_ms, 2) if self.last_refresh_ms is not None else None,
+            "queries_on_view": self.queries_on_view,
+            "queries_on_tables": self.queries_on_tables,
+        }
+
+
+async def _main(command: str):
+    from db.connection import db
+
+    await db.connect()
+    try:
+        view = db.search_view
+        if command == "install":
+            await view.install()
+            await view.refresh()
+        elif command == "refresh":
+            await view.check()
+            if not view.exists:
+                print(f"⚠️ Vista {view.qualified_name} no existe")
+            elif not await view.refresh():
+                print("⏳ Otra instancia está refrescando la vista")
+        else:
+            await view.check()
+        print(view.get_metrics())
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command not in ("install", "refresh", "status"):
+        print("Uso: python -m db.search_view [install|refresh|status]")
+        sys.exit(1)
+    asyncio.run(_main(command))
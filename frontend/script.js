@@ -3,7 +3,9 @@
 // ============================================================================
 
 const API_URL = 'http://localhost:8000';
+const WS_URL = API_URL.replace(/^http/, 'ws');
 const SESSION_KEY = 'chatbot_session_id';
+const RECONNECT_DELAY_MS = 1000;
 
 // ============================================================================
 // ELEMENTOS DEL DOM
@@ -25,6 +27,8 @@ const closePropertiesBtn = document.getElementById('close-properties-btn');
 
 let sessionId = localStorage.getItem(SESSION_KEY) || null;
 let isProcessing = false;
+let socket = null;
+let pendingProperties = null;  // Propiedades ya mostradas esperando el mensaje del bot
 
 // ============================================================================
 // INICIALIZACIÓN
@@ -38,8 +42,78 @@ document.addEventListener('DOMContentLoaded', () => {
     if (sessionId) {
         addMessage('bot', '¡Hola de nuevo! ¿En qué puedo ayudarte?');
     }
+    
+    connectSocket();
 });
 
+// ============================================================================
+// WEBSOCKET - Canal persistente con push del servidor
+// ============================================================================
+
+function ensureSessionId() {
+    if (!sessionId) {
+        sessionId = crypto.randomUUID();
+        localStorage.setItem(SESSION_KEY, sessionId);
+        updateSessionStatus();
+    }
+    return sessionId;
+}
+
+function connectSocket() {
+    const ws = new WebSocket(`${WS_URL}/ws/${ensureSessionId()}`);
+    socket = ws;
+    
+    ws.addEventListener('message', (event) => {
+        handleServerEvent(JSON.parse(event.data));
+    });
+    
+    ws.addEventListener('close', () => {
+        if (socket !== ws) return;  // Socket reemplazado (p.ej. nueva sesión)
+        socket = null;
+        
+        if (isProcessing) {
+            addMessage('bot', '❌ Se perdió la conexión con el servidor. Por favor, intenta de nuevo.');
+            setProcessing(false);
+        }
+        setTimeout(connectSocket, RECONNECT_DELAY_MS);
+    });
+}
+
+function closeSocket() {
+    if (socket) {
+        const ws = socket;
+        socket = null;
+        ws.close();
+    }
+}
+
+function handleServerEvent(event) {
+    switch (event.type) {
+        case 'filters':
+            updateSessionStatus(event.filters);
+            break;
+        
+        case 'properties':
+            // Se muestran apenas llegan; el mensaje del bot se inserta antes al terminar el turno
+            pendingProperties = event.count > 0 ? displayPropertiesInChat(event) : null;
+            break;
+        
+        case 'message':
+            addMessage('bot', event.response, pendingProperties);
+            pendingProperties = null;
+            updateSessionStatus(event.filters);
+            setProcessing(false);
+            break;
+        
+        case 'error':
+            console.error('Error:', event.detail);
+            addMessage('bot', '❌ Lo siento, hubo un error al procesar tu mensaje. Por favor, intenta de nuevo.');
+            pendingProperties = null;
+            setProcessing(false);
+            break;
+    }
+}
+
 // ============================================================================
 // EVENT LISTENERS
 // ============================================================================
@@ -87,6 +161,17 @@ async function handleSendMessage() {
     // Mostrar loading
     setProcessing(true);
     
+    if (socket && socket.readyState === WebSocket.OPEN) {
+        // La respuesta llega por eventos (handleServerEvent)
+        socket.send(JSON.stringify({ message: message }));
+        return;
+    }
+    
+    await sendViaHttp(message);
+}
+
+async function sendViaHttp(message) {
+    // Respaldo sin WebSocket: /chat y, si hubo búsqueda, /properties
     try {
         const response = await fetch(`${API_URL}/chat`, {
             method: 'POST',
@@ -94,7 +179,7 @@ async function handleSendMessage() {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                session_id: sessionId,
+                session_id: ensureSessionId(),
                 message: message
             })
         });
@@ -105,21 +190,13 @@ async function handleSendMessage() {
         
         const data = await response.json();
         
-        // Actualizar session_id
-        if (!sessionId) {
-            sessionId = data.session_id;
-            localStorage.setItem(SESSION_KEY, sessionId);
-            updateSessionStatus();
-        }
-        
         // Agregar respuesta del bot
         addMessage('bot', data.response);
+        updateSessionStatus(data.filters);
         
-        // Si hay propiedades encontradas, mostrarlas automáticamente
+        // Si hay propiedades encontradas, mostrarlas
         if (data.properties_found && data.properties_found > 0) {
-            setTimeout(() => {
-                loadProperties();
-            }, 500);
+            await loadProperties();
         }
         
     } catch (error) {
@@ -134,7 +211,7 @@ async function handleSendMessage() {
 // UI - MENSAJES
 // ============================================================================
 
-function addMessage(type, content) {
+function addMessage(type, content, beforeElement = null) {
     // Remover mensaje de bienvenida si existe
     const welcomeMsg = chatContainer.querySelector('.welcome-message');
     if (welcomeMsg) {
@@ -163,7 +240,11 @@ function addMessage(type, content) {
     messageDiv.appendChild(avatar);
     messageDiv.appendChild(contentDiv);
     
-    chatContainer.appendChild(messageDiv);
+    if (beforeElement && beforeElement.parentNode === chatContainer) {
+        chatContainer.insertBefore(messageDiv, beforeElement);
+    } else {
+        chatContainer.appendChild(messageDiv);
+    }
     
     // Scroll al final
     chatContainer.scrollTop = chatContainer.scrollHeight;
@@ -176,8 +257,6 @@ function addMessage(type, content) {
 async function loadProperties() {
     if (!sessionId) return;
     
-    setProcessing(true);
-    
     try {
         const response = await fetch(`${API_URL}/properties/${sessionId}`);
         
@@ -196,15 +275,13 @@ async function loadProperties() {
     } catch (error) {
         console.error('Error loading properties:', error);
         addMessage('bot', '❌ Hubo un error al cargar las propiedades.');
-    } finally {
-        setProcessing(false);
     }
 }
 
 function displayPropertiesInChat(data) {
     if (!data.properties || data.properties.length === 0) {
         addMessage('bot', 'No se encontraron propiedades con los criterios especificados. ¿Te gustaría ajustar algún filtro?');
-        return;
+        return null;
     }
     
     // Crear mensaje del bot con las propiedades
@@ -271,6 +348,8 @@ function displayPropertiesInChat(data) {
     
     // Scroll al final
     chatContainer.scrollTop = chatContainer.scrollHeight;
+    
+    return messageDiv;
 }
 
 function createPropertyCardInline(property) {
@@ -357,9 +436,12 @@ async function handleResetSession() {
             });
         }
         
-        // Limpiar localStorage
+        // Limpiar localStorage y abrir el canal de la nueva sesión
+        closeSocket();
         localStorage.removeItem(SESSION_KEY);
         sessionId = null;
+        pendingProperties = null;
+        connectSocket();
         
         // Limpiar UI
         chatContainer.innerHTML = `
@@ -383,12 +465,16 @@ async function handleResetSession() {
     }
 }
 
-function updateSessionStatus() {
+function updateSessionStatus(filters = null) {
     if (sessionId) {
         sessionStatus.textContent = `Sesión: ${sessionId.substring(0, 8)}...`;
     } else {
         sessionStatus.textContent = 'Sesión: Nueva';
     }
+    
+    if (filters) {
+        sessionStatus.textContent += ` · ${filters.essential_count}/5 filtros`;
+    }
 }
 
 // ============================================================================
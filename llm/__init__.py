@@ -0,0 +1,22 @@
+from llm.backends import LLMBackend, CircuitBreaker
+from llm.scheduler import LLMScheduler, llm_scheduler, llm_session, llm_priority, INTERACTIVE, BACKGROUND
+from llm.cassette import LLMCassette, CassetteMissError, llm_cassette
+from llm.gateway import LLMGateway, LLMUnavailableError, LLMDeadlineExceeded, llm_gateway
+
+__all__ = [
+    'llm_gateway',
+    'llm_scheduler',
+    'llm_cassette',
+    'LLMScheduler',
+    'llm_session',
+    'llm_priority',
+    'INTERACTIVE',
+    'BACKGROUND',
+    'LLMGateway',
+    'LLMBackend',
+    'CircuitBreaker',
+    'LLMCassette',
+    'CassetteMissError',
+    'LLMUnavailableError',
+    'LLMDeadlineExceeded',
+]
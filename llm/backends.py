@@ -0,0 +1,183 @@
+"""
+Backends de LLM (modelo + endpoint) con métricas de latencia y circuit breaker
+"""
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Type
+from langchain_openai import ChatOpenAI
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de errores en una ventana de llamadas recientes.
+
+    - closed: pasa todo; abre si la tasa de errores de la ventana supera el umbral
+    - open: rechaza hasta que pasa el cooldown
+    - half_open: deja pasar una llamada de prueba; si funciona cierra, si falla reabre
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window: int, error_rate: float, cooldown: float):
+        """
+        Args:
+            window: Cantidad de llamadas recientes consideradas
+            error_rate: Fracción de errores (0-1) que abre el circuito
+            cooldown: Segundos abierto antes de probar de nuevo
+        """
+        self.window = window
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._outcomes: deque = deque(maxlen=window)
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """¿Se puede enviar una llamada a este backend ahora?"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+
+        # half_open: una sola llamada de prueba a la vez
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record(self, ok: bool):
+        if self.state == self.HALF_OPEN:
+            self._trial_in_flight = False
+            if ok:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+
+        self._outcomes.append(ok)
+        minimum = max(1, self.window // 2)
+        errors = self._outcomes.count(False)
+        if len(self._outcomes) >= minimum and errors / len(self._outcomes) >= self.error_rate:
+            self._open()
+
+    def release(self):
+        """Libera la llamada de prueba si se canceló sin resultado (solo la llamada que la tenía)."""
+        self._trial_in_flight = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "times_opened": self.times_opened,
+            "recent_error_rate": round(self._outcomes.count(False) / len(self._outcomes), 3) if self._outcomes else None,
+        }
+
+
+class LLMBackend:
+    """Un modelo en un endpoint compatible con la API de OpenAI."""
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        api_key: str,
+        base_url: Optional[str] = None,
+        temperature: float = 0,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Args:
+            name: Nombre del backend (para configuración, logs y métricas)
+            model: Modelo a usar
+            api_key: API key del endpoint
+            base_url: Endpoint compatible con OpenAI (None = API de OpenAI)
+            temperature: Temperatura del modelo
+            breaker: Circuit breaker del backend
+        """
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.breaker = breaker or CircuitBreaker(window=20, error_rate=0.5, cooldown=30.0)
+
+        # Sin reintentos internos: el gateway decide fallback y hedging
+        self.chat = ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0
+        )
+        self._structured: Dict[Type, Any] = {}
+
+        # Métricas
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.total_latency = 0.0
+        self.recent_latencies: deque = deque(maxlen=256)
+        self.last_error: Optional[str] = None
+
+    def runnable(self, schema: Optional[Type] = None):
+        """Chat plano o con salida estructurada (function calling) para `schema`."""
+        if schema is None:
+            return self.chat
+        if schema not in self._structured:
+            self._structured[schema] = self.chat.with_structured_output(
+                schema,
+                method="function_calling",
+                include_raw=True
+            )
+        return self._structured[schema]
+
+    def record(self, latency: float, ok: bool = True, error: Optional[Exception] = None):
+        """Registra el resultado de una llamada (latencia en segundos)."""
+        self.requests += 1
+        if ok:
+            self.total_latency += latency
+            self.recent_latencies.append(latency)
+        else:
+            self.errors += 1
+            self.last_error = str(error) if error else None
+        self.breaker.record(ok)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.recent_latencies:
+            return None
+        ordered = sorted(self.recent_latencies)
+        index = min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))
+        return ordered[index]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Retorna las métricas del backend (latencias en ms)."""
+        p50 = self.percentile(0.50)
+        p95 = self.percentile(0.95)
+        successes = self.requests - self.errors
+        return {
+            "name": self.name,
+            "model": self.model,
+            "base_url": self.base_url,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "avg_ms": round(self.total_latency / successes * 1000, 2) if successes else None,
+            "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            "breaker": self.breaker.get_metrics(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,217 @@
+"""
+Cassettes de LLM: grabación y reproducción de llamadas para correr el grafo sin red
+
+- record: cada respuesta exitosa de un backend se guarda con su latencia medida
+- replay: el gateway no llama a ningún backend; sirve la respuesta grabada para
+  el mismo prompt (y schema) esperando la latencia original multiplicada por
+  LLM_CASSETTE_LATENCY_SCALE (0 = sin espera, para perfilar solo CPU)
+
+El cassette es un JSON versionado (CASSETTE_VERSION) con las entradas indexadas
+por el hash del prompt. Si un prompt se grabó varias veces, el replay devuelve
+las respuestas en el orden en que se grabaron (y vuelve a empezar).
+
+Uso:
+    LLM_CASSETTE_MODE=record python main.py   # graba el tráfico real (se guarda al apagar)
+    LLM_CASSETTE_MODE=replay python main.py   # la API responde sin llamar al LLM
+    python -m benchmarks.graph_bench          # benchmark del grafo (ver --help)
+"""
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, Optional, Type
+from langchain_core.messages import message_to_dict, messages_from_dict
+from models.settings import settings
+
+
+# Cambia cuando cambia el formato del archivo (no el contenido de los prompts:
+# un prompt distinto simplemente no encuentra su entrada)
+CASSETTE_VERSION = 1
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+MODES = (OFF, RECORD, REPLAY)
+
+
+class CassetteMissError(Exception):
+    """El prompt no está en el cassette (se grabó con otros prompts o versión)."""
+
+
+def cassette_key(prompt: str, schema: Optional[Type]) -> str:
+    """Hash del prompt y del schema de salida (la misma pregunta con otro schema es otra entrada)."""
+    name = schema.__name__ if schema is not None else "text"
+    return hashlib.sha256(f"{name}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMCassette:
+    """Entradas grabadas en memoria + archivo JSON del cassette."""
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        path: Optional[str] = None,
+        latency_scale: Optional[float] = None
+    ):
+        """
+        Args:
+            mode: "off", "record" o "replay" (default: LLM_CASSETTE_MODE)
+            path: Archivo del cassette (default: LLM_CASSETTE_PATH)
+            latency_scale: Factor sobre la latencia grabada en replay (default: LLM_CASSETTE_LATENCY_SCALE)
+        """
+        self.mode = OFF
+        self.path = Path(path or settings.llm_cassette_path)
+        self.latency_scale = latency_scale if latency_scale is not None else settings.llm_cassette_latency_scale
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._cursor: Dict[str, int] = {}
+
+        # Métricas
+        self.recorded = 0
+        self.hits = 0
+        self.misses = 0
+        self.replayed_latency = 0.0
+
+        self.open(mode or settings.llm_cassette_mode, self.path)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def open(self, mode: str, path: Optional[Path] = None):
+        """
+        Cambia de modo: record empieza un cassette vacío, replay carga el archivo.
+
+        Raises:
+            ValueError si el modo no existe, el archivo no está o es de otra versión
+        """
+        if mode not in MODES:
+            raise ValueError(f"LLM_CASSETTE_MODE inválido: '{mode}' (usa {', '.join(MODES)})")
+        self.path = Path(path or self.path)
+        self.entries = {}
+        self._cursor = {}
+
+        if mode == REPLAY:
+            if not self.path.exists():
+                raise ValueError(f"Cassette de LLM no encontrado: {self.path} (grábalo con LLM_CASSETTE_MODE=record)")
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") != CASSETTE_VERSION:
+                raise ValueError(
+                    f"Cassette {self.path} es versión {data.get('version')}, se esperaba {CASSETTE_VERSION} (vuelve a grabarlo)"
+                )
+            self.entries = data["entries"]
+            responses = sum(len(entry["responses"]) for entry in self.entries.values())
+            print(f"📼 Replay de LLM desde {self.path}: {len(self.entries)} prompts, {responses} respuestas")
+        elif mode == RECORD:
+            print(f"📼 Grabando llamadas al LLM en {self.path}")
+        self.mode = mode
+
+    def record(self, prompt: str, schema: Optional[Type], model: str, response: Any, latency: float):
+        """
+        Agrega una respuesta exitosa al cassette (nunca falla la llamada del usuario).
+
+        Args:
+            prompt: Prompt enviado
+            schema: Schema de salida estructurada (None = texto)
+            model: Modelo que respondió
+            response: AIMessage o {"raw", "parsed", "parsing_error"}
+            latency: Segundos que tardó el backend
+        """
+        try:
+            if isinstance(response, dict):
+                parsed = response.get("parsed")
+                error = response.get("parsing_error")
+                recorded = {
+                    "message": message_to_dict(response["raw"]),
+                    "parsed": parsed.model_dump(mode="json") if parsed is not None else None,
+                    "parsing_error": str(error) if error is not None else None,
+                }
+            else:
+                recorded = {"message": message_to_dict(response)}
+            recorded["latency_ms"] = round(latency * 1000, 2)
+            # Que el archivo se pueda escribir (y no falle recién al guardar)
+            json.dumps(recorded)
+        except Exception as e:
+            print(f"⚠️ No se pudo grabar la respuesta del LLM: {e}")
+            return
+
+        key = cassette_key(prompt, schema)
+        entry = self.entries.setdefault(key, {
+            "schema": schema.__name__ if schema is not None else None,
+            "model": model,
+            "prompt": prompt,
+            "responses": [],
+        })
+        entry["responses"].append(recorded)
+        self.recorded += 1
+
+    async def replay(self, prompt: str, schema: Optional[Type]) -> Any:
+        """
+        Respuesta grabada para el prompt, después de su latencia (escalada).
+
+        Raises:
+            CassetteMissError si el prompt no se grabó
+        """
+        key = cassette_key(prompt, schema)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            raise CassetteMissError(f"Prompt sin grabar en {self.path.name} ({key[:12]}): {prompt[:60]!r}")
+
+        index = self._cursor.get(key, 0)
+        self._cursor[key] = index + 1
+        recorded = entry["responses"][index % len(entry["responses"])]
+
+        delay = recorded["latency_ms"] / 1000 * self.latency_scale
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.hits += 1
+        self.replayed_latency += delay
+
+        message = messages_from_dict([recorded["message"]])[0]
+        if schema is None:
+            return message
+        parsed = recorded.get("parsed")
+        error = recorded.get("parsing_error")
+        return {
+            "raw": message,
+            "parsed": schema.model_validate(parsed) if parsed is not None else None,
+            "parsing_error": ValueError(error) if error is not None else None,
+        }
+
+    def save(self):
+        """Escribe el cassette grabado (reemplazo atómico del archivo)."""
+        if not self.recording:
+            return
+        data = {
+            "version": CASSETTE_VERSION,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "prompt_version": settings.prompt_version,
+            "entries": self.entries,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.path)
+        print(f"📼 Cassette guardado: {self.path} ({len(self.entries)} prompts, {self.recorded} respuestas)")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "path": str(self.path),
+            "prompts": len(self.entries),
+            "recorded": self.recorded,
+            "hits": self.hits,
+            "misses": self.misses,
+            "latency_scale": self.latency_scale,
+            "replayed_latency_s": round(self.replayed_latency, 3),
+        }
+
+
+# Instancia global del cassette (modo off salvo que se configure)
+llm_cassette = LLMCassette()
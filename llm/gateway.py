@@ -0,0 +1,317 @@
+"""
+Gateway de LLM: ruteo por tarea, fallback entre backends, hedging y deadlines
+"""
+import asyncio
+import time
+from typing import Optional, List, Dict, Any, Type
+from models.settings import settings
+from llm.backends import LLMBackend, CircuitBreaker
+from llm.scheduler import llm_scheduler
+from llm.cassette import llm_cassette, CassetteMissError
+from models.budget import current_budget
+
+
+class LLMUnavailableError(Exception):
+    """Ningún backend pudo responder (todos fallaron o tienen el circuito abierto)."""
+
+
+class LLMDeadlineExceeded(LLMUnavailableError):
+    """La llamada superó su deadline."""
+
+
+# Nivel de modelo por tarea (nombre del prompt en prompts/compiler.py):
+# preguntas/mensajes cortos van al modelo barato, el SQL al más fuerte
+TASK_TIERS = {
+    "extract_filters": "cheap",
+    "repair_filters": "cheap",
+    "missing_filter_question": "cheap",
+    "ask_additional_filters": "cheap",
+    "format_results": "cheap",
+    "generate_sql": "strong",
+    "fix_sql": "strong",
+}
+
+
+def _names(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def backends_from_settings() -> List[LLMBackend]:
+    """
+    Construye los backends desde LLM_BACKENDS ("nombre=modelo[@base_url],...").
+    Sin configuración: un único backend "openai" con OPENAI_MODEL.
+    """
+    entries = _names(settings.llm_backends) or [f"openai={settings.openai_model}"]
+
+    backends = []
+    for entry in entries:
+        name, _, target = entry.partition("=")
+        model, _, base_url = target.partition("@")
+        if not name or not model:
+            raise ValueError(f"Backend de LLM inválido: '{entry}' (formato nombre=modelo[@base_url])")
+
+        backends.append(LLMBackend(
+            name=name.strip(),
+            model=model.strip(),
+            api_key=settings.openai_api_key,
+            base_url=base_url.strip() or None,
+            temperature=settings.openai_temperature,
+            breaker=CircuitBreaker(
+                window=settings.llm_breaker_window,
+                error_rate=settings.llm_breaker_error_rate,
+                cooldown=settings.llm_breaker_cooldown
+            )
+        ))
+    return backends
+
+
+class LLMGateway:
+    """
+    Punto único de acceso al LLM para todos los tools.
+
+    - Ruteo por tarea: cada nivel (cheap/strong) tiene su lista ordenada de backends
+    - Fallback: si un backend falla se prueba el siguiente mientras quede deadline
+    - Hedging: si la respuesta tarda más que el p95 del backend, se lanza la misma
+      llamada en el siguiente backend (o el mismo) y gana la primera en responder
+    - Circuit breaker: backends con muchos errores recientes salen de la rotación
+    - Deadline por request: nunca se espera más que `timeout` (incluida la cola del scheduler)
+    - Cassettes: en modo record se graba cada respuesta; en replay no se llama a
+      ningún backend (ni scheduler) y se sirve la respuesta grabada
+    """
+
+    def __init__(self, backends: Optional[List[LLMBackend]] = None):
+        """
+        Args:
+            backends: Backends disponibles (default: desde LLM_BACKENDS)
+        """
+        backends = backends if backends is not None else backends_from_settings()
+        if not backends:
+            raise ValueError("LLMGateway requiere al menos un backend")
+
+        self.backends: Dict[str, LLMBackend] = {backend.name: backend for backend in backends}
+        self.tiers: Dict[str, List[str]] = {
+            "cheap": self._tier(settings.llm_cheap_backends),
+            "strong": self._tier(settings.llm_strong_backends),
+        }
+        self.request_timeout = settings.llm_request_timeout
+        self.hedge_percentile = settings.llm_hedge_percentile
+        self.hedge_min_samples = settings.llm_hedge_min_samples
+        self.hedge_default_delay = settings.llm_hedge_default_delay
+
+        # Métricas
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.deadline_exceeded = 0
+        self.unavailable = 0
+
+        names = ", ".join(f"{b.name}={b.model}" for b in backends)
+        print(f"🧠 LLMGateway inicializado ({names})")
+
+    def _tier(self, configured: str) -> List[str]:
+        names = _names(configured) or list(self.backends)
+        unknown = [name for name in names if name not in self.backends]
+        if unknown:
+            raise ValueError(f"Backends de LLM no definidos en LLM_BACKENDS: {', '.join(unknown)}")
+        return names
+
+    def candidates(self, task: str) -> List[LLMBackend]:
+        """Backends para la tarea en orden de preferencia (sin considerar breakers)."""
+        tier = TASK_TIERS.get(task, "cheap")
+        return [self.backends[name] for name in self.tiers[tier]]
+
+    def hedge_delay(self, backend: LLMBackend) -> float:
+        """Segundos a esperar antes de duplicar la llamada (p95 observado del backend)."""
+        if len(backend.recent_latencies) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return backend.percentile(self.hedge_percentile)
+
+    async def _call(self, backend: LLMBackend, prompt: str, schema: Optional[Type], trial: bool = False) -> Any:
+        """
+        Una llamada a un backend. `trial` indica que es la llamada de prueba del
+        breaker en half_open: si se cancela (incluso esperando en el scheduler)
+        hay que liberarla o el backend no vuelve a la rotación.
+        """
+        ticket = None
+        used_tokens: Optional[int] = None
+        rate_limited = False
+        budget = current_budget.get()
+        try:
+            # Turno en el scheduler (concurrencia global + rate limits del modelo)
+            ticket = await llm_scheduler.acquire(backend.model, llm_scheduler.estimate_tokens(prompt))
+            if budget is not None:
+                budget.llm_calls += 1
+
+            backend.outstanding += 1
+            start = time.perf_counter()
+            try:
+                response = await backend.runnable(schema).ainvoke(prompt)
+            except asyncio.CancelledError:
+                backend.cancelled += 1
+                raise
+            except Exception as e:
+                rate_limited = getattr(e, "status_code", None) == 429
+                backend.record(time.perf_counter() - start, ok=False, error=e)
+                print(f"⚠️ LLM {backend.name} falló: {type(e).__name__}: {e}")
+                raise
+            else:
+                message = response.get("raw") if isinstance(response, dict) else response
+                used_tokens = (getattr(message, "usage_metadata", None) or {}).get("total_tokens")
+                if budget is not None and used_tokens:
+                    budget.llm_tokens += used_tokens
+            finally:
+                backend.outstanding -= 1
+        except asyncio.CancelledError:
+            if trial:
+                backend.breaker.release()
+            raise
+        finally:
+            if ticket is not None:
+                llm_scheduler.release(ticket, used_tokens=used_tokens, rate_limited=rate_limited)
+
+        latency = time.perf_counter() - start
+        backend.record(latency)
+        if llm_cassette.recording:
+            llm_cassette.record(prompt, schema, backend.model, response, latency)
+        return response
+
+    async def _replay(self, task: str, prompt: str, schema: Optional[Type], timeout: float) -> Any:
+        """Respuesta del cassette, con el mismo deadline y contabilidad que una llamada real."""
+        budget = current_budget.get()
+        if budget is not None:
+            budget.llm_calls += 1
+        try:
+            response = await asyncio.wait_for(llm_cassette.replay(prompt, schema), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            raise LLMDeadlineExceeded(f"LLM sin respuesta para '{task}' dentro del deadline")
+        except CassetteMissError as e:
+            self.unavailable += 1
+            print(f"⚠️ {e}")
+            raise LLMUnavailableError(f"Sin respuesta grabada para '{task}'") from e
+
+        message = response.get("raw") if isinstance(response, dict) else response
+        used_tokens = (getattr(message, "usage_metadata", None) or {}).get("total_tokens")
+        if budget is not None and used_tokens:
+            budget.llm_tokens += used_tokens
+        return response
+
+    async def ainvoke(
+        self,
+        task: str,
+        prompt: str,
+        schema: Optional[Type] = None,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Ejecuta un prompt para una tarea.
+
+        Args:
+            task: Nombre de la tarea (define el nivel de modelo, ver TASK_TIERS)
+            prompt: Prompt ya renderizado
+            schema: Modelo pydantic para salida estructurada (None = texto)
+            timeout: Deadline en segundos (default: LLM_REQUEST_TIMEOUT, acotado
+                al presupuesto restante del request en curso)
+
+        Returns:
+            AIMessage, o {"raw", "parsed", "parsing_error"} si se pasó `schema`
+        """
+        self.calls += 1
+        timeout = timeout if timeout is not None else self.request_timeout
+        budget = current_budget.get()
+        if budget is not None:
+            if budget.expired:
+                self.deadline_exceeded += 1
+                raise LLMDeadlineExceeded(f"Request sin tiempo restante para '{task}'")
+            timeout = min(timeout, budget.remaining())
+        if llm_cassette.replaying:
+            return await self._replay(task, prompt, schema, timeout)
+
+        deadline = time.monotonic() + timeout
+        queue = self.candidates(task)
+        pending: Dict[asyncio.Task, LLMBackend] = {}
+        hedged = False
+        last_error: Optional[Exception] = None
+
+        def launch_next() -> Optional[asyncio.Task]:
+            while queue:
+                backend = queue.pop(0)
+                if backend.breaker.allow():
+                    # allow() en half_open reserva la llamada de prueba para esta llamada
+                    trial = backend.breaker.state == CircuitBreaker.HALF_OPEN
+                    call = asyncio.create_task(self._call(backend, prompt, schema, trial))
+                    pending[call] = backend
+                    return call
+            return None
+
+        primary_call = launch_next()
+        if primary_call is None:
+            self.unavailable += 1
+            raise LLMUnavailableError(f"Sin backends disponibles para '{task}' (circuitos abiertos)")
+
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.deadline_exceeded += 1
+                    raise LLMDeadlineExceeded(f"LLM sin respuesta para '{task}' dentro del deadline")
+
+                wait = remaining
+                if not hedged:
+                    wait = min(wait, self.hedge_delay(pending[primary_call]))
+
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if not hedged and remaining > wait:
+                        # Hedge: mismo prompt al siguiente backend (o de nuevo al mismo)
+                        hedged = True
+                        primary = pending[primary_call]
+                        # launch_next consulta el breaker (allow() reserva la prueba en half_open)
+                        if not queue:
+                            queue.append(primary)
+                        if launch_next() is not None:
+                            self.hedges += 1
+                            print(f"🐢 LLM lento para '{task}', enviando request de respaldo")
+                    continue
+
+                for finished in done:
+                    pending.pop(finished)
+                    if finished.exception() is None:
+                        if finished is not primary_call:
+                            self.hedge_wins += 1 if hedged else 0
+                        return finished.result()
+                    last_error = finished.exception()
+
+                # Todas las llamadas en curso fallaron: fallback al siguiente backend
+                if not pending:
+                    primary_call = launch_next()
+                    if primary_call is None:
+                        break
+                    self.fallbacks += 1
+                    print(f"↪️ Fallback de LLM para '{task}' → {pending[primary_call].name}")
+
+            self.unavailable += 1
+            raise LLMUnavailableError(f"Todos los backends fallaron para '{task}': {last_error}")
+
+        finally:
+            for call in pending:
+                call.cancel()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "deadline_exceeded": self.deadline_exceeded,
+            "unavailable": self.unavailable,
+            "tiers": self.tiers,
+            "cassette": llm_cassette.get_metrics(),
+            "backends": [backend.get_metrics() for backend in self.backends.values()],
+        }
+
+
+# Instancia global del gateway
+llm_gateway = LLMGateway()
@@ -0,0 +1,324 @@
+"""
+Scheduler de llamadas al LLM: límite global de concurrencia, token buckets por
+modelo (requests/min y tokens/min), prioridades y cola justa entre sesiones.
+
+Cada llamada pide un turno con `acquire` antes de ir al provider y lo devuelve
+con `release`. Las llamadas interactivas (la respuesta que el usuario espera)
+siempre pasan antes que las de background (especulativas); dentro de una
+prioridad las sesiones se atienden por turnos, así una sesión con muchas
+llamadas no deja esperando a las demás.
+
+La sesión y la prioridad se toman del contexto (contextvars), que pipeline.py
+y llm_speculation fijan por turno y por llamada especulativa.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Deque, Tuple, Set
+from models.settings import settings
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# Contexto de la llamada en curso
+llm_session: ContextVar[str] = ContextVar("llm_session", default="-")
+llm_priority: ContextVar[str] = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Parsea LLM_RATE_LIMITS ("modelo=rpm/tpm,..."); 0 = sin límite.
+
+    Returns:
+        {modelo: (requests_por_minuto, tokens_por_minuto)}
+    """
+    limits = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        model, _, rates = entry.partition("=")
+        rpm, _, tpm = rates.partition("/")
+        try:
+            limits[model.strip()] = (float(rpm or 0), float(tpm or 0))
+        except ValueError:
+            raise ValueError(f"Límite de LLM inválido: '{entry}' (formato modelo=rpm/tpm)")
+    return limits
+
+
+class TokenBucket:
+    """Token bucket con recarga continua; `per_minute=0` no limita."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta poder consumir `amount` (0 = ya)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        """Descuenta `amount` (negativo devuelve); puede quedar en deuda."""
+        if self.unlimited:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+    def drain(self):
+        """Vacía el bucket (el provider respondió 429)."""
+        if not self.unlimited:
+            self._refill()
+            self.level = min(self.level, 0.0)
+
+
+class ModelLimits:
+    """Buckets de requests y tokens por minuto de un modelo."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.throttled = 0
+        self.rate_limited = 0
+
+    def wait_time(self, tokens: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "rpm": self.requests.per_minute or None,
+            "tpm": self.tokens.per_minute or None,
+            "requests_available": None if self.requests.unlimited else round(self.requests.level, 1),
+            "tokens_available": None if self.tokens.unlimited else round(self.tokens.level),
+            "throttled": self.throttled,
+            "rate_limited_429": self.rate_limited,
+        }
+
+
+class Ticket:
+    """Una llamada esperando (o usando) un turno."""
+
+    def __init__(self, model: str, tokens: int, session: str, priority: str):
+        self.model = model
+        self.tokens = tokens
+        self.session = session
+        self.priority = priority
+        self.enqueued = time.perf_counter()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.throttled = False
+
+
+class LLMScheduler:
+    """Cola central de llamadas al LLM."""
+
+    def __init__(self):
+        self.max_concurrency = settings.llm_max_concurrency
+        self.expected_output_tokens = settings.llm_expected_output_tokens
+        self.rate_limits = parse_rate_limits(settings.llm_rate_limits)
+        self.models: Dict[str, ModelLimits] = {}
+        self.in_flight = 0
+
+        # prioridad → sesión → tickets en orden de llegada (round robin entre sesiones)
+        self._queues: Dict[str, "OrderedDict[str, Deque[Ticket]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # Métricas
+        self.granted = {priority: 0 for priority in PRIORITIES}
+        self.total_wait = {priority: 0.0 for priority in PRIORITIES}
+        self.recent_waits: Dict[str, Deque[float]] = {priority: deque(maxlen=256) for priority in PRIORITIES}
+        self.max_depth = 0
+
+    def _limits(self, model: str) -> ModelLimits:
+        if model not in self.models:
+            rpm, tpm = self.rate_limits.get(model, (0.0, 0.0))
+            self.models[model] = ModelLimits(rpm, tpm)
+        return self.models[model]
+
+    def estimate_tokens(self, prompt: str) -> int:
+        """Tokens a reservar: prompt (~4 caracteres por token) + salida esperada."""
+        return len(prompt) // 4 + self.expected_output_tokens
+
+    @property
+    def depth(self) -> int:
+        return sum(len(tickets) for queue in self._queues.values() for tickets in queue.values())
+
+    async def acquire(self, model: str, tokens: int) -> Ticket:
+        """
+        Espera un turno para llamar a `model` con ~`tokens` tokens.
+        Cancelable: si se cancela en la cola, sale de ella sin consumir nada.
+        """
+        priority = llm_priority.get()
+        ticket = Ticket(model, tokens, llm_session.get(), priority if priority in PRIORITIES else INTERACTIVE)
+        self._queues[ticket.priority].setdefault(ticket.session, deque()).append(ticket)
+        self.max_depth = max(self.max_depth, self.depth)
+        self._dispatch()
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Se otorgó el turno justo antes de cancelar: devolverlo
+                self.release(ticket, used_tokens=0)
+            else:
+                self._remove(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket, used_tokens: Optional[int] = None, rate_limited: bool = False):
+        """
+        Devuelve el turno. Corrige el bucket de tokens con el uso real
+        (`used_tokens`) y si el provider respondió 429 vacía los buckets del modelo.
+        """
+        self.in_flight -= 1
+        limits = self._limits(ticket.model)
+        if used_tokens is not None:
+            limits.tokens.consume(used_tokens - ticket.tokens)
+        if rate_limited:
+            limits.rate_limited += 1
+            limits.requests.drain()
+            limits.tokens.drain()
+        self._dispatch()
+
+    def promote(self, session: str):
+        """Pasa a interactivas las llamadas en cola de background de la sesión."""
+        tickets = self._queues[BACKGROUND].pop(session, None)
+        if not tickets:
+            return
+        for ticket in tickets:
+            ticket.priority = INTERACTIVE
+        self._queues[INTERACTIVE].setdefault(session, deque()).extend(tickets)
+        self._dispatch()
+
+    def _remove(self, ticket: Ticket):
+        queue = self._queues[ticket.priority]
+        tickets = queue.get(ticket.session)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del queue[ticket.session]
+        self._dispatch()
+
+    @staticmethod
+    def _head(queue: "OrderedDict[str, Deque[Ticket]]", session: str) -> Optional[Ticket]:
+        """
+        Primer ticket vivo de la sesión. Un ticket cuya tarea se canceló tiene el
+        future cancelado antes de que acquire() lo saque de la cola: se descarta.
+        """
+        tickets = queue[session]
+        while tickets and tickets[0].future.done():
+            tickets.popleft()
+        if not tickets:
+            del queue[session]
+            return None
+        return tickets[0]
+
+    def _dispatch(self):
+        """Otorga turnos mientras haya concurrencia y cupo en los buckets."""
+        retry_in: Optional[float] = None
+
+        while self.in_flight < self.max_concurrency:
+            granted = False
+            # Modelos con una llamada de mayor prioridad esperando cupo: las de
+            # menor prioridad de ese modelo no le pueden ganar el bucket
+            reserved: Set[str] = set()
+            for priority in PRIORITIES:
+                queue = self._queues[priority]
+                throttled: Set[str] = set()
+                for session in list(queue):
+                    ticket = self._head(queue, session)
+                    if ticket is None or ticket.model in reserved:
+                        continue
+                    limits = self._limits(ticket.model)
+                    wait = limits.wait_time(ticket.tokens)
+                    if wait > 0:
+                        if not ticket.throttled:
+                            ticket.throttled = True
+                            limits.throttled += 1
+                        throttled.add(ticket.model)
+                        retry_in = wait if retry_in is None else min(retry_in, wait)
+                        continue
+                    self._grant(ticket)
+                    granted = True
+                    break
+                # Background solo corre si ninguna interactiva pudo salir (p.ej.
+                # todas esperan el rate limit de su modelo), y no con esos modelos
+                if granted:
+                    break
+                reserved |= throttled
+            if not granted:
+                break
+
+        if retry_in is not None and self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(retry_in, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _grant(self, ticket: Ticket):
+        queue = self._queues[ticket.priority]
+        tickets = queue[ticket.session]
+        tickets.popleft()
+        if tickets:
+            queue.move_to_end(ticket.session)
+        else:
+            del queue[ticket.session]
+
+        limits = self._limits(ticket.model)
+        limits.requests.consume(1)
+        limits.tokens.consume(ticket.tokens)
+        self.in_flight += 1
+
+        waited = time.perf_counter() - ticket.enqueued
+        self.granted[ticket.priority] += 1
+        self.total_wait[ticket.priority] += waited
+        self.recent_waits[ticket.priority].append(waited)
+        ticket.future.set_result(None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Profundidad de cola, tiempos de espera (ms) y estado de los buckets."""
+        waits = {}
+        for priority in PRIORITIES:
+            ordered = sorted(self.recent_waits[priority])
+            p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))] if ordered else None
+            granted = self.granted[priority]
+            waits[priority] = {
+                "granted": granted,
+                "queued": sum(len(t) for t in self._queues[priority].values()),
+                "avg_wait_ms": round(self.total_wait[priority] / granted * 1000, 2) if granted else None,
+                "p95_wait_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "priorities": waits,
+            "models": {model: limits.get_metrics() for model, limits in self.models.items()},
+        }
+
+
+# Instancia global del scheduler
+llm_scheduler = LLMScheduler()
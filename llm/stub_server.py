@@ -0,0 +1,233 @@
+"""
+Servidor local compatible con /v1/chat/completions de OpenAI para pruebas.
+
+Responde sin red ni API key con heurísticas simples (extracción de filtros por
+function calling, SQL a partir de los filtros del prompt, mensajes fijos) y
+permite simular latencia, picos lentos y errores para probar hedging,
+circuit breakers y deadlines del gateway.
+
+Uso:
+    python -m llm.stub_server --port 9100 --delay 0.05 --slow-rate 0.1 --error-rate 0.05
+    LLM_BACKENDS=stub=stub-model@http://127.0.0.1:9100/v1
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import unicodedata
+from typing import Dict, Any, Optional
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+
+
+app = FastAPI(title="LLM stub", docs_url=None, redoc_url=None)
+
+# Comportamiento simulado (se ajusta desde la línea de comandos)
+behavior = {
+    "delay": 0.05,
+    "slow_rate": 0.0,
+    "slow_delay": 3.0,
+    "error_rate": 0.0,
+}
+
+# Filtro → (columna SQL, operador)
+SQL_COLUMNS = {
+    "distrito": ("e.distrito", "="),
+    "area_min": ("p.area", ">="),
+    "estado_propiedad": ("p.estado", "="),
+    "monto_maximo": ("p.valor_comercial", "<="),
+    "dormitorios": ("p.dormitorios", "="),
+    "banios": ("p.banios", "="),
+    "permite_mascotas": ("p.permite_mascotas", "="),
+    "balcon": ("p.balcon", "="),
+    "terraza": ("p.terraza", "="),
+    "amoblado": ("p.amoblado", "="),
+}
+
+NUMBER_WORDS = {"un": 1, "uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5}
+
+
+def _plain(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _count(value: str) -> int:
+    return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+
+def extract_filters(message: str) -> Dict[str, Any]:
+    """Extracción heurística de filtros desde el mensaje del usuario."""
+    text = _plain(message)
+    filters: Dict[str, Any] = {}
+    count = r"(\d+|un|uno|una|dos|tres|cuatro|cinco)"
+
+    match = re.search(r"\ben ([a-z]+(?: (?!de\b|del\b|con\b|y\b|para\b|que\b)[a-z]+)?)", text)
+    if match and match.group(1) not in ("construccion", "planos"):
+        filters["distrito"] = match.group(1).title()
+
+    match = re.search(r"(\d+(?:\.\d+)?)\s*(?:m2|m²|metros)", text)
+    if match:
+        filters["area_min"] = float(match.group(1))
+
+    match = re.search(rf"{count}\s*(?:dormitorios?|cuartos?|habitacion(?:es)?)", text)
+    if match:
+        filters["dormitorios"] = _count(match.group(1))
+
+    match = re.search(rf"{count}\s*banos?", text)
+    if match:
+        filters["banios"] = _count(match.group(1))
+
+    match = re.search(r"(\d+(?:\.\d+)?)\s*(k|mil)\b", text) or re.search(r"\b(\d{5,})\b", text)
+    if match:
+        multiplier = 1000 if len(match.groups()) > 1 and match.group(2) else 1
+        filters["monto_maximo"] = float(match.group(1)) * multiplier
+
+    if "plano" in text:
+        filters["estado_propiedad"] = "PLANOS"
+    elif "construccion" in text:
+        filters["estado_propiedad"] = "CONSTRUCCIÓN"
+    elif "terminad" in text:
+        filters["estado_propiedad"] = "TERMINADO"
+
+    for keyword, name in (("mascota", "permite_mascotas"), ("pet", "permite_mascotas"),
+                          ("balcon", "balcon"), ("terraza", "terraza"), ("amoblad", "amoblado")):
+        if keyword in text:
+            filters[name] = f"sin {keyword}" not in text
+
+    return filters
+
+
+def _sql_literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def generate_sql(prompt: str) -> str:
+    """SELECT armado con los filtros que aparecen en el prompt."""
+    schema_match = re.search(r"(\w+)\.propiedad", prompt)
+    schema = schema_match.group(1) if schema_match else "property_infrastructure"
+
+    filters: Dict[str, Any] = {}
+    match = re.search(r"Filtros(?: del usuario| de búsqueda)?:?\s*(\{.*?\})\s*(?:\n\n|\n[A-Z#]|$)", prompt, re.S | re.I)
+    if match:
+        try:
+            filters = json.loads(match.group(1))
+        except json.JSONDecodeError:
+            filters = {}
+
+    conditions = [
+        f"{SQL_COLUMNS[name][0]} {SQL_COLUMNS[name][1]} {_sql_literal(value)}"
+        for name, value in filters.items() if name in SQL_COLUMNS
+    ]
+    where = ("\nWHERE " + "\n    AND ".join(conditions)) if conditions else ""
+    return (
+        "SELECT p.*, e.nombre AS edificio_nombre, e.direccion AS edificio_direccion, "
+        "e.distrito AS edificio_distrito\n"
+        f"FROM {schema}.propiedad p\n"
+        f"JOIN {schema}.edificio e ON p.edificio_id = e.id{where}\n"
+        "LIMIT 5"
+    )
+
+
+def reply_text(prompt: str) -> str:
+    """Respuesta de texto según el tipo de prompt."""
+    if "SELECT" in prompt:
+        return generate_sql(prompt)
+
+    match = re.search(r"Filtro que falta: (\w+)", prompt)
+    if match:
+        return f"¿Me indicas tu preferencia de {match.group(1).replace('_', ' ')}?"
+
+    match = re.search(r"encontradas: (\d+)", prompt)
+    if match:
+        count = int(match.group(1))
+        if count == 0:
+            return "No encontré propiedades con esos criterios. ¿Quieres ajustar algún filtro?"
+        return f"¡Encontré {count} propiedades que cumplen tus criterios! Mira los detalles abajo."
+
+    return "Perfecto, tengo la información básica. ¿Quieres agregar algún filtro adicional o buscamos así?"
+
+
+def _user_message(prompt: str) -> str:
+    match = re.search(r'Mensaje(?: del usuario)?: "(.*)"', prompt)
+    return match.group(1) if match else prompt
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = "\n".join(str(m.get("content") or "") for m in body.get("messages", []))
+
+    delay = behavior["delay"]
+    if random.random() < behavior["slow_rate"]:
+        delay = behavior["slow_delay"]
+    await asyncio.sleep(delay)
+
+    if random.random() < behavior["error_rate"]:
+        raise HTTPException(status_code=503, detail="stub: error simulado")
+
+    tools = body.get("tools") or []
+    message: Dict[str, Any] = {"role": "assistant", "content": None}
+    if tools:
+        message["tool_calls"] = [{
+            "id": f"call_{int(time.time() * 1000)}",
+            "type": "function",
+            "function": {
+                "name": tools[0]["function"]["name"],
+                "arguments": json.dumps(extract_filters(_user_message(prompt)), ensure_ascii=False),
+            },
+        }]
+        finish_reason = "tool_calls"
+        completion = message["tool_calls"][0]["function"]["arguments"]
+    else:
+        message["content"] = reply_text(prompt)
+        finish_reason = "stop"
+        completion = message["content"]
+
+    prompt_tokens, completion_tokens = _tokens(prompt), _tokens(completion)
+    return {
+        "id": f"chatcmpl-stub-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Servidor LLM local compatible con OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--delay", type=float, default=0.05, help="Latencia base por request (s)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fracción de requests lentos")
+    parser.add_argument("--slow-delay", type=float, default=3.0, help="Latencia de un request lento (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de requests con 503")
+    args = parser.parse_args(argv)
+
+    behavior.update(
+        delay=args.delay,
+        slow_rate=args.slow_rate,
+        slow_delay=args.slow_delay,
+        error_rate=args.error_rate,
+    )
+    print(f"🧪 LLM stub en http://{args.host}:{args.port}/v1 ({behavior})")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
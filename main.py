@@ -2,10 +2,14 @@
 FastAPI Application - Real Estate Chatbot
 Ejecutar con: python main.py
 """
+import asyncio
+import hmac
+import json
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
 
 from models.settings import settings
@@ -13,20 +17,83 @@ from models.schemas import (
     ChatRequest,
     ChatResponse,
     PropertiesListResponse,
-    PropertyResponse,
-    PropertyFiltersResponse,
+    SavedSearchResponse,
+    SavedSearchListResponse,
     ErrorResponse
 )
+from models.serialization import FastJSONResponse, dumps, chat_payload, properties_list_payload
 from pipeline import (
     process_user_message,
     get_session_state,
     reset_session,
     session_manager
 )
-from db import db
+from db import db, QueryRejectedError
+from tools.speculative_search import speculative_search
+from tools.llm_speculation import llm_speculation
+from prompts.compiler import prompt_compiler
+from llm import llm_gateway, llm_scheduler, llm_cassette
+from tools.request_budget import request_tracker
+from tools.district_resolver import district_resolver
+from tools.saved_searches import saved_searches
+from tools.export import search_export, MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from tools.ingest import inventory_ingest, IngestError, FORMATS as INGEST_FORMATS
+from tools.audit_log import audit_log
 import uuid
 
 
+# Cada cuánto se verifica si el cliente de /chat sigue conectado (segundos)
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+async def run_while_connected(http_request: Request, coro):
+    """
+    Ejecuta `coro` y lo cancela si el cliente se desconecta antes de que termine
+    (las llamadas al LLM y queries en curso se cancelan con él).
+    
+    Returns:
+        (terminó, resultado)
+    """
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return True, task.result()
+            if await http_request.is_disconnected():
+                print("🔌 Cliente desconectado, cancelando procesamiento")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return False, None
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+# Los clientes siempre revalidan con If-None-Match (el estado cambia con cada mensaje)
+CACHE_CONTROL = "private, no-cache"
+
+
+def session_etag(kind: str, state) -> str:
+    """ETag débil derivado de la versión del estado de la sesión."""
+    return f'W/"{kind}-{state.version}"'
+
+
+def etag_matches(http_request: Request, etag: str) -> bool:
+    """¿El If-None-Match del request incluye `etag`? (comparación débil)"""
+    header = http_request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
 # ============================================================================
 # LIFESPAN - Manejo de startup/shutdown
 # ============================================================================
@@ -46,6 +113,22 @@ async def lifespan(app: FastAPI):
         await db.connect()
         await db.test_connection()
         print("✅ Base de datos conectada")
+        
+        # Cargar catálogo del schema una sola vez (se recarga solo si cambia)
+        await db.catalog.load()
+        db.catalog.start()
+        
+        # Vista materializada de búsqueda (opcional) y su refresco periódico
+        await db.search_view.start()
+        
+        # Invalidación de caches por cambios de inventario (LISTEN/NOTIFY)
+        db.change_feed.start()
+        
+        # Búsquedas guardadas: índice en memoria + evaluación de propiedades nuevas
+        await saved_searches.start()
+        
+        # Auditoría de conversaciones: cola en memoria + escritura por lotes
+        audit_log.start()
     except Exception as e:
         print(f"❌ Error conectando a base de datos: {e}")
         raise
@@ -62,9 +145,19 @@ async def lifespan(app: FastAPI):
     print("🛑 APAGANDO APLICACIÓN")
     print("="*70)
     
+    # Turnos auditados pendientes antes de cerrar el pool
+    await audit_log.stop()
+    
     # Desconectar base de datos
+    await db.catalog.stop()
+    await saved_searches.stop()
+    await db.change_feed.stop()
+    await db.search_view.stop()
     await db.disconnect()
     print("✅ Base de datos desconectada")
+    
+    # Respuestas del LLM grabadas (solo con LLM_CASSETTE_MODE=record)
+    llm_cassette.save()
     print("="*70 + "\n")
 
 
@@ -76,7 +169,8 @@ app = FastAPI(
     title="Real Estate Chatbot API",
     description="API para chatbot de búsqueda de propiedades inmobiliarias",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # ============================================================================
@@ -89,8 +183,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Compresión gzip de responses grandes (listas de propiedades, info de sesión)
+app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_minimum_size)
+
 
 # ============================================================================
 # ENDPOINTS
@@ -130,8 +228,37 @@ async def health_check():
     }
 
 
+@app.get("/metrics", tags=["Health"])
+async def get_metrics():
+    """
+    Métricas internas para monitoring (latencia por nodo de base de datos,
+    uso del LLM por conversación completada, búsquedas especulativas,
+    llamadas al LLM en paralelo, tiempo solapado por turno, tokens y latencia
+    por versión de prompt, hedging/fallback y circuit breakers por backend de
+    LLM, cola y rate limits del scheduler de LLM, requests cortados por
+    deadline o desconexión del cliente y el trabajo desperdiciado,
+    resoluciones del índice de distritos y evaluación de búsquedas guardadas).
+    """
+    return {
+        "database": db.get_metrics(),
+        "conversations": session_manager.get_llm_usage_report(),
+        "turns": session_manager.get_turn_timing_report(),
+        "speculative_search": speculative_search.get_metrics(),
+        "llm_speculation": llm_speculation.get_metrics(),
+        "prompts": prompt_compiler.get_report(),
+        "llm": llm_gateway.get_metrics(),
+        "llm_scheduler": llm_scheduler.get_metrics(),
+        "requests": request_tracker.get_metrics(),
+        "districts": district_resolver.get_metrics(),
+        "saved_searches": saved_searches.get_metrics(),
+        "export": search_export.get_metrics(),
+        "ingest": inventory_ingest.get_metrics(),
+        "audit_log": audit_log.get_metrics()
+    }
+
+
 @app.post("/chat", response_model=ChatResponse, tags=["Chat"])
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Endpoint principal del chat.
     Recibe mensaje del usuario y retorna respuesta del agente.
@@ -156,53 +283,22 @@ async def chat(request: ChatRequest):
         print(f"📝 Message: {request.message[:100]}...")
         print(f"{'='*70}")
         
-        # Procesar mensaje
-        state = await process_user_message(session_id, request.message)
-        
-        # Obtener última respuesta del asistente
-        assistant_response = None
-        for msg in reversed(state.messages):
-            if msg.get("role") == "assistant":
-                assistant_response = msg.get("content")
-                break
-        
-        if not assistant_response:
-            assistant_response = "Lo siento, no pude procesar tu mensaje. ¿Puedes intentar de nuevo?"
-        
-        # Construir response con filtros
-        filters_response = PropertyFiltersResponse(
-            distrito=state.filters.distrito,
-            area_min=state.filters.area_min,
-            estado_propiedad=state.filters.estado_propiedad,
-            monto_maximo=state.filters.monto_maximo,
-            dormitorios=state.filters.dormitorios,
-            permite_mascotas=state.filters.permite_mascotas,
-            balcon=state.filters.balcon,
-            terraza=state.filters.terraza,
-            amoblado=state.filters.amoblado,
-            banios=state.filters.banios,
-            essential_count=state.filters.count_essential_filters(),
-            optional_count=state.filters.count_optional_filters(),
-            is_complete=state.filters.is_complete()
+        # Procesar mensaje (se cancela si el cliente se va)
+        completed, state = await run_while_connected(
+            http_request,
+            process_user_message(session_id, request.message)
         )
+        if not completed:
+            # 499: el cliente cerró la conexión antes de la respuesta (nadie la recibe)
+            return JSONResponse(status_code=499, content={"detail": "Cliente desconectado"})
         
-        # Contar propiedades si ya se ejecutó la búsqueda
-        properties_count = None
-        if state.query_results is not None:
-            properties_count = len(state.query_results)
-        
-        response = ChatResponse(
-            session_id=session_id,
-            response=assistant_response,
-            filters=filters_response,
-            ready_to_search=state.ready_to_search,
-            properties_found=properties_count
-        )
+        payload = chat_payload(session_id, state)
         
-        print(f"✅ Response generado - {len(assistant_response)} chars")
-        print(f"📊 Filtros: {filters_response.essential_count}/5 esenciales")
+        print(f"✅ Response generado - {len(payload['response'])} chars")
+        print(f"📊 Filtros: {payload['filters']['essential_count']}/5 esenciales")
         
-        return response
+        # Payload armado desde el estado: sin re-validar contra response_model
+        return FastJSONResponse(payload)
         
     except Exception as e:
         print(f"❌ Error en /chat: {e}")
@@ -212,11 +308,89 @@ async def chat(request: ChatRequest):
         )
 
 
+@app.websocket("/ws/{session_id}")
+async def chat_ws(websocket: WebSocket, session_id: str):
+    """
+    Canal de chat persistente de una sesión.
+    
+    El cliente envía {"message": "..."} y el servidor empuja, apenas están listos:
+        - {"type": "filters", "filters": {...}}: filtros actualizados tras la extracción
+        - {"type": "properties", "count": N, "properties": [...]}: resultados de la búsqueda
+        - {"type": "message", ...ChatResponse}: respuesta del asistente (fin del turno)
+        - {"type": "error", "detail": "..."}
+    
+    Los mensajes se procesan en orden; si el cliente se desconecta a mitad de
+    un turno, el turno se cancela.
+    """
+    if len(session_id) > 200:
+        await websocket.close(code=1008, reason="session_id demasiado largo")
+        return
+    
+    await websocket.accept()
+    print(f"🔌 WebSocket conectado - Session: {session_id[:8]}...")
+    
+    inbox: asyncio.Queue = asyncio.Queue()
+    
+    async def send_event(event: dict):
+        await websocket.send_text(dumps(event).decode("utf-8"))
+    
+    async def read_messages():
+        try:
+            while True:
+                await inbox.put(await websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+    
+    reader = asyncio.create_task(read_messages())
+    try:
+        while True:
+            # Esperar el próximo mensaje (o la desconexión)
+            next_message = asyncio.create_task(inbox.get())
+            await asyncio.wait({next_message, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_message.done():
+                next_message.cancel()
+                break
+            
+            try:
+                message = json.loads(next_message.result()).get("message", "").strip()
+            except (ValueError, AttributeError):
+                message = ""
+            if not message:
+                await send_event({"type": "error", "detail": "Se esperaba {\"message\": \"...\"}"})
+                continue
+            
+            turn = asyncio.create_task(
+                process_user_message(session_id, message, on_event=send_event)
+            )
+            await asyncio.wait({turn, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if not turn.done():
+                # Cliente desconectado a mitad del turno
+                turn.cancel()
+                await asyncio.gather(turn, return_exceptions=True)
+                break
+            
+            try:
+                state = turn.result()
+                event = {"type": "message", **chat_payload(session_id, state)}
+            except Exception as e:
+                print(f"❌ Error en /ws: {e}")
+                event = {"type": "error", "detail": f"Error procesando mensaje: {e}"}
+            await send_event(event)
+    
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        print(f"🔌 WebSocket desconectado - Session: {session_id[:8]}...")
+
+
 @app.get("/properties/{session_id}", response_model=PropertiesListResponse, tags=["Properties"])
-async def get_properties(session_id: str):
+async def get_properties(session_id: str, http_request: Request):
     """
     Obtiene las propiedades encontradas para una sesión.
     Solo retorna datos si ya se ejecutó la búsqueda.
+    Responde 304 sin reconstruir nada si el If-None-Match coincide con el
+    ETag (versión del estado de la sesión).
     
     Args:
         session_id: ID de la sesión
@@ -232,6 +406,10 @@ async def get_properties(session_id: str):
         # Obtener estado de la sesión
         state = get_session_state(session_id)
         
+        etag = session_etag("properties", state)
+        if etag_matches(http_request, etag):
+            return not_modified(etag)
+        
         # Verificar que se haya ejecutado la búsqueda
         if not state.query_executed:
             raise HTTPException(
@@ -245,58 +423,12 @@ async def get_properties(session_id: str):
                 detail="No hay resultados disponibles."
             )
         
-        # Convertir resultados a PropertyResponse
-        properties = []
-        for prop in state.query_results:
-            property_response = PropertyResponse(
-                id=str(prop.get("id")),
-                numero=prop.get("numero"),
-                piso=prop.get("piso"),
-                tipo=prop.get("tipo"),
-                area=prop.get("area"),
-                dormitorios=prop.get("dormitorios"),
-                banios=prop.get("banios"),
-                balcon=prop.get("balcon", False),
-                terraza=prop.get("terraza", False),
-                amoblado=prop.get("amoblado", False),
-                permite_mascotas=prop.get("permite_mascotas", False),
-                valor_comercial=prop.get("valor_comercial"),
-                mantenimiento_mensual=prop.get("mantenimiento_mensual"),
-                estado=prop.get("estado"),
-                edificio_nombre=prop.get("edificio_nombre"),
-                edificio_direccion=prop.get("edificio_direccion"),
-                edificio_distrito=prop.get("edificio_distrito")
-            )
-            properties.append(property_response)
-        
-        # Construir filtros usados
-        filters_response = PropertyFiltersResponse(
-            distrito=state.filters.distrito,
-            area_min=state.filters.area_min,
-            estado_propiedad=state.filters.estado_propiedad,
-            monto_maximo=state.filters.monto_maximo,
-            dormitorios=state.filters.dormitorios,
-            permite_mascotas=state.filters.permite_mascotas,
-            balcon=state.filters.balcon,
-            terraza=state.filters.terraza,
-            amoblado=state.filters.amoblado,
-            banios=state.filters.banios,
-            essential_count=state.filters.count_essential_filters(),
-            optional_count=state.filters.count_optional_filters(),
-            is_complete=state.filters.is_complete()
-        )
-        
-        response = PropertiesListResponse(
-            session_id=session_id,
-            count=len(properties),
-            properties=properties,
-            filters_used=filters_response,
-            sql_query=state.generated_sql  # Para debug
-        )
+        # Payload con la forma de PropertiesListResponse, sin modelos por fila
+        payload = properties_list_payload(session_id, state)
         
-        print(f"✅ Retornando {len(properties)} propiedades")
+        print(f"✅ Retornando {payload['count']} propiedades")
         
-        return response
+        return FastJSONResponse(payload, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
         
     except HTTPException:
         raise
@@ -309,9 +441,10 @@ async def get_properties(session_id: str):
 
 
 @app.get("/session/{session_id}", tags=["Session"])
-async def get_session_info(session_id: str):
+async def get_session_info(session_id: str, http_request: Request):
     """
     Obtiene información de una sesión (útil para debugging).
+    Soporta GET condicional con ETag igual que /properties.
     
     Args:
         session_id: ID de la sesión
@@ -320,15 +453,20 @@ async def get_session_info(session_id: str):
         Información del estado de la sesión
     """
     try:
-        info = session_manager.get_session_info(session_id)
+        state = session_manager.find_session(session_id)
         
-        if info is None:
+        if state is None:
             raise HTTPException(
                 status_code=404,
                 detail="Sesión no encontrada"
             )
         
-        return info
+        etag = session_etag("session", state)
+        if etag_matches(http_request, etag):
+            return not_modified(etag)
+        
+        info = session_manager.get_session_info(session_id)
+        return FastJSONResponse(info, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
         
     except HTTPException:
         raise
@@ -365,6 +503,148 @@ async def reset_session_endpoint(session_id: str):
         )
 
 
+@app.post("/saved-searches/{session_id}", response_model=SavedSearchResponse, tags=["Saved Searches"])
+async def save_search(session_id: str):
+    """
+    Guarda los filtros actuales de la sesión como búsqueda guardada: cada
+    propiedad nueva o actualizada que los cumpla queda registrada como
+    coincidencia pendiente.
+    
+    Args:
+        session_id: ID de la sesión cuyos filtros se guardan
+    """
+    if not saved_searches.enabled:
+        raise HTTPException(status_code=503, detail="Búsquedas guardadas deshabilitadas")
+    
+    state = session_manager.find_session(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    
+    filters = state.filters.model_dump(exclude_none=True)
+    try:
+        search_id = await saved_searches.save(session_id, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error en /saved-searches: {e}")
+        raise HTTPException(status_code=500, detail=f"Error guardando búsqueda: {str(e)}")
+    
+    return {"id": search_id, "session_id": session_id, "filters": filters, "pending_matches": []}
+
+
+@app.get("/saved-searches/{session_id}", response_model=SavedSearchListResponse, tags=["Saved Searches"])
+async def list_saved_searches(session_id: str):
+    """
+    Búsquedas guardadas activas de la sesión con las propiedades nuevas que
+    coinciden y aún no se entregaron.
+    """
+    if not saved_searches.enabled:
+        raise HTTPException(status_code=503, detail="Búsquedas guardadas deshabilitadas")
+    
+    try:
+        searches = await saved_searches.list_for_session(session_id)
+    except Exception as e:
+        print(f"❌ Error en /saved-searches: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo búsquedas guardadas: {str(e)}")
+    
+    for search in searches:
+        search["session_id"] = session_id
+    return {"session_id": session_id, "count": len(searches), "saved_searches": searches}
+
+
+@app.delete("/saved-searches/{session_id}/{search_id}", tags=["Saved Searches"])
+async def delete_saved_search(session_id: str, search_id: int):
+    """
+    Desactiva una búsqueda guardada de la sesión.
+    """
+    if not saved_searches.enabled:
+        raise HTTPException(status_code=503, detail="Búsquedas guardadas deshabilitadas")
+    
+    if not await saved_searches.delete(session_id, search_id):
+        raise HTTPException(status_code=404, detail="Búsqueda guardada no encontrada")
+    
+    return {
+        "message": "Búsqueda guardada eliminada",
+        "session_id": session_id,
+        "id": search_id
+    }
+
+
+@app.get("/export/{session_id}", tags=["Export"])
+async def export_results(session_id: str, format: str = "csv"):
+    """
+    Exporta todas las propiedades que cumplen los filtros de la sesión
+    (no solo las mostradas en el chat) como CSV o NDJSON, en streaming.
+    
+    Args:
+        session_id: ID de la sesión cuyos filtros se exportan
+        format: "csv" (default) o "ndjson"
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format}")
+    
+    state = session_manager.find_session(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    
+    if not state.filters.is_complete():
+        missing = ", ".join(state.filters.get_missing_essential_filters())
+        raise HTTPException(status_code=400, detail=f"Faltan filtros esenciales: {missing}")
+    
+    filters = state.filters.model_dump(exclude_none=True)
+    try:
+        chunks = await search_export.open(filters, format)
+    except QueryRejectedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error en /export: {e}")
+        raise HTTPException(status_code=500, detail=f"Error exportando propiedades: {str(e)}")
+    
+    filename = f"propiedades-{session_id[:8]}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store"
+        }
+    )
+
+
+@app.post("/ingest", tags=["Ingest"])
+async def ingest_inventory(http_request: Request, format: str = "csv"):
+    """
+    Carga un feed de inventario (body CSV o NDJSON) en propiedad/edificio.
+    El body se lee en streaming y se carga por lotes; requiere
+    `Authorization: Bearer <INGEST_API_TOKEN>`.
+    
+    Args:
+        format: "csv" (default) o "ndjson"
+        
+    Returns:
+        Reporte de la carga (filas, insertadas, actualizadas, filas/min)
+    """
+    if not inventory_ingest.api_token:
+        raise HTTPException(status_code=503, detail="Ingesta deshabilitada (INGEST_API_TOKEN vacío)")
+    
+    authorization = http_request.headers.get("authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {inventory_ingest.api_token}".encode()):
+        raise HTTPException(status_code=401, detail="Token de ingesta inválido")
+    
+    if format not in INGEST_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format}")
+    
+    try:
+        return await inventory_ingest.ingest(http_request.stream(), format)
+    except QueryRejectedError:
+        raise HTTPException(status_code=409, detail="Ya hay una ingesta en curso")
+    except IngestError as e:
+        raise HTTPException(
+            status_code=400 if e.client_error else 500,
+            detail={"error": str(e), "report": e.report}
+        )
+
+
 @app.get("/sessions/active", tags=["Session"])
 async def get_active_sessions():
     """
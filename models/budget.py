@@ -0,0 +1,45 @@
+"""
+Presupuesto de tiempo del request en curso (contextvar).
+
+Módulo neutral: lo leen el gateway de LLM y la capa de base de datos para
+acotar sus timeouts, sin depender de tools/ (ver tools/request_budget.py para
+el tracker de resultados y la política de reintentos).
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+
+class RequestDeadlineExceeded(Exception):
+    """El request agotó su presupuesto de tiempo."""
+
+
+class RequestBudget:
+    """Deadline y trabajo realizado (llamadas al LLM, queries) de un request."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.started = time.perf_counter()
+        self.llm_calls = 0
+        self.llm_tokens = 0
+        self.db_queries = 0
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+
+current_budget: ContextVar[Optional[RequestBudget]] = ContextVar("current_budget", default=None)
+
+
+def remaining_budget() -> Optional[float]:
+    """Segundos restantes del request en curso (None = sin deadline)."""
+    budget = current_budget.get()
+    return budget.remaining() if budget is not None else None
@@ -160,6 +160,25 @@ class PropertiesListResponse(BaseModel):
         }
 
 
+class SavedSearchResponse(BaseModel):
+    """Búsqueda guardada de una sesión"""
+    id: int = Field(..., description="ID de la búsqueda guardada")
+    session_id: str
+    filters: Dict[str, Any] = Field(..., description="Filtros suscritos")
+    created_at: Optional[datetime] = None
+    pending_matches: List[str] = Field(
+        default_factory=list,
+        description="IDs de propiedades nuevas que coinciden, aún sin entregar"
+    )
+
+
+class SavedSearchListResponse(BaseModel):
+    """Búsquedas guardadas activas de una sesión"""
+    session_id: str
+    count: int
+    saved_searches: List[SavedSearchResponse]
+
+
 class ErrorResponse(BaseModel):
     """Response para errores"""
     error: str = Field(..., description="Mensaje de error")
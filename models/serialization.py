@@ -0,0 +1,117 @@
+"""
+Serialización rápida de responses de la API.
+
+Los endpoints calientes (/chat, /properties, WebSocket) arman los payloads
+como dicts directamente desde el estado (con las formas de los schemas
+precalculadas) y los codifican con orjson, sin construir modelos pydantic
+por fila ni volver a validar contra `response_model`: los datos vienen del
+propio estado del agente. Los schemas de models/schemas.py siguen
+documentando la API en OpenAPI.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List
+from uuid import UUID
+from fastapi.responses import JSONResponse
+from models.state import AgentState, PropertyFilters
+from models.schemas import PropertyResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+
+# Formas precalculadas (orden de campos de los schemas)
+FILTER_FIELDS = tuple(PropertyFilters.model_fields)
+PROPERTY_FIELDS = tuple(name for name in PropertyResponse.model_fields if name != "id")
+PROPERTY_BOOL_FIELDS = frozenset(
+    name for name, field in PropertyResponse.model_fields.items() if field.annotation is bool
+)
+
+
+def _default(value: Any) -> Any:
+    """Tipos que vienen de asyncpg y el encoder no conoce."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON en bytes (orjson si está instalado)."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(content: Any) -> Any:
+    """JSON desde bytes o str (orjson si está instalado)."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse codificado con orjson (con fallback a json)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def filters_payload(filters: PropertyFilters) -> Dict[str, Any]:
+    """Mismo contenido que PropertyFiltersResponse, sin validar."""
+    payload = {name: getattr(filters, name) for name in FILTER_FIELDS}
+    payload["essential_count"] = filters.count_essential_filters()
+    payload["optional_count"] = filters.count_optional_filters()
+    payload["is_complete"] = filters.is_complete()
+    return payload
+
+
+def property_payload(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Mismo contenido que PropertyResponse, sin validar."""
+    payload = {"id": str(row.get("id"))}
+    for name in PROPERTY_FIELDS:
+        value = row.get(name)
+        payload[name] = bool(value) if name in PROPERTY_BOOL_FIELDS else value
+    return payload
+
+
+def properties_payload_list(state: AgentState) -> List[Dict[str, Any]]:
+    return [property_payload(row) for row in state.query_results or []]
+
+
+def chat_payload(session_id: str, state: AgentState) -> Dict[str, Any]:
+    """Payload de ChatResponse: último mensaje del asistente + filtros."""
+    assistant_response = None
+    for msg in reversed(state.messages):
+        if msg.get("role") == "assistant":
+            assistant_response = msg.get("content")
+            break
+
+    if not assistant_response:
+        assistant_response = "Lo siento, no pude procesar tu mensaje. ¿Puedes intentar de nuevo?"
+
+    return {
+        "session_id": session_id,
+        "response": assistant_response,
+        "filters": filters_payload(state.filters),
+        "ready_to_search": state.ready_to_search,
+        "properties_found": len(state.query_results) if state.query_results is not None else None,
+    }
+
+
+def properties_list_payload(session_id: str, state: AgentState) -> Dict[str, Any]:
+    """Payload de PropertiesListResponse."""
+    properties = properties_payload_list(state)
+    return {
+        "session_id": session_id,
+        "count": len(properties),
+        "properties": properties,
+        "filters_used": filters_payload(state.filters),
+        "sql_query": state.generated_sql,  # Para debug
+    }
@@ -18,6 +18,10 @@ class Settings(BaseSettings):
     openai_api_key: str = Field(..., description="OpenAI API key")
     openai_model: str = Field(default="gpt-4o-mini", description="Modelo de OpenAI a usar")
     openai_temperature: float = Field(default=0, description="Temperatura del modelo")
+    prompt_version: str = Field(
+        default="full",
+        description="Versión de prompts: 'full' (originales, default) o 'compact' (minimizados, opt-in)"
+    )
     
     # === PostgreSQL Database ===
     database_url: str = Field(
@@ -34,10 +38,270 @@ class Settings(BaseSettings):
     db_pool_max_size: int = Field(default=20, description="Tamaño máximo del pool")
     db_command_timeout: int = Field(default=60, description="Timeout para comandos en segundos")
     
+    # Límites para búsquedas generadas por el LLM (clase "search")
+    db_search_statement_timeout_ms: int = Field(
+        default=5000,
+        description="statement_timeout por transacción para búsquedas (ms)"
+    )
+    db_search_max_concurrency: int = Field(
+        default=8,
+        description="Búsquedas simultáneas permitidas (debe ser menor a db_pool_max_size)"
+    )
+    db_search_queue_timeout: float = Field(
+        default=2.0,
+        description="Segundos que una búsqueda espera cupo antes de descartarse"
+    )
+    db_explain_statement_timeout_ms: int = Field(
+        default=1000,
+        description="statement_timeout para el EXPLAIN previo a una búsqueda (ms)"
+    )
+    db_export_statement_timeout_ms: int = Field(
+        default=120000,
+        description="statement_timeout de una exportación completa (/export, ms)"
+    )
+    db_export_max_concurrency: int = Field(
+        default=2,
+        description="Exportaciones simultáneas (cada una retiene una conexión del pool)"
+    )
+    db_ingest_statement_timeout_ms: int = Field(
+        default=60000,
+        description="statement_timeout de cada lote de ingesta (COPY + upserts, ms)"
+    )
+    
+    # Réplicas de lectura (búsquedas de solo lectura)
+    database_replica_urls: str = Field(
+        default="",
+        description="Connection strings de réplicas de solo lectura, separados por coma"
+    )
+    db_replica_max_lag_seconds: float = Field(
+        default=5.0,
+        description="Lag máximo de una réplica antes de volver al primario"
+    )
+    db_replica_check_interval: float = Field(
+        default=10.0,
+        description="Segundos entre chequeos de lag de las réplicas"
+    )
+    
+    # Catálogo del schema (columnas, estados, distritos)
+    schema_catalog_check_interval: float = Field(
+        default=60.0,
+        description="Segundos entre verificaciones de la huella del catálogo"
+    )
+    schema_catalog_values_interval: float = Field(
+        default=300.0,
+        description="Segundos entre recargas de distritos (sin change feed conectado) y estados sin enum"
+    )
+    district_aliases: str = Field(
+        default="surco=Santiago de Surco,sjl=San Juan de Lurigancho,sjm=San Juan de Miraflores,"
+                "smp=San Martín de Porres,cercado=Lima,cercado de lima=Lima",
+        description="Alias de distritos 'alias=Distrito' separados por coma (solo aplican si el distrito existe)"
+    )
+    district_match_threshold: float = Field(
+        default=0.55,
+        description="Similitud mínima de trigramas para aceptar un distrito aproximado"
+    )
+    
+    # Vista materializada de búsqueda (db/migrations/001_search_view.sql)
+    search_view_enabled: bool = Field(
+        default=False,
+        description="Buscar sobre la vista materializada propiedad_busqueda cuando esté fresca"
+    )
+    search_view_refresh_interval: float = Field(
+        default=30.0,
+        description="Segundos entre chequeos de cambios (y refresco si hubo) de la vista"
+    )
+    search_view_max_staleness: float = Field(
+        default=120.0,
+        description="Atraso máximo tolerado antes de volver a buscar sobre las tablas base"
+    )
+    search_view_refresh_timeout_ms: int = Field(
+        default=60000,
+        description="statement_timeout del REFRESH de la vista (ms)"
+    )
+    
+    # Change feed de inventario (db/migrations/002_change_feed.sql)
+    change_feed_enabled: bool = Field(
+        default=False,
+        description="Escuchar NOTIFY de cambios en propiedad/edificio para invalidar caches"
+    )
+    change_feed_keepalive_interval: float = Field(
+        default=15.0,
+        description="Segundos entre pings de la conexión de LISTEN"
+    )
+    change_feed_retention: float = Field(
+        default=86400.0,
+        description="Segundos que se guardan los cambios para ponerse al día tras reconectar"
+    )
+    change_feed_max_reconnect_delay: float = Field(
+        default=30.0,
+        description="Espera máxima entre reintentos de conexión del change feed"
+    )
+    
+    # Búsquedas guardadas (db/migrations/003_saved_searches.sql)
+    saved_searches_enabled: bool = Field(
+        default=False,
+        description="Guardar filtros como suscripción y evaluar propiedades nuevas (requiere change feed)"
+    )
+    saved_searches_max_per_session: int = Field(
+        default=10,
+        description="Máximo de búsquedas guardadas activas por sesión"
+    )
+    saved_searches_queue_size: int = Field(
+        default=1000,
+        description="Cambios en cola para evaluar; con la cola llena se descartan y se releen del registro"
+    )
+    
+    # Exportación de resultados (/export/{session_id})
+    export_max_rows: int = Field(
+        default=100000,
+        description="Máximo de filas por exportación"
+    )
+    export_fetch_size: int = Field(
+        default=500,
+        description="Filas que trae cada vuelta del cursor de servidor (NDJSON)"
+    )
+    export_buffer_chunks: int = Field(
+        default=16,
+        description="Bloques de COPY en memoria antes de frenar la lectura (CSV)"
+    )
+    
+    # Ingesta de inventario (POST /ingest, python -m tools.ingest)
+    ingest_api_token: str = Field(
+        default="",
+        description="Token Bearer requerido por POST /ingest (vacío = endpoint deshabilitado)"
+    )
+    ingest_batch_size: int = Field(
+        default=5000,
+        description="Filas por lote (una transacción: COPY a staging + upsert)"
+    )
+    
+    # Auditoría de conversaciones (db/migrations/004_conversation_audit.sql)
+    audit_log_enabled: bool = Field(
+        default=False,
+        description="Registrar cada turno en conversation_audit (escritura por lotes en background)"
+    )
+    audit_log_queue_size: int = Field(
+        default=10000,
+        description="Turnos en memoria pendientes de escribir"
+    )
+    audit_log_batch_size: int = Field(
+        default=500,
+        description="Turnos por COPY"
+    )
+    audit_log_flush_interval: float = Field(
+        default=2.0,
+        description="Segundos máximos que un turno espera a que se complete su lote"
+    )
+    audit_log_overflow: str = Field(
+        default="drop",
+        description="Cola llena: 'drop' (descartar el turno) o 'block' (esperar lugar hasta AUDIT_LOG_BLOCK_TIMEOUT)"
+    )
+    audit_log_block_timeout: float = Field(
+        default=0.05,
+        description="Segundos que un turno espera lugar en la cola con overflow=block"
+    )
+    audit_log_shutdown_timeout: float = Field(
+        default=5.0,
+        description="Segundos para escribir los turnos pendientes al apagar"
+    )
+    
     # === Configuración del Agente ===
     max_optional_filters: int = Field(default=3, description="Máximo de filtros opcionales")
     properties_limit: int = Field(default=5, description="Límite de propiedades a retornar")
     
+    # === Validación de SQL generado ===
+    sql_max_plan_cost: float = Field(
+        default=100000.0,
+        description="Costo máximo estimado por EXPLAIN para ejecutar un query"
+    )
+    sql_max_offset: int = Field(
+        default=100,
+        description="OFFSET máximo permitido en el SQL generado (mayor se rechaza)"
+    )
+    sql_validation_cache_size: int = Field(
+        default=512,
+        description="Cantidad de validaciones cacheadas por huella de query"
+    )
+    
+    # === Búsqueda especulativa ===
+    speculative_search_enabled: bool = Field(
+        default=True,
+        description="Ejecutar la búsqueda con esenciales mientras se pregunta por opcionales"
+    )
+    speculative_candidate_limit: int = Field(
+        default=200,
+        description="Máximo de candidatos guardados para filtrar opcionales en memoria"
+    )
+    speculative_search_ttl: float = Field(
+        default=300.0,
+        description="Segundos de validez de un resultado especulativo"
+    )
+    speculative_search_live_ttl: float = Field(
+        default=3600.0,
+        description="Validez de un resultado especulativo mientras el change feed está conectado"
+    )
+    
+    # === LLM Gateway ===
+    llm_backends: str = Field(
+        default="",
+        description="Backends de LLM 'nombre=modelo[@base_url]' separados por coma (vacío = OPENAI_MODEL)"
+    )
+    llm_cheap_backends: str = Field(
+        default="",
+        description="Backends en orden de preferencia para tareas simples (vacío = todos)"
+    )
+    llm_strong_backends: str = Field(
+        default="",
+        description="Backends en orden de preferencia para generar/corregir SQL (vacío = todos)"
+    )
+    llm_request_timeout: float = Field(default=30.0, description="Deadline en segundos por llamada al LLM")
+    llm_hedge_percentile: float = Field(
+        default=0.95,
+        description="Percentil de latencia del backend tras el cual se envía un request de respaldo"
+    )
+    llm_hedge_min_samples: int = Field(
+        default=20,
+        description="Muestras de latencia necesarias antes de usar el percentil"
+    )
+    llm_hedge_default_delay: float = Field(
+        default=3.0,
+        description="Segundos antes del request de respaldo mientras no hay muestras suficientes"
+    )
+    llm_max_concurrency: int = Field(default=8, description="Máximo de llamadas al LLM en curso a la vez")
+    llm_rate_limits: str = Field(
+        default="",
+        description="Límites por modelo 'modelo=rpm/tpm' separados por coma (0 o ausente = sin límite)"
+    )
+    llm_expected_output_tokens: int = Field(
+        default=256,
+        description="Tokens de salida reservados por llamada hasta conocer el uso real"
+    )
+    llm_breaker_window: int = Field(default=20, description="Llamadas recientes evaluadas por el circuit breaker")
+    llm_breaker_error_rate: float = Field(default=0.5, description="Tasa de errores que abre el circuito")
+    llm_breaker_cooldown: float = Field(default=30.0, description="Segundos con el circuito abierto antes de reintentar")
+    llm_cassette_mode: str = Field(
+        default="off",
+        description="Cassette de LLM: off | record (graba cada respuesta) | replay (sirve lo grabado, sin red)"
+    )
+    llm_cassette_path: str = Field(
+        default="benchmarks/cassettes/llm.json",
+        description="Archivo del cassette de LLM"
+    )
+    llm_cassette_latency_scale: float = Field(
+        default=1.0,
+        description="Factor sobre la latencia grabada en replay (0 = sin espera, solo CPU)"
+    )
+    
+    # === Presupuesto por request ===
+    chat_request_timeout: float = Field(
+        default=45.0,
+        description="Segundos máximos para responder un mensaje de /chat (LLM + base de datos)"
+    )
+    chat_retry_min_budget: float = Field(
+        default=8.0,
+        description="Segundos restantes mínimos para reintentar (p.ej. corregir el SQL con el LLM)"
+    )
+    
     # === Sesiones ===
     session_timeout: int = Field(default=3600, description="Timeout de sesión en segundos (1 hora)")
     
@@ -45,6 +309,10 @@ class Settings(BaseSettings):
     api_host: str = Field(default="0.0.0.0", description="Host de la API")
     api_port: int = Field(default=8000, description="Puerto de la API")
     api_reload: bool = Field(default=False, description="Auto-reload en desarrollo")
+    gzip_minimum_size: int = Field(
+        default=1000,
+        description="Tamaño mínimo en bytes de un response para comprimirlo con gzip"
+    )
     
     model_config = SettingsConfigDict(
         env_file=".env",
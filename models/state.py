@@ -11,17 +11,17 @@ class PropertyFilters(BaseModel):
     
     # === FILTROS ESENCIALES (5 requeridos) ===
     distrito: Optional[str] = Field(None, description="Distrito del edificio")
-    area_min: Optional[float] = Field(None, description="Área mínima en m2")
-    estado_propiedad: Optional[str] = Field(None, description="Estado: DISPONIBLE, OCUPADA, MANTENIMIENTO, VENDIDA")
-    monto_maximo: Optional[float] = Field(None, description="Presupuesto máximo")
-    dormitorios: Optional[int] = Field(None, description="Número de dormitorios")
+    area_min: Optional[float] = Field(None, gt=0, description="Área mínima en m2")
+    estado_propiedad: Optional[str] = Field(None, description="Estado del inmueble en MAYÚSCULAS: PLANOS, CONSTRUCCIÓN, TERMINADO")
+    monto_maximo: Optional[float] = Field(None, gt=0, description="Presupuesto máximo")
+    dormitorios: Optional[int] = Field(None, gt=0, description="Número de dormitorios")
     
     # === FILTROS OPCIONALES (máximo 3) ===
     permite_mascotas: Optional[bool] = Field(None, description="Pet-friendly")
     balcon: Optional[bool] = Field(None, description="Tiene balcón")
     terraza: Optional[bool] = Field(None, description="Tiene terraza")
     amoblado: Optional[bool] = Field(None, description="Está amoblado")
-    banios: Optional[int] = Field(None, description="Número de baños")
+    banios: Optional[int] = Field(None, gt=0, description="Número de baños")
     
     def count_essential_filters(self) -> int:
         """Cuenta cuántos filtros esenciales están completos."""
@@ -72,6 +72,10 @@ class AgentState(BaseModel):
     session_id: str = Field(..., description="ID único de la sesión")
     created_at: datetime = Field(default_factory=datetime.now)
     last_updated: datetime = Field(default_factory=datetime.now)
+    version: int = Field(
+        default=0,
+        description="Versión del estado (cambia con cada actualización de la sesión; base de los ETags)"
+    )
     
     # === Historial Conversacional ===
     messages: List[Dict[str, Any]] = Field(
@@ -102,6 +106,14 @@ class AgentState(BaseModel):
         default=False,
         description="Flag: ¿Listo para ejecutar búsqueda?"
     )
+    filters_extracted_this_turn: bool = Field(
+        default=False,
+        description="Flag: ¿extract_filters ya corrió en el turno actual?"
+    )
+    use_speculative_results: bool = Field(
+        default=False,
+        description="Flag: ¿execute_sql debe usar la búsqueda especulativa (sin generar SQL)?"
+    )
     
     # === SQL y Resultados ===
     generated_sql: Optional[str] = Field(None, description="SQL generado")
@@ -112,6 +124,30 @@ class AgentState(BaseModel):
         description="Resultados de la búsqueda (limit 5)"
     )
     
+    # === Métricas de LLM ===
+    llm_calls: Dict[str, int] = Field(
+        default_factory=dict,
+        description="Llamadas al LLM por nodo en esta conversación"
+    )
+    llm_calls_wasted: int = Field(
+        default=0,
+        description="Llamadas al LLM cuyo resultado no cambió el estado"
+    )
+    llm_calls_avoided: int = Field(
+        default=0,
+        description="Llamadas al LLM evitadas por el ruteo de entrada"
+    )
+    
+    # === Tiempos del turno actual ===
+    turn_timings: Dict[str, float] = Field(
+        default_factory=dict,
+        description="Duración (ms) de cada nodo y tarea en paralelo del último turno"
+    )
+    turn_wall_ms: Optional[float] = Field(
+        None,
+        description="Duración total (ms) del último turno"
+    )
+    
     # === Metadata ===
     current_node: Optional[str] = Field(None, description="Nodo actual del grafo")
     error_message: Optional[str] = Field(None, description="Mensaje de error si ocurre")
@@ -138,6 +174,26 @@ class AgentState(BaseModel):
         self.essential_filters_complete = self.filters.is_complete()
         self.last_updated = datetime.now()
     
+    def record_llm_call(self, node: str, wasted: bool = False):
+        """Registra una llamada al LLM hecha por un nodo."""
+        self.llm_calls[node] = self.llm_calls.get(node, 0) + 1
+        if wasted:
+            self.llm_calls_wasted += 1
+    
+    def record_timing(self, label: str, seconds: float):
+        """Acumula la duración de un nodo o tarea dentro del turno actual."""
+        self.turn_timings[label] = self.turn_timings.get(label, 0.0) + round(seconds * 1000, 2)
+    
+    def turn_overlap_ms(self) -> float:
+        """Tiempo de trabajo que corrió en paralelo (suma de tareas - tiempo total)."""
+        if self.turn_wall_ms is None:
+            return 0.0
+        return max(0.0, round(sum(self.turn_timings.values()) - self.turn_wall_ms, 2))
+    
+    def total_llm_calls(self) -> int:
+        """Total de llamadas al LLM en la conversación."""
+        return sum(self.llm_calls.values())
+    
     def get_next_missing_filter(self) -> Optional[str]:
         """Retorna el siguiente filtro esencial que falta."""
         missing = self.filters.get_missing_essential_filters()
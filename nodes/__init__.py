@@ -3,7 +3,7 @@ Nodos del StateGraph - Cada nodo maneja una parte del flujo conversacional
 """
 
 # Importar todos los nodos (se agregarán conforme los creemos)
-from nodes.receive_message import receive_message_node
+from nodes.receive_message import receive_message_node,route_after_receive_message
 from nodes.extract_filters import extract_filters_node
 from nodes.check_completion import check_completion_node,route_after_check_completion
 from nodes.ask_missing_filter import ask_missing_filter_node
@@ -13,9 +13,11 @@ from nodes.generate_sql import generate_sql_node
 from nodes.validate_sql import validate_sql_node,route_after_validate_sql
 from nodes.execute_sql import execute_sql_node
 from nodes.format_results import format_results_node
+from nodes.refine_search import refine_search_node,route_after_refine_search
 
 __all__ = [
     'receive_message_node',
+    'route_after_receive_message',
     'extract_filters_node',
     'check_completion_node',
     'route_after_check_completion',
@@ -28,4 +30,6 @@ __all__ = [
     'route_after_validate_sql',
     'execute_sql_node',
     'format_results_node',
+    'refine_search_node',
+    'route_after_refine_search',
 ]
\ No newline at end of file
@@ -7,7 +7,7 @@ from tools.property_tools import ask_for_additional_filters
 import json
 
 
-def ask_additional_filters_node(state: AgentState) -> AgentState:
+async def ask_additional_filters_node(state: AgentState) -> AgentState:
     """
     Genera un mensaje preguntando si el usuario quiere agregar filtros opcionales.
     Activa el flag awaiting_additional_filters_confirmation.
@@ -36,10 +36,11 @@ def ask_additional_filters_node(state: AgentState) -> AgentState:
     
     try:
         # Generar pregunta usando el tool
-        message = ask_for_additional_filters.invoke({
+        message = await ask_for_additional_filters.ainvoke({
             "current_filters_json": current_filters_json
         })
         
+        state.record_llm_call("ask_additional_filters")
         print(f"✅ Mensaje generado: {message}")
         
         # Agregar mensaje al historial
@@ -4,10 +4,11 @@ Genera pregunta para el siguiente filtro esencial faltante
 """
 from models.state import AgentState
 from tools.property_tools import generate_missing_filter_question
+from tools.llm_speculation import llm_speculation
 import json
 
 
-def ask_missing_filter_node(state: AgentState) -> AgentState:
+async def ask_missing_filter_node(state: AgentState) -> AgentState:
     """
     Genera una pregunta conversacional para solicitar el siguiente filtro faltante.
     Este nodo termina el flujo esperando respuesta del usuario.
@@ -39,12 +40,17 @@ def ask_missing_filter_node(state: AgentState) -> AgentState:
     current_filters_json = json.dumps(current_filters, ensure_ascii=False)
     
     try:
-        # Generar pregunta usando el tool
-        question = generate_missing_filter_question.invoke({
-            "missing_filter": next_missing,
-            "current_filters_json": current_filters_json
-        })
+        # Pregunta preparada en paralelo con la extracción (si se acertó el filtro)
+        question = await llm_speculation.take(state, "ask_missing_filter", next_missing)
         
+        if question is None:
+            # Generar pregunta usando el tool
+            question = await generate_missing_filter_question.ainvoke({
+                "missing_filter": next_missing,
+                "current_filters_json": current_filters_json
+            })
+            
+            state.record_llm_call("ask_missing_filter")
         print(f"✅ Pregunta generada: {question}")
         
         # Agregar pregunta al historial
@@ -3,10 +3,43 @@ Nodo: collect_optional_filters
 Maneja la recolección de filtros opcionales (máximo 3) y detecta cuando el usuario está listo
 """
 from models.state import AgentState
+from tools.speculative_search import speculative_search
 from typing import Literal
 import re
 
 
+# Frases con las que el usuario indica que no quiere más filtros
+PROCEED_KEYWORDS = [
+    "no", "suficiente", "búscalo", "buscalo", "busca",
+    "así está bien", "asi esta bien", "perfecto", "listo",
+    "ya", "eso es todo", "nada más", "nada mas"
+]
+
+# Palabras que pueden acompañar una confirmación sin aportar filtros
+_CONFIRMATION_WORDS = {
+    word for keyword in PROCEED_KEYWORDS for word in keyword.split()
+} | {
+    "ok", "okay", "dale", "sí", "si", "gracias", "por", "favor", "entonces",
+    "con", "eso", "así", "asi", "está", "esta", "bien", "todo", "es", "buscar",
+    "búscame", "buscame", "buscalos", "búscalos", "adelante", "porfa",
+}
+
+
+def wants_to_proceed(message: str) -> bool:
+    """¿El mensaje pide pasar a la búsqueda?"""
+    message = message.lower()
+    return any(keyword in message for keyword in PROCEED_KEYWORDS)
+
+
+def is_bare_confirmation(message: str) -> bool:
+    """
+    ¿El mensaje es solo un "búscalo"/"no, así está bien", sin ningún filtro?
+    Solo en ese caso se puede saltar la extracción ("con terraza, búscalo" no lo es).
+    """
+    words = re.findall(r"\w+", message.lower())
+    return wants_to_proceed(message) and bool(words) and all(word in _CONFIRMATION_WORDS for word in words)
+
+
 def collect_optional_filters_node(state: AgentState) -> AgentState:
     """
     Analiza la respuesta del usuario cuando está en modo de recolección de opcionales.
@@ -37,19 +70,12 @@ def collect_optional_filters_node(state: AgentState) -> AgentState:
     print(f"Analizando respuesta: '{last_message[:100]}...'")
     
     # Detectar si el usuario quiere proceder a la búsqueda
-    proceed_keywords = [
-        "no", "suficiente", "búscalo", "buscalo", "busca", 
-        "así está bien", "asi esta bien", "perfecto", "listo",
-        "ya", "eso es todo", "nada más", "nada mas"
-    ]
-    
-    wants_to_proceed = any(keyword in last_message for keyword in proceed_keywords)
-    
-    if wants_to_proceed:
+    if wants_to_proceed(last_message):
         print("✅ Usuario quiere proceder a la búsqueda")
         state.ready_to_search = True
         state.awaiting_additional_filters_confirmation = False
         state.collecting_optional_filters = False
+        _check_speculative(state)
         state.current_node = "collect_optional_filters"
         return state
     
@@ -68,6 +94,7 @@ def collect_optional_filters_node(state: AgentState) -> AgentState:
             "assistant", 
             "Entendido. Ya tienes 3 filtros adicionales, procederé con la búsqueda."
         )
+        _check_speculative(state)
     else:
         print(f"ℹ️ Puede agregar {3 - optional_count} filtros opcionales más")
         state.collecting_optional_filters = True
@@ -79,10 +106,23 @@ def collect_optional_filters_node(state: AgentState) -> AgentState:
     return state
 
 
-def route_after_collect_optional(state: AgentState) -> Literal["extract_filters", "generate_sql"]:
+def _check_speculative(state: AgentState):
+    """
+    Marca si hay una búsqueda especulativa vigente para los filtros actuales:
+    en ese caso se salta la generación/validación y execute_sql usa los
+    candidatos ya obtenidos.
+    """
+    filters = state.filters.model_dump(exclude_none=True)
+    state.use_speculative_results = speculative_search.is_available(state.session_id, filters)
+
+
+def route_after_collect_optional(
+    state: AgentState
+) -> Literal["extract_filters", "check_completion", "generate_sql", "execute_sql"]:
     """
     Función de routing después de collect_optional_filters.
     Decide si debe extraer más filtros o proceder a generar SQL.
+    Con state.use_speculative_results va directo a execute_sql.
     
     Args:
         state: Estado actual del agente
@@ -91,8 +131,15 @@ def route_after_collect_optional(state: AgentState) -> Literal["extract_filters"
         Nombre del siguiente nodo
     """
     if state.ready_to_search:
+        if state.use_speculative_results:
+            print("➡️ Routing: Búsqueda especulativa disponible → execute_sql")
+            return "execute_sql"
         print("➡️ Routing: Listo para búsqueda → generate_sql")
         return "generate_sql"
+    elif state.filters_extracted_this_turn:
+        # El mensaje ya pasó por extract_filters en este turno: no extraer dos veces
+        print("➡️ Routing: Filtros del mensaje ya extraídos → check_completion")
+        return "check_completion"
     else:
         print("➡️ Routing: Recolectando más filtros → extract_filters")
         return "extract_filters"
\ No newline at end of file
@@ -3,7 +3,13 @@ Nodo: execute_sql
 Ejecuta el SQL validado contra la base de datos PostgreSQL
 """
 from models.state import AgentState
+from models.settings import settings
+from db import db, QueryRejectedError
 from tools.sql_tools import execute_property_sql
+from tools.query_builder import render_search_query
+from tools.speculative_search import speculative_search, execute_filters_search
+from tools.request_budget import RequestDeadlineExceeded
+import asyncpg
 import json
 
 
@@ -12,6 +18,9 @@ async def execute_sql_node(state: AgentState) -> AgentState:
     Ejecuta la consulta SQL validada contra la base de datos.
     Guarda los resultados en state.query_results.
     
+    Con state.use_speculative_results (lo marca collect_optional_filters),
+    usa los candidatos ya obtenidos filtrando opcionales en memoria.
+    
     Args:
         state: Estado actual del agente
         
@@ -22,6 +31,10 @@ async def execute_sql_node(state: AgentState) -> AgentState:
     print(f"🚀 EXECUTE SQL NODE")
     print(f"{'='*60}")
     
+    if state.use_speculative_results:
+        state.use_speculative_results = False
+        return await _execute_speculative(state)
+    
     if not state.generated_sql:
         print("❌ No hay SQL para ejecutar")
         state.error_message = "No hay SQL generado"
@@ -97,4 +110,52 @@ async def execute_sql_node(state: AgentState) -> AgentState:
     # Actualizar metadata
     state.current_node = "execute_sql"
     
-    return state
\ No newline at end of file
+    return state
+
+
+async def _execute_speculative(state: AgentState) -> AgentState:
+    """
+    Resuelve la búsqueda con el resultado especulativo de la sesión.
+    Si no alcanza (candidatos truncados) ejecuta el query determinístico.
+    """
+    filters = state.filters.model_dump(exclude_none=True)
+    limit = settings.properties_limit
+    state.generated_sql = render_search_query(filters, limit, use_view=db.search_view.is_fresh)
+    state.sql_validated = True
+    
+    try:
+        properties = await speculative_search.get_results(state.session_id, filters, limit)
+        if properties is not None:
+            print(f"⚡ Resultado especulativo utilizado")
+        else:
+            print(f"🔁 Resultado especulativo no utilizable, ejecutando query directo")
+            properties = await execute_filters_search(filters, limit)
+        
+        print(f"📊 Propiedades encontradas: {len(properties)}")
+        state.query_results = properties
+        state.query_executed = True
+        
+    except QueryRejectedError as e:
+        print(f"🚫 Búsqueda rechazada: {e}")
+        state.error_message = f"Búsqueda rechazada por saturación: {e}"
+        state.query_executed = False
+        state.query_results = []
+    except asyncpg.QueryCanceledError as e:
+        print(f"⏱️ Búsqueda cancelada por timeout: {e}")
+        state.error_message = f"Búsqueda cancelada por timeout: {e}"
+        state.query_executed = False
+        state.query_results = []
+    except RequestDeadlineExceeded as e:
+        print(f"⌛ Tiempo de respuesta agotado: {e}")
+        state.error_message = f"Tiempo de respuesta agotado: {e}"
+        state.query_executed = False
+        state.query_results = []
+    except Exception as e:
+        print(f"❌ Error ejecutando SQL: {e}")
+        state.error_message = f"Error ejecutando SQL: {e}"
+        state.query_executed = False
+        state.query_results = []
+    
+    state.current_node = "execute_sql"
+    
+    return state
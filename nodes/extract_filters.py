@@ -3,11 +3,14 @@ Nodo: extract_filters
 Extrae filtros de búsqueda del mensaje del usuario usando LLM
 """
 from models.state import AgentState
-from tools.property_tools import extract_property_filters
+from tools.property_tools import extract_property_filters, generate_missing_filter_question
+from tools.llm_speculation import llm_speculation
+from tools.district_resolver import district_resolver
+from typing import Dict, Any
 import json
 
 
-def extract_filters_node(state: AgentState) -> AgentState:
+async def extract_filters_node(state: AgentState) -> AgentState:
     """
     Extrae filtros del último mensaje del usuario.
     Usa el tool extract_property_filters que emplea LLM para entender el mensaje.
@@ -35,6 +38,7 @@ def extract_filters_node(state: AgentState) -> AgentState:
         return state
     
     print(f"Mensaje a analizar: '{last_message[:100]}...'")
+    state.filters_extracted_this_turn = True
     
     # Preparar filtros actuales como JSON
     current_filters = state.filters.model_dump(exclude_none=True)
@@ -42,15 +46,23 @@ def extract_filters_node(state: AgentState) -> AgentState:
     
     print(f"Filtros actuales: {current_filters}")
     
+    # En paralelo con la extracción: preparar la pregunta del filtro que
+    # probablemente falte después (el usuario suele responder lo que se le preguntó)
+    predicted_missing = _predict_next_missing_filter(state)
+    if predicted_missing:
+        llm_speculation.start(
+            state,
+            "ask_missing_filter",
+            predicted_missing,
+            generate_missing_filter_question.ainvoke({
+                "missing_filter": predicted_missing,
+                "current_filters_json": current_filters_json
+            })
+        )
+    
     # Llamar al tool para extraer filtros
     try:
-        new_filters_json = extract_property_filters.invoke({
-            "user_message": last_message,
-            "current_filters_json": current_filters_json
-        })
-        
-        # Parse respuesta
-        new_filters = json.loads(new_filters_json)
+        new_filters = await extract_new_filters(state, last_message, current_filters_json)
         
         if new_filters:
             print(f"✅ Filtros extraídos: {new_filters}")
@@ -74,4 +86,44 @@ def extract_filters_node(state: AgentState) -> AgentState:
     # Actualizar metadata
     state.current_node = "extract_filters"
     
-    return state
\ No newline at end of file
+    return state
+
+
+async def extract_new_filters(state: AgentState, message: str, current_filters_json: str) -> Dict[str, Any]:
+    """
+    Extrae los filtros nuevos del mensaje (una llamada al LLM) con el distrito
+    ya traducido al valor de edificio.distrito.
+    
+    Raises:
+        json.JSONDecodeError si la respuesta del tool no es JSON
+    """
+    new_filters_json = await extract_property_filters.ainvoke({
+        "user_message": message,
+        "current_filters_json": current_filters_json
+    })
+    
+    # Parse respuesta
+    new_filters = json.loads(new_filters_json)
+    
+    # Una extracción sin filtros nuevos es una llamada desperdiciada
+    state.record_llm_call("extract_filters", wasted=not new_filters)
+    
+    # Distrito al valor exacto de edificio.distrito ("Surco" → "Santiago de Surco")
+    if new_filters.get("distrito"):
+        district = district_resolver.resolve(new_filters["distrito"])
+        if district and district != new_filters["distrito"]:
+            print(f"🗺️ Distrito normalizado: '{new_filters['distrito']}' → '{district}'")
+            new_filters["distrito"] = district
+        elif district is None and district_resolver.is_loaded:
+            print(f"⚠️ Distrito sin equivalente en el catálogo: '{new_filters['distrito']}'")
+    
+    return new_filters
+
+
+def _predict_next_missing_filter(state: AgentState):
+    """
+    Filtro esencial que faltará tras la extracción si el usuario responde
+    solo el filtro pendiente. None si no quedarían faltantes.
+    """
+    missing = state.filters.get_missing_essential_filters()
+    return missing[1] if len(missing) >= 2 else None
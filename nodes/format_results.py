@@ -4,10 +4,11 @@ Formatea los resultados de la búsqueda en un mensaje natural para el usuario
 """
 from models.state import AgentState
 from tools.property_tools import format_search_results_message
+from tools.llm_speculation import llm_speculation
 import json
 
 
-def format_results_node(state: AgentState) -> AgentState:
+async def format_results_node(state: AgentState) -> AgentState:
     """
     Genera un mensaje final con los resultados de la búsqueda.
     Maneja tanto casos exitosos como errores.
@@ -27,6 +28,9 @@ def format_results_node(state: AgentState) -> AgentState:
         print(f"⚠️ Hubo un error: {state.error_message}")
         
         error_messages = {
+            "Búsqueda rechazada por saturación": "Estamos recibiendo muchas búsquedas en este momento. Por favor, intenta de nuevo en unos segundos.",
+            "Búsqueda cancelada por timeout": "La búsqueda tardó demasiado. ¿Podrías hacer tus criterios un poco más específicos?",
+            "Tiempo de respuesta agotado": "La búsqueda está tardando más de lo normal. Por favor, intenta de nuevo en unos segundos.",
             "SQL inválido": "Lo siento, hubo un problema generando la búsqueda. ¿Podrías reformular tus criterios?",
             "Error ejecutando SQL": "Hubo un problema al buscar en la base de datos. Por favor, intenta de nuevo.",
             "No se generó SQL": "No pude generar la búsqueda. ¿Podrías proporcionar más detalles?"
@@ -57,12 +61,19 @@ def format_results_node(state: AgentState) -> AgentState:
         filters_json = json.dumps(all_filters, ensure_ascii=False)
         
         try:
-            # Generar mensaje usando el tool
-            message = format_search_results_message.invoke({
-                "filters_json": filters_json,
-                "properties_count": properties_count
-            })
+            # Mensaje generado en paralelo con el SQL (si se acertó la cantidad)
+            message = await llm_speculation.take(
+                state, "format_results", (filters_json, properties_count)
+            )
             
+            if message is None:
+                # Generar mensaje usando el tool
+                message = await format_search_results_message.ainvoke({
+                    "filters_json": filters_json,
+                    "properties_count": properties_count
+                })
+                
+                state.record_llm_call("format_results")
             print(f"✅ Mensaje generado: {message}")
             
             # Agregar mensaje al historial
@@ -91,6 +102,8 @@ def format_results_node(state: AgentState) -> AgentState:
     
     print(f"\n{'='*60}")
     print(f"✅ FLUJO COMPLETADO")
+    print(f"📈 Llamadas al LLM: {state.total_llm_calls()} "
+          f"(desperdiciadas: {state.llm_calls_wasted}, evitadas: {state.llm_calls_avoided})")
     print(f"{'='*60}\n")
     
     return state
\ No newline at end of file
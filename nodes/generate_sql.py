@@ -3,11 +3,14 @@ Nodo: generate_sql
 Genera la consulta SQL basada en los filtros recopilados
 """
 from models.state import AgentState
+from models.settings import settings
 from tools.sql_tools import generate_property_sql
+from tools.property_tools import format_search_results_message
+from tools.llm_speculation import llm_speculation
 import json
 
 
-def generate_sql_node(state: AgentState) -> AgentState:
+async def generate_sql_node(state: AgentState) -> AgentState:
     """
     Genera la consulta SQL SELECT para buscar propiedades.
     Usa el tool generate_property_sql que emplea LLM.
@@ -32,12 +35,27 @@ def generate_sql_node(state: AgentState) -> AgentState:
     # Convertir filtros a JSON
     filters_json = json.dumps(all_filters, ensure_ascii=False)
     
+    # En paralelo con generación/validación/ejecución: el mensaje final solo
+    # depende de los filtros y la cantidad; se apuesta por una página completa
+    expected_count = settings.properties_limit
+    llm_speculation.start(
+        state,
+        "format_results",
+        (filters_json, expected_count),
+        format_search_results_message.ainvoke({
+            "filters_json": filters_json,
+            "properties_count": expected_count
+        })
+    )
+    
     try:
         # Generar SQL usando el tool
-        sql_query = generate_property_sql.invoke({
+        sql_query = await generate_property_sql.ainvoke({
             "filters_json": filters_json
         })
         
+        state.record_llm_call("generate_sql")
+        
         print(f"\n✅ SQL Generado:")
         print(f"{'-'*60}")
         print(sql_query)
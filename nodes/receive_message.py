@@ -1,8 +1,10 @@
 """
 Nodo: receive_message
-Punto de entrada - Recibe el mensaje del usuario y lo agrega al state
+Punto de entrada - Recibe el mensaje del usuario y decide qué fase de la conversación retomar
 """
 from models.state import AgentState
+from nodes.collect_optional import is_bare_confirmation
+from typing import Literal
 
 
 def receive_message_node(state: AgentState) -> AgentState:
@@ -25,10 +27,65 @@ def receive_message_node(state: AgentState) -> AgentState:
         last_message = state.messages[-1]
         print(f"User: {last_message.get('content', '')[:100]}...")
     
+    state.filters_extracted_this_turn = False
+    state.use_speculative_results = False
+    
+    # Un "búscalo" sin filtros mientras esperamos la respuesta sobre opcionales
+    # entra directo a collect_optional_filters: la extracción no aportaría nada
+    if _skips_extraction(state):
+        state.llm_calls_avoided += 1
+        print("⏭️ Fase: confirmación de opcionales (se omite extracción)")
+    elif state.awaiting_additional_filters_confirmation:
+        print("⏭️ Fase: respuesta sobre opcionales con filtros (se extraen primero)")
+    elif _has_results(state):
+        print("⏭️ Fase: refinamiento de la búsqueda mostrada")
+    
     # Actualizar metadata
     state.current_node = "receive_message"
     
     print(f"✅ Mensaje recibido y procesado")
     print(f"Total mensajes en conversación: {len(state.messages)}")
     
-    return state
\ No newline at end of file
+    return state
+
+
+def _last_user_message(state: AgentState) -> str:
+    for msg in reversed(state.messages):
+        if msg.get("role") == "user":
+            return msg.get("content", "")
+    return ""
+
+
+def _skips_extraction(state: AgentState) -> bool:
+    """¿La respuesta sobre opcionales es una confirmación sin ningún filtro?"""
+    return state.awaiting_additional_filters_confirmation and is_bare_confirmation(_last_user_message(state))
+
+
+def _has_results(state: AgentState) -> bool:
+    """¿Ya se mostró una búsqueda? Los mensajes siguientes la refinan."""
+    return state.query_executed and state.query_results is not None and state.filters.is_complete()
+
+
+def route_after_receive_message(
+    state: AgentState
+) -> Literal["extract_filters", "collect_optional_filters", "refine_search"]:
+    """
+    Función de routing de entrada: retoma el grafo en el nodo que la fase
+    conversacional realmente necesita.
+    
+    Args:
+        state: Estado actual del agente
+        
+    Returns:
+        Nombre del siguiente nodo
+    """
+    if _skips_extraction(state):
+        print("➡️ Routing: Confirmación sin filtros → collect_optional_filters")
+        return "collect_optional_filters"
+    
+    if _has_results(state):
+        print("➡️ Routing: Búsqueda ya mostrada → refine_search")
+        return "refine_search"
+    
+    print("➡️ Routing: Recolectando filtros → extract_filters")
+    return "extract_filters"
\ No newline at end of file
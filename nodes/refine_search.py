@@ -0,0 +1,213 @@
+"""
+Nodo: refine_search
+Refinamiento de una búsqueda ya mostrada ("más barato", "con terraza", "en Miraflores")
+sin volver a generar/validar SQL
+"""
+from models.state import AgentState
+from models.settings import settings
+from db import db, QueryRejectedError
+from nodes.extract_filters import extract_new_filters
+from tools.query_builder import render_search_query, filter_rows, narrows
+from tools.speculative_search import speculative_search, execute_filters_search
+from tools.request_budget import RequestDeadlineExceeded
+from typing import Dict, Any, Literal, Optional
+import asyncpg
+import json
+import re
+
+
+# Ajuste de los pedidos relativos ("más barato" → 10% menos de presupuesto)
+RELATIVE_STEP = 0.10
+
+RELATIVE_PATTERNS = [
+    (re.compile(r"m[aá]s (?:barat|econ[oó]mic)|menos caro|menor precio"), "monto_maximo", 1 - RELATIVE_STEP),
+    (re.compile(r"m[aá]s car[oa]|m[aá]s presupuesto|mayor presupuesto"), "monto_maximo", 1 + RELATIVE_STEP),
+    (re.compile(r"m[aá]s (?:grande|amplio|espacio)"), "area_min", 1 + RELATIVE_STEP),
+    (re.compile(r"m[aá]s (?:peque|chic)"), "area_min", 1 - RELATIVE_STEP),
+]
+
+REFINE_HELP_MESSAGE = (
+    "¿Quieres ajustar la búsqueda? Puedo buscar más barato, más grande, "
+    "con terraza o en otro distrito, por ejemplo."
+)
+
+
+async def refine_search_node(state: AgentState) -> AgentState:
+    """
+    Aplica al resultado ya mostrado los cambios de filtros del último mensaje.
+
+    Una sola extracción (LLM) por turno. Si los filtros nuevos solo acotan la
+    búsqueda, el resultado sale de los candidatos en memoria (especulativos o
+    el resultado anterior completo); si la amplían se ejecuta un único query
+    determinístico.
+
+    Args:
+        state: Estado actual del agente (con una búsqueda ya ejecutada)
+
+    Returns:
+        Estado actualizado con filtros, resultados y mensaje
+    """
+    print(f"\n{'='*60}")
+    print(f"🎯 REFINE SEARCH NODE")
+    print(f"{'='*60}")
+
+    state.current_node = "refine_search"
+    state.error_message = None
+
+    last_message = next(
+        (msg.get("content", "") for msg in reversed(state.messages) if msg.get("role") == "user"), ""
+    )
+    previous = state.filters.model_dump(exclude_none=True)
+
+    try:
+        new_filters = await extract_new_filters(
+            state, last_message, json.dumps(previous, ensure_ascii=False)
+        )
+    except json.JSONDecodeError as e:
+        print(f"❌ Error parseando respuesta del tool: {e}")
+        new_filters = {}
+    new_filters.update(_relative_changes(last_message, previous, new_filters))
+
+    changes = {name: value for name, value in new_filters.items() if previous.get(name) != value}
+    if not changes:
+        print("ℹ️ El mensaje no cambia los filtros")
+        state.add_message("assistant", REFINE_HELP_MESSAGE)
+        return state
+
+    print(f"✅ Cambios de filtros: {changes}")
+    state.update_filters(**changes)
+    filters = state.filters.model_dump(exclude_none=True)
+    limit = settings.properties_limit
+
+    try:
+        properties = await _refined_results(state, filters, previous, limit)
+    except QueryRejectedError as e:
+        print(f"🚫 Búsqueda rechazada: {e}")
+        state.error_message = f"Búsqueda rechazada por saturación: {e}"
+    except asyncpg.QueryCanceledError as e:
+        print(f"⏱️ Búsqueda cancelada por timeout: {e}")
+        state.error_message = f"Búsqueda cancelada por timeout: {e}"
+    except RequestDeadlineExceeded as e:
+        print(f"⌛ Tiempo de respuesta agotado: {e}")
+        state.error_message = f"Tiempo de respuesta agotado: {e}"
+    except Exception as e:
+        print(f"❌ Error ejecutando SQL: {e}")
+        state.error_message = f"Error ejecutando SQL: {e}"
+
+    if state.error_message:
+        state.query_results = []
+        return state
+
+    state.generated_sql = render_search_query(filters, limit, use_view=db.search_view.is_fresh)
+    state.sql_validated = True
+    state.query_results = properties
+    state.query_executed = True
+
+    print(f"📊 Propiedades encontradas: {len(properties)}")
+    state.add_message("assistant", _refinement_message(changes, len(properties)))
+
+    return state
+
+
+async def _refined_results(
+    state: AgentState,
+    filters: Dict[str, Any],
+    previous: Dict[str, Any],
+    limit: int
+):
+    """Resultados para los filtros refinados, consultando solo si hace falta."""
+    # Candidatos especulativos de la sesión que cubren los filtros nuevos
+    if speculative_search.is_available(state.session_id, filters):
+        properties = await speculative_search.get_results(state.session_id, filters, limit)
+        if properties is not None:
+            print("⚡ Refinamiento resuelto sobre los candidatos especulativos")
+            speculative_search.record_refinement(local=True)
+            return properties
+
+    # Resultado anterior completo (menos filas que el límite) y filtros más estrictos
+    previous_results = state.query_results or []
+    if narrows(filters, previous) and len(previous_results) < limit:
+        print("⚡ Refinamiento resuelto sobre el resultado anterior")
+        speculative_search.record_refinement(local=True)
+        return filter_rows(previous_results, filters, limit)
+
+    # La búsqueda se amplió: un query con los esenciales nuevos (candidatos
+    # para los próximos refinamientos) y opcionales en memoria
+    print("🔁 La búsqueda se amplió, ejecutando query")
+    speculative_search.record_refinement(local=False)
+    if speculative_search.start(state.session_id, filters):
+        properties = await speculative_search.get_results(state.session_id, filters, limit)
+        if properties is not None:
+            return properties
+    return await execute_filters_search(filters, limit)
+
+
+def _relative_changes(message: str, previous: Dict[str, Any], extracted: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cambios relativos a los filtros actuales ("más barato", "más grande") que
+    la extracción no resolvió a un valor nuevo.
+    """
+    text = message.lower()
+    changes = {}
+    for pattern, name, factor in RELATIVE_PATTERNS:
+        current = previous.get(name)
+        if current is None or extracted.get(name, current) != current or not pattern.search(text):
+            continue
+        if name == "monto_maximo":
+            changes[name] = float(round(current * factor, -3))
+        else:
+            changes[name] = round(current * factor, 1)
+    return changes
+
+
+def _describe_change(name: str, value: Any) -> Optional[str]:
+    amenities = {
+        "permite_mascotas": ("que acepte mascotas", "sin mascotas"),
+        "balcon": ("con balcón", "sin balcón"),
+        "terraza": ("con terraza", "sin terraza"),
+        "amoblado": ("amoblado", "sin amoblar"),
+    }
+    if name in amenities:
+        return amenities[name][0 if value else 1]
+    if name == "area_min":
+        return f"desde {value:g} m²"
+    if name == "monto_maximo":
+        return f"hasta {value:,.0f}"
+    descriptions = {
+        "distrito": "en {}",
+        "estado_propiedad": "en estado {}",
+        "dormitorios": "de {} dormitorios",
+        "banios": "con {} baños",
+    }
+    return descriptions[name].format(value) if name in descriptions else None
+
+
+def _refinement_message(changes: Dict[str, Any], count: int) -> str:
+    """Mensaje del refinamiento sin llamar al LLM."""
+    description = ", ".join(
+        text for text in (_describe_change(name, value) for name, value in changes.items()) if text
+    )
+    if count == 0:
+        return f"No encontré propiedades {description}. ¿Quieres ajustar otro criterio?"
+    if count == 1:
+        return f"Ajusté la búsqueda ({description}): encontré 1 departamento."
+    return f"Ajusté la búsqueda ({description}): encontré {count} departamentos."
+
+
+def route_after_refine_search(state: AgentState) -> Literal["format_results", "end"]:
+    """
+    Función de routing después de refine_search: los errores se formatean
+    en format_results, el resto del turno ya está respondido.
+
+    Args:
+        state: Estado actual del agente
+
+    Returns:
+        Nombre del siguiente nodo
+    """
+    if state.error_message:
+        print("➡️ Routing: Error en el refinamiento → format_results")
+        return "format_results"
+
+    print("➡️ Routing: Refinamiento respondido → END")
+    return "end"
@@ -4,14 +4,18 @@ Valida la seguridad del SQL generado y lo corrige si falla
 """
 from models.state import AgentState
 from tools.sql_tools import validate_sql_query, fix_sql_error
+from tools.sql_validator import sql_validator
+from tools.request_budget import has_retry_budget
 from typing import Literal
 import json
 
 
-def validate_sql_node(state: AgentState) -> AgentState:
+async def validate_sql_node(state: AgentState) -> AgentState:
     """
     Valida el SQL generado por seguridad y sintaxis.
-    Si falla, intenta corregirlo (máximo 3 intentos).
+    Si falla, intenta corregirlo (máximo 3 intentos, mientras quede presupuesto
+    de tiempo en el request).
+    Un query válido pero demasiado costoso (según EXPLAIN) se rechaza sin reintentos.
     
     Args:
         state: Estado actual del agente
@@ -45,6 +49,25 @@ def validate_sql_node(state: AgentState) -> AgentState:
             
             validation_result = json.loads(validation_result_json)
             
+            # Guarda de costo: solo si pasó la validación del AST
+            if validation_result.get("valid"):
+                cost_result = await sql_validator.check_cost(validation_result["clean_query"])
+                
+                if cost_result.get("cost") is not None:
+                    print(f"💰 Costo estimado: {cost_result['cost']:.0f}")
+                
+                if not cost_result.get("allowed"):
+                    cost_error = cost_result.get("error", "Query rechazado por costo")
+                    
+                    if cost_error.startswith("Query demasiado costoso"):
+                        # Corregir no baja el costo de filtros legítimos: no reintentar
+                        print(f"❌ {cost_error}")
+                        state.sql_validated = False
+                        state.error_message = f"SQL inválido: {cost_error}"
+                        break
+                    
+                    validation_result = {"valid": False, "error": cost_error}
+            
             if validation_result.get("valid"):
                 print("✅ SQL validado exitosamente")
                 
@@ -63,6 +86,13 @@ def validate_sql_node(state: AgentState) -> AgentState:
                 error_msg = validation_result.get("error", "Error desconocido")
                 print(f"❌ Validación falló: {error_msg}")
                 
+                if attempt < max_attempts and not has_retry_budget():
+                    # Sin margen para otra llamada al LLM: cortar el loop de corrección
+                    print(f"⌛ Sin tiempo para corregir el SQL")
+                    state.sql_validated = False
+                    state.error_message = f"Tiempo de respuesta agotado: {error_msg}"
+                    break
+                
                 if attempt < max_attempts:
                     print(f"🔧 Intentando corregir SQL...")
                     
@@ -71,12 +101,13 @@ def validate_sql_node(state: AgentState) -> AgentState:
                     filters_json = json.dumps(all_filters, ensure_ascii=False)
                     
                     # Intentar corregir
-                    fixed_sql = fix_sql_error.invoke({
+                    fixed_sql = await fix_sql_error.ainvoke({
                         "original_query": state.generated_sql,
                         "error_message": error_msg,
                         "filters_json": filters_json
                     })
                     
+                    state.record_llm_call("fix_sql")
                     print(f"SQL corregido generado")
                     state.generated_sql = fixed_sql
                     attempt += 1
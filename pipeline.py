@@ -4,8 +4,10 @@ Define el StateGraph con todos los nodos y maneja sesiones en memoria
 """
 from langgraph.graph import StateGraph, END
 from models.state import AgentState
+from models.serialization import filters_payload, properties_payload_list
 from nodes import (
     receive_message_node,
+    route_after_receive_message,
     extract_filters_node,
     check_completion_node,
     route_after_check_completion,
@@ -18,9 +20,22 @@ from nodes import (
     route_after_validate_sql,
     execute_sql_node,
     format_results_node,
+    refine_search_node,
+    route_after_refine_search,
 )
-from typing import Dict
+from tools.speculative_search import speculative_search
+from tools.llm_speculation import llm_speculation
+from llm.scheduler import llm_session
+from tools.request_budget import request_tracker, RequestBudget
+from tools.audit_log import audit_log
+from models.settings import settings
+from typing import Dict, Any, Callable, Optional, Awaitable
+from contextvars import ContextVar
 from datetime import datetime, timedelta
+import asyncio
+import inspect
+import itertools
+import time
 import uuid
 
 
@@ -28,6 +43,68 @@ import uuid
 # DEFINICIÓN DEL GRAFO
 # ============================================================================
 
+# Receptor de eventos del turno en curso (p.ej. el WebSocket de la sesión).
+# Recibe dicts {"type": ..., ...} apenas cada parte de la respuesta está lista.
+turn_listener: ContextVar[Optional[Callable[[Dict[str, Any]], Awaitable[None]]]] = ContextVar(
+    "turn_listener", default=None
+)
+
+
+def filters_event(state: AgentState) -> Dict[str, Any]:
+    return {
+        "type": "filters",
+        "filters": filters_payload(state.filters)
+    }
+
+
+def properties_event(state: AgentState) -> Dict[str, Any]:
+    properties = properties_payload_list(state)
+    return {
+        "type": "properties",
+        "count": len(properties),
+        "properties": properties
+    }
+
+
+async def emit_node_events(name: str, state: AgentState):
+    """Empuja al receptor del turno lo que el nodo `name` dejó listo."""
+    listener = turn_listener.get()
+    if listener is None:
+        return
+    
+    events = []
+    if name in ("extract_filters", "collect_optional_filters", "refine_search"):
+        events.append(filters_event(state))
+    if name in ("execute_sql", "refine_search") and state.query_executed:
+        events.append(properties_event(state))
+    
+    for event in events:
+        try:
+            await listener(event)
+        except Exception as e:
+            # Un cliente que no recibe eventos no debe cortar el turno
+            print(f"⚠️ No se pudo enviar el evento '{event['type']}': {e}")
+            return
+
+
+def timed_node(name: str, node: Callable) -> Callable:
+    """
+    Envuelve un nodo (sync o async) para registrar su duración en
+    state.turn_timings y empujar su resultado al receptor del turno.
+    """
+    async def run(state: AgentState) -> AgentState:
+        start = time.perf_counter()
+        result = node(state)
+        if inspect.isawaitable(result):
+            result = await result
+        result.record_timing(name, time.perf_counter() - start)
+        await emit_node_events(name, result)
+        return result
+    
+    run.__name__ = getattr(node, "__name__", name)
+    return run
+
+
 def create_property_search_graph():
     """
     Crea y compila el StateGraph para búsqueda de propiedades.
@@ -41,22 +118,22 @@ def create_property_search_graph():
     workflow = StateGraph(AgentState)
     
     # ========== AGREGAR NODOS ==========
-    workflow.add_node("receive_message", receive_message_node)
-    workflow.add_node("extract_filters", extract_filters_node)
-    workflow.add_node("check_completion", check_completion_node)
-    workflow.add_node("ask_missing_filter", ask_missing_filter_node)
-    workflow.add_node("ask_additional_filters", ask_additional_filters_node)
-    workflow.add_node("collect_optional_filters", collect_optional_filters_node)
-    workflow.add_node("generate_sql", generate_sql_node)
-    workflow.add_node("validate_sql", validate_sql_node)
-    workflow.add_node("execute_sql", execute_sql_node)
-    workflow.add_node("format_results", format_results_node)
+    workflow.add_node("receive_message", timed_node("receive_message", receive_message_node))
+    workflow.add_node("extract_filters", timed_node("extract_filters", extract_filters_node))
+    workflow.add_node("check_completion", timed_node("check_completion", check_completion_node))
+    workflow.add_node("ask_missing_filter", timed_node("ask_missing_filter", ask_missing_filter_node))
+    workflow.add_node("ask_additional_filters", timed_node("ask_additional_filters", ask_additional_filters_node))
+    workflow.add_node("collect_optional_filters", timed_node("collect_optional_filters", collect_optional_filters_node))
+    workflow.add_node("generate_sql", timed_node("generate_sql", generate_sql_node))
+    workflow.add_node("validate_sql", timed_node("validate_sql", validate_sql_node))
+    workflow.add_node("execute_sql", timed_node("execute_sql", execute_sql_node))
+    workflow.add_node("format_results", timed_node("format_results", format_results_node))
+    workflow.add_node("refine_search", timed_node("refine_search", refine_search_node))
     
     # ========== DEFINIR ENTRY POINT ==========
     workflow.set_entry_point("receive_message")
     
     # ========== EDGES NORMALES (secuenciales) ==========
-    workflow.add_edge("receive_message", "extract_filters")
     workflow.add_edge("extract_filters", "check_completion")
     
     # ask_missing_filter termina esperando respuesta del usuario
@@ -73,6 +150,19 @@ def create_property_search_graph():
     
     # ========== CONDITIONAL EDGES (routers) ==========
     
+    # Router 0: Entrada según la fase conversacional
+    # Si ya preguntamos por opcionales, se salta la extracción de filtros;
+    # si ya se mostraron resultados, el mensaje refina esa búsqueda
+    workflow.add_conditional_edges(
+        "receive_message",
+        route_after_receive_message,
+        {
+            "extract_filters": "extract_filters",
+            "collect_optional_filters": "collect_optional_filters",
+            "refine_search": "refine_search"
+        }
+    )
+    
     # Router 1: Después de check_completion
     # Decide si pregunta por filtro faltante o por filtros adicionales
     workflow.add_conditional_edges(
@@ -86,13 +176,16 @@ def create_property_search_graph():
     )
         
     # Router 2: Después de collect_optional_filters
-    # Decide si extrae más filtros o genera SQL
+    # Decide si extrae más filtros, genera SQL o usa la búsqueda especulativa
+    # (si el mensaje ya se extrajo en este turno vuelve a check_completion)
     workflow.add_conditional_edges(
         "collect_optional_filters",
         route_after_collect_optional,
         {
             "extract_filters": "extract_filters",
-            "generate_sql": "generate_sql"
+            "check_completion": "check_completion",
+            "generate_sql": "generate_sql",
+            "execute_sql": "execute_sql"
         }
     )
     
@@ -107,12 +200,23 @@ def create_property_search_graph():
         }
     )
     
+    # Router 4: Después de refine_search
+    # El refinamiento ya respondió, salvo errores que formatea format_results
+    workflow.add_conditional_edges(
+        "refine_search",
+        route_after_refine_search,
+        {
+            "format_results": "format_results",
+            "end": END
+        }
+    )
+    
     # ========== COMPILAR GRAFO ==========
     compiled_graph = workflow.compile()
     
     print("✅ StateGraph creado y compilado exitosamente")
     print(f"📊 Nodos: {len(workflow.nodes)}")
-    print(f"🔗 Edges: normales + 3 condicionales")
+    print(f"🔗 Edges: normales + 5 condicionales")
     
     return compiled_graph
 
@@ -134,6 +238,21 @@ class SessionManager:
         """
         self.sessions: Dict[str, AgentState] = {}
         self.timeout = timedelta(seconds=timeout_seconds)
+        
+        # Versiones únicas entre todas las sesiones (un reset nunca repite un ETag)
+        self._versions = itertools.count(1)
+        
+        # Uso del LLM en conversaciones completadas (hasta format_results)
+        self.completed_conversations = 0
+        self.completed_llm_calls = 0
+        self.completed_llm_calls_wasted = 0
+        self.completed_llm_calls_avoided = 0
+        self._completed_session_ids: set = set()
+        
+        # Tiempos por turno (trabajo solapado por llamadas en paralelo)
+        self.turns = 0
+        self.turns_wall_ms = 0.0
+        self.turns_overlap_ms = 0.0
         print(f"📦 SessionManager inicializado (timeout: {timeout_seconds}s)")
     
     def create_session(self, session_id: str = None) -> AgentState:
@@ -150,7 +269,7 @@ class SessionManager:
             session_id = str(uuid.uuid4())
         
         # Crear nuevo estado
-        state = AgentState(session_id=session_id)
+        state = AgentState(session_id=session_id, version=next(self._versions))
         
         # Guardar en memoria
         self.sessions[session_id] = state
@@ -197,9 +316,18 @@ class SessionManager:
             state: Estado actualizado
         """
         state.last_updated = datetime.now()
+        self.bump_version(state)
         self.sessions[session_id] = state
         print(f"💾 Sesión actualizada: {session_id}")
     
+    def bump_version(self, state: AgentState):
+        """Marca el estado como modificado (invalida los ETags emitidos)."""
+        state.version = next(self._versions)
+    
+    def find_session(self, session_id: str) -> Optional[AgentState]:
+        """Retorna la sesión si existe (sin crearla)."""
+        return self.sessions.get(session_id)
+    
     def delete_session(self, session_id: str):
         """
         Elimina una sesión.
@@ -207,6 +335,9 @@ class SessionManager:
         Args:
             session_id: ID de la sesión a eliminar
         """
+        self._completed_session_ids.discard(session_id)
+        speculative_search.discard(session_id)
+        
         if session_id in self.sessions:
             del self.sessions[session_id]
             print(f"🗑️ Sesión eliminada: {session_id}")
@@ -221,10 +352,63 @@ class SessionManager:
         
         for sid in expired:
             del self.sessions[sid]
+            speculative_search.discard(sid)
             
         if expired:
             print(f"🧹 Limpieza: {len(expired)} sesiones expiradas eliminadas")
     
+    def record_completed_conversation(self, state: AgentState):
+        """
+        Acumula el uso del LLM de una conversación que llegó a format_results.
+        Cada sesión se cuenta una sola vez.
+        
+        Args:
+            state: Estado final de la conversación
+        """
+        if state.session_id in self._completed_session_ids:
+            return
+        
+        self._completed_session_ids.add(state.session_id)
+        self.completed_conversations += 1
+        self.completed_llm_calls += state.total_llm_calls()
+        self.completed_llm_calls_wasted += state.llm_calls_wasted
+        self.completed_llm_calls_avoided += state.llm_calls_avoided
+    
+    def get_llm_usage_report(self) -> dict:
+        """Promedios de llamadas al LLM por conversación completada."""
+        completed = self.completed_conversations
+        
+        def average(total: int):
+            return round(total / completed, 2) if completed else None
+        
+        return {
+            "completed_conversations": completed,
+            "avg_llm_calls": average(self.completed_llm_calls),
+            "avg_llm_calls_wasted": average(self.completed_llm_calls_wasted),
+            "avg_llm_calls_avoided": average(self.completed_llm_calls_avoided),
+        }
+    
+    def record_turn(self, state: AgentState):
+        """
+        Acumula el tiempo total y el tiempo solapado de un turno.
+        
+        Args:
+            state: Estado al terminar el turno
+        """
+        self.turns += 1
+        self.turns_wall_ms += state.turn_wall_ms or 0.0
+        self.turns_overlap_ms += state.turn_overlap_ms()
+    
+    def get_turn_timing_report(self) -> dict:
+        """Promedio de tiempo por turno y fracción solapada en paralelo."""
+        turns = self.turns
+        return {
+            "turns": turns,
+            "avg_wall_ms": round(self.turns_wall_ms / turns, 2) if turns else None,
+            "avg_overlap_ms": round(self.turns_overlap_ms / turns, 2) if turns else None,
+            "overlap_ratio": round(self.turns_overlap_ms / self.turns_wall_ms, 3) if self.turns_wall_ms else None,
+        }
+    
     def get_active_sessions_count(self) -> int:
         """Retorna el número de sesiones activas."""
         return len(self.sessions)
@@ -245,6 +429,7 @@ class SessionManager:
         state = self.sessions[session_id]
         return {
             "session_id": session_id,
+            "version": state.version,
             "created_at": state.created_at.isoformat(),
             "last_updated": state.last_updated.isoformat(),
             "messages_count": len(state.messages),
@@ -252,6 +437,14 @@ class SessionManager:
             "filters_count": state.filters.count_essential_filters(),
             "ready_to_search": state.ready_to_search,
             "query_executed": state.query_executed,
+            "llm_calls": state.llm_calls,
+            "llm_calls_wasted": state.llm_calls_wasted,
+            "llm_calls_avoided": state.llm_calls_avoided,
+            "last_turn": {
+                "wall_ms": state.turn_wall_ms,
+                "overlap_ms": state.turn_overlap_ms(),
+                "timings_ms": state.turn_timings,
+            },
         }
 
 
@@ -274,13 +467,18 @@ print(f"📦 Sesiones: session_manager")
 # FUNCIONES HELPER PARA USO EN LA API
 # ============================================================================
 
-async def process_user_message(session_id: str, user_message: str) -> AgentState:
+async def process_user_message(
+    session_id: str,
+    user_message: str,
+    on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+) -> AgentState:
     """
     Procesa un mensaje del usuario manteniendo el contexto de la sesión.
     
     Args:
         session_id: ID de la sesión
         user_message: Mensaje del usuario
+        on_event: Receptor de eventos parciales del turno (filtros, propiedades)
         
     Returns:
         Estado actualizado después de procesar el mensaje
@@ -292,12 +490,28 @@ async def process_user_message(session_id: str, user_message: str) -> AgentState
     # Obtener o crear sesión
     state = session_manager.get_session(session_id)
     
+    # Sesión para la cola justa del scheduler de LLM
+    llm_session.set(session_id)
+    turn_listener.set(on_event)
+    
     # Agregar mensaje del usuario al historial
     state.add_message("user", user_message)
+    session_manager.bump_version(state)
+    
+    # Reiniciar tiempos del turno
+    state.turn_timings = {}
+    state.turn_wall_ms = None
+    turn_start = time.perf_counter()
     
-    # Ejecutar el grafo
+    # Presupuesto de tiempo del request (LLM y base de datos lo respetan)
+    budget = request_tracker.begin(settings.chat_request_timeout)
+    
+    # Ejecutar el grafo (solo este timeout es el deadline del turno; un
+    # TimeoutError de adentro, p.ej. command_timeout de asyncpg, es un error)
+    turn_deadline = asyncio.timeout(budget.remaining())
     try:
-        result_dict = await property_search_graph.ainvoke(state)
+        async with turn_deadline:
+            result_dict = await property_search_graph.ainvoke(state)
         
         # IMPORTANTE: LangGraph retorna un dict, convertir de vuelta a AgentState
         # Actualizar el state original con los valores del dict resultante
@@ -305,20 +519,81 @@ async def process_user_message(session_id: str, user_message: str) -> AgentState
             if hasattr(state, key):
                 setattr(state, key, value)
         
+        # Llamadas en paralelo que ningún nodo usó (se apostó por otro resultado)
+        llm_speculation.finish_turn(state)
+        request_tracker.finish(budget, request_tracker.COMPLETED)
+        
+        state.turn_wall_ms = round((time.perf_counter() - turn_start) * 1000, 2)
+        session_manager.record_turn(state)
+        print(f"⏱️ Turno: {state.turn_wall_ms:.0f} ms total, "
+              f"{sum(state.turn_timings.values()):.0f} ms de trabajo, "
+              f"{state.turn_overlap_ms():.0f} ms en paralelo")
+        
         # Actualizar timestamp
         state.last_updated = datetime.now()
         
         # Actualizar sesión con el resultado
         session_manager.update_session(session_id, state)
         
+        # Esenciales completos y esperando respuesta sobre opcionales:
+        # lanzar la búsqueda en background mientras el usuario responde
+        if state.awaiting_additional_filters_confirmation and state.essential_filters_complete:
+            speculative_search.start(session_id, state.filters.model_dump(exclude_none=True))
+        
+        # Conversación completada: acumular su uso del LLM
+        if state.current_node == "format_results":
+            session_manager.record_completed_conversation(state)
+        
+        # Auditoría: solo se encola, la escritura va por lotes en background
+        await audit_log.record(state, user_message, request_tracker.COMPLETED)
+        
         print(f"✅ Mensaje procesado exitosamente")
         return state
+    
+    except TimeoutError as e:
+        if not turn_deadline.expired():
+            _record_failure(session_id, state, user_message, budget, e)
+            raise
         
-    except Exception as e:
-        print(f"❌ Error procesando mensaje: {e}")
-        state.error_message = str(e)
+        # Deadline agotado: el grafo (y sus llamadas al LLM / queries) ya se canceló
+        print(f"⌛ Deadline del request agotado ({budget.timeout:.0f} s)")
+        llm_speculation.finish_turn(state)
+        request_tracker.finish(budget, request_tracker.DEADLINE_EXCEEDED)
+        state.add_message(
+            "assistant",
+            "Estoy tardando más de lo normal en responder. ¿Puedes intentar de nuevo en unos segundos?"
+        )
+        state.error_message = "Tiempo de respuesta agotado"
+        state.last_updated = datetime.now()
         session_manager.update_session(session_id, state)
+        await audit_log.record(state, user_message, request_tracker.DEADLINE_EXCEEDED)
+        return state
+    
+    except asyncio.CancelledError:
+        # Cliente desconectado: se cancela todo el trabajo pendiente del turno
+        llm_speculation.finish_turn(state)
+        request_tracker.finish(budget, request_tracker.CLIENT_DISCONNECTED)
+        
+        # Nadie recibió la respuesta: sacar el mensaje para que un reintento no lo duplique
+        if state.messages and state.messages[-1].get("role") == "user":
+            state.messages.pop()
+        session_manager.update_session(session_id, state)
+        audit_log.record_nowait(state, user_message, request_tracker.CLIENT_DISCONNECTED)
         raise
+        
+    except Exception as e:
+        _record_failure(session_id, state, user_message, budget, e)
+        raise
+
+
+def _record_failure(session_id: str, state: AgentState, user_message: str, budget: RequestBudget, error: Exception):
+    """Cierra un turno que terminó con error (el llamador relanza la excepción)."""
+    print(f"❌ Error procesando mensaje: {error}")
+    llm_speculation.finish_turn(state)
+    request_tracker.finish(budget, request_tracker.FAILED)
+    state.error_message = str(error)
+    session_manager.update_session(session_id, state)
+    audit_log.record_nowait(state, user_message, request_tracker.FAILED)
 
 
 def get_session_state(session_id: str) -> AgentState:
@@ -0,0 +1,397 @@
+"""
+Compilador de prompts: versiones (full por defecto / compact opt-in), prefijos
+estáticos renderizados una sola vez, conteo de tokens y métricas de latencia
+por versión.
+
+Uso desde los tools:
+    response = await prompt_compiler.ainvoke("extract_filters", schema=PropertyFilters, user_message=..., ...)
+
+Reporte de tokens por versión (sin llamar al LLM):
+    python -m prompts.compiler
+"""
+import json
+import time
+from typing import Dict, Any, Callable, Optional, Tuple, Type
+from models.settings import settings
+from llm.gateway import llm_gateway
+from prompts.system_prompts import (
+    EXTRACT_FILTERS_PROMPT,
+    MISSING_FILTER_QUESTION_PROMPT,
+    ASK_ADDITIONAL_FILTERS_PROMPT,
+    GENERATE_SQL_PROMPT,
+    FORMAT_RESULTS_PROMPT,
+    FIX_SQL_PROMPT,
+    REPAIR_FILTERS_PROMPT,
+    EXTRACT_FILTERS_PREFIX_COMPACT,
+    EXTRACT_FILTERS_SUFFIX_COMPACT,
+    MISSING_FILTER_GUIDES,
+    MISSING_FILTER_QUESTION_PREFIX_COMPACT,
+    MISSING_FILTER_QUESTION_SUFFIX_COMPACT,
+    ASK_ADDITIONAL_FILTERS_PREFIX_COMPACT,
+    ASK_ADDITIONAL_FILTERS_SUFFIX_COMPACT,
+    GENERATE_SQL_PREFIX_COMPACT,
+    GENERATE_SQL_SUFFIX_COMPACT,
+    FORMAT_RESULTS_PREFIX_COMPACT,
+    FORMAT_RESULTS_SUFFIX_COMPACT,
+    FIX_SQL_PREFIX_COMPACT,
+    FIX_SQL_SUFFIX_COMPACT,
+)
+from tools.query_builder import FILTER_COLUMNS
+
+
+PROMPT_VERSIONS = ("full", "compact")
+
+
+class TokenCounter:
+    """Cuenta tokens con tiktoken; si no hay encoding disponible, estima (~4 caracteres por token)."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+
+    def _load(self):
+        self._loaded = True
+        try:
+            import tiktoken
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"⚠️ tiktoken no disponible ({type(e).__name__}), tokens estimados por caracteres")
+            self._encoding = None
+
+    @property
+    def exact(self) -> bool:
+        if not self._loaded:
+            self._load()
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        if not self._loaded:
+            self._load()
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return max(1, len(text) // 4)
+
+
+def _json(value: Any, compact: bool) -> str:
+    if compact:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(value, indent=2, ensure_ascii=False)
+
+
+def _missing_filter_guide(variables: Dict[str, Any]) -> Dict[str, Any]:
+    missing = variables.get("missing_filter")
+    return {"missing_filter_guide": MISSING_FILTER_GUIDES.get(missing, f"¿Podrías especificar {missing}?")}
+
+
+def _filter_conditions(variables: Dict[str, Any]) -> Dict[str, Any]:
+    filters = variables.get("filters_json") or {}
+    lines = []
+    for name in filters:
+        if name in FILTER_COLUMNS:
+            column, operator, _row_key = FILTER_COLUMNS[name]
+            lines.append(f"- {name} → {column} {operator} <valor>")
+    return {"filter_conditions": "\n".join(lines) or "- (sin filtros)"}
+
+
+class PromptTemplate:
+    """
+    Una versión de un prompt.
+
+    - prefix: parte estática (solo usa static_vars); se renderiza una vez por
+      combinación de valores estáticos y se reutiliza tal cual
+    - suffix: parte dinámica, se renderiza en cada llamada
+    - derive: agrega variables calculadas (p.ej. solo las instrucciones relevantes)
+    - compact_json: dicts/listas se serializan sin indentación
+    """
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        suffix: str,
+        prefix: str = "",
+        static_vars: Tuple[str, ...] = (),
+        derive: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        compact_json: bool = False
+    ):
+        self.name = name
+        self.version = version
+        self.prefix = prefix
+        self.suffix = suffix
+        self.static_vars = static_vars
+        self.derive = derive
+        self.compact_json = compact_json
+
+
+PROMPT_TEMPLATES: Dict[str, Dict[str, PromptTemplate]] = {
+    "extract_filters": {
+        "full": PromptTemplate("extract_filters", "full", EXTRACT_FILTERS_PROMPT),
+        "compact": PromptTemplate(
+            "extract_filters", "compact",
+            prefix=EXTRACT_FILTERS_PREFIX_COMPACT,
+            suffix=EXTRACT_FILTERS_SUFFIX_COMPACT,
+            static_vars=("estados",),
+            compact_json=True
+        ),
+    },
+    # Ya es mínimo: misma plantilla en ambas versiones
+    "repair_filters": {
+        "full": PromptTemplate("repair_filters", "full", REPAIR_FILTERS_PROMPT),
+        "compact": PromptTemplate("repair_filters", "compact", REPAIR_FILTERS_PROMPT),
+    },
+    "missing_filter_question": {
+        "full": PromptTemplate("missing_filter_question", "full", MISSING_FILTER_QUESTION_PROMPT),
+        "compact": PromptTemplate(
+            "missing_filter_question", "compact",
+            prefix=MISSING_FILTER_QUESTION_PREFIX_COMPACT,
+            suffix=MISSING_FILTER_QUESTION_SUFFIX_COMPACT,
+            derive=_missing_filter_guide,
+            compact_json=True
+        ),
+    },
+    "ask_additional_filters": {
+        "full": PromptTemplate("ask_additional_filters", "full", ASK_ADDITIONAL_FILTERS_PROMPT),
+        "compact": PromptTemplate(
+            "ask_additional_filters", "compact",
+            prefix=ASK_ADDITIONAL_FILTERS_PREFIX_COMPACT,
+            suffix=ASK_ADDITIONAL_FILTERS_SUFFIX_COMPACT,
+            compact_json=True
+        ),
+    },
+    "generate_sql": {
+        "full": PromptTemplate("generate_sql", "full", GENERATE_SQL_PROMPT),
+        "compact": PromptTemplate(
+            "generate_sql", "compact",
+            prefix=GENERATE_SQL_PREFIX_COMPACT,
+            suffix=GENERATE_SQL_SUFFIX_COMPACT,
+            static_vars=("schema_info", "schema", "limit"),
+            derive=_filter_conditions,
+            compact_json=True
+        ),
+    },
+    "format_results": {
+        "full": PromptTemplate("format_results", "full", FORMAT_RESULTS_PROMPT),
+        "compact": PromptTemplate(
+            "format_results", "compact",
+            prefix=FORMAT_RESULTS_PREFIX_COMPACT,
+            suffix=FORMAT_RESULTS_SUFFIX_COMPACT,
+            compact_json=True
+        ),
+    },
+    "fix_sql": {
+        "full": PromptTemplate("fix_sql", "full", FIX_SQL_PROMPT),
+        "compact": PromptTemplate(
+            "fix_sql", "compact",
+            prefix=FIX_SQL_PREFIX_COMPACT,
+            suffix=FIX_SQL_SUFFIX_COMPACT,
+            static_vars=("schema", "limit"),
+            compact_json=True
+        ),
+    },
+}
+
+
+class PromptStats:
+    """Tokens y latencia acumulados de una versión de prompt."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.static_tokens = 0
+        self.cached_tokens = 0
+        self.total_latency = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        calls = self.calls
+        return {
+            "calls": calls,
+            "avg_prompt_tokens": round(self.prompt_tokens / calls, 1) if calls else None,
+            "avg_static_prefix_tokens": round(self.static_tokens / calls, 1) if calls else None,
+            "provider_cached_tokens": self.cached_tokens,
+            "avg_latency_ms": round(self.total_latency / calls * 1000, 2) if calls else None,
+        }
+
+
+class PromptCompiler:
+    """
+    Renderiza prompts según la versión configurada (settings.prompt_version),
+    cachea los prefijos estáticos ya renderizados y registra tokens/latencia.
+    """
+
+    def __init__(self, version: str = None):
+        self.version = version or settings.prompt_version
+        if self.version not in PROMPT_VERSIONS:
+            print(f"⚠️ PROMPT_VERSION '{self.version}' desconocida, usando 'full'")
+            self.version = "full"
+
+        self.tokens = TokenCounter(settings.openai_model)
+        self._prefix_cache: Dict[Tuple, Tuple[str, int]] = {}
+        self._stats: Dict[Tuple[str, str], PromptStats] = {}
+
+    def _static_prefix(self, template: PromptTemplate, variables: Dict[str, Any]) -> Tuple[str, int]:
+        """Prefijo renderizado (y sus tokens), cacheado por valores estáticos."""
+        if not template.prefix:
+            return "", 0
+
+        values = tuple(str(variables.get(name)) for name in template.static_vars)
+        key = (template.name, template.version, values)
+        cached = self._prefix_cache.get(key)
+        if cached is None:
+            static = {name: variables.get(name) for name in template.static_vars}
+            text = template.prefix.format(**static)
+            cached = (text, self.tokens.count(text))
+            self._prefix_cache[key] = cached
+        return cached
+
+    def render(self, name: str, version: str = None, **variables) -> Tuple[str, int, int]:
+        """
+        Renderiza un prompt.
+
+        Args:
+            name: Nombre del prompt (ver PROMPT_TEMPLATES)
+            version: "full" o "compact" (default: versión configurada)
+            **variables: Variables del prompt; dicts/listas se serializan a JSON
+
+        Returns:
+            (prompt, tokens totales, tokens del prefijo estático)
+        """
+        template = PROMPT_TEMPLATES[name][version or self.version]
+
+        variables.setdefault("schema", settings.database_schema)
+        variables.setdefault("limit", settings.properties_limit)
+        if template.derive is not None:
+            variables.update(template.derive(variables))
+
+        prefix, prefix_tokens = self._static_prefix(template, variables)
+
+        dynamic = {
+            key: _json(value, template.compact_json) if isinstance(value, (dict, list)) else value
+            for key, value in variables.items()
+        }
+        suffix = template.suffix.format(**dynamic)
+
+        return prefix + suffix, prefix_tokens + self.tokens.count(suffix), prefix_tokens
+
+    async def ainvoke(
+        self,
+        name: str,
+        schema: Optional[Type] = None,
+        timeout: Optional[float] = None,
+        **variables
+    ):
+        """
+        Renderiza el prompt, lo envía por el gateway de LLM y registra
+        tokens/latencia de la versión.
+
+        Args:
+            name: Nombre del prompt (también define el nivel de modelo en el gateway)
+            schema: Modelo pydantic para salida estructurada (None = texto)
+            timeout: Deadline de la llamada (default: LLM_REQUEST_TIMEOUT)
+
+        Returns:
+            Respuesta del LLM
+        """
+        prompt, prompt_tokens, static_tokens = self.render(name, **variables)
+
+        start = time.perf_counter()
+        response = await llm_gateway.ainvoke(name, prompt, schema=schema, timeout=timeout)
+        latency = time.perf_counter() - start
+
+        stats = self._stats.setdefault((name, self.version), PromptStats())
+        stats.calls += 1
+        stats.total_latency += latency
+        stats.static_tokens += static_tokens
+
+        # Tokens reportados por el provider (incluye lo que sirvió desde su cache).
+        # Con salida estructurada (include_raw=True) el mensaje viene en "raw"
+        message = response.get("raw") if isinstance(response, dict) else response
+        usage = getattr(message, "usage_metadata", None) or {}
+        stats.prompt_tokens += usage.get("input_tokens") or prompt_tokens
+        stats.cached_tokens += (usage.get("input_token_details") or {}).get("cache_read") or 0
+
+        return response
+
+    def get_report(self) -> Dict[str, Any]:
+        """Tokens y latencia por prompt y versión."""
+        report: Dict[str, Any] = {
+            "version": self.version,
+            "exact_token_count": self.tokens.exact,
+            "prompts": {},
+        }
+        for (name, version), stats in sorted(self._stats.items()):
+            report["prompts"].setdefault(name, {})[version] = stats.to_dict()
+        return report
+
+
+# Instancia global del compilador
+prompt_compiler = PromptCompiler()
+
+
+# Variables de ejemplo para comparar versiones sin llamar al LLM
+SAMPLE_VARIABLES = {
+    "extract_filters": {
+        "estados": "PLANOS, CONSTRUCCIÓN, TERMINADO",
+        "user_message": "Busco en Miraflores de 2 dormitorios, máximo 500 mil",
+        "current_filters": {"area_min": 80.0},
+    },
+    "repair_filters": {
+        "estados": "PLANOS, CONSTRUCCIÓN, TERMINADO",
+        "errors": "- area_min = -80: debe ser mayor a 0",
+        "user_message": "Busco de 80 m2 como mínimo",
+    },
+    "missing_filter_question": {
+        "missing_filter": "monto_maximo",
+        "current_filters": {"distrito": "Miraflores", "area_min": 80.0, "dormitorios": 2},
+    },
+    "ask_additional_filters": {
+        "current_filters": {
+            "distrito": "Miraflores", "area_min": 80.0, "estado_propiedad": "PLANOS",
+            "monto_maximo": 500000.0, "dormitorios": 2,
+        },
+    },
+    "generate_sql": {
+        "filters_json": {
+            "distrito": "Miraflores", "area_min": 80.0, "estado_propiedad": "PLANOS",
+            "monto_maximo": 500000.0, "dormitorios": 2, "balcon": True,
+        },
+    },
+    "format_results": {
+        "filters_json": {"distrito": "Miraflores", "dormitorios": 2},
+        "count": 5,
+    },
+    "fix_sql": {
+        "original_query": "SELECT * FROM property_infrastructure.propiedad p WHERE p.distrito = 'Miraflores' LIMIT 5",
+        "error_message": "Columna no permitida: distrito",
+        "filters_json": {"distrito": "Miraflores"},
+    },
+}
+
+
+def build_token_report() -> Dict[str, Dict[str, Dict[str, int]]]:
+    """Tokens por prompt y versión con las variables de ejemplo."""
+    from prompts.system_prompts import DEFAULT_SCHEMA_INFO
+
+    compiler = PromptCompiler(version="full")
+    report = {}
+    for name, sample in SAMPLE_VARIABLES.items():
+        report[name] = {}
+        for version in PROMPT_VERSIONS:
+            variables = dict(sample, schema_info=DEFAULT_SCHEMA_INFO)
+            _prompt, total, static = compiler.render(name, version=version, **variables)
+            report[name][version] = {"tokens": total, "static_prefix_tokens": static}
+    return report
+
+
+if __name__ == "__main__":
+    report = build_token_report()
+    print(f"\n{'Prompt':<26}{'full':>8}{'compact':>10}{'prefijo':>10}{'ahorro':>9}")
+    print("-" * 63)
+    for name, versions in report.items():
+        full = versions["full"]["tokens"]
+        compact = versions["compact"]["tokens"]
+        print(f"{name:<26}{full:>8}{compact:>10}{versions['compact']['static_prefix_tokens']:>10}"
+              f"{(1 - compact / full) * 100:>8.0f}%")
@@ -45,6 +45,9 @@ Recuerda: Tu trabajo es SOLO recopilar información. Otro sistema generará el S
 # PROMPT PARA EXTRAER FILTROS DEL MENSAJE
 # ============================================================================
 
+# Estados válidos por defecto si el catálogo aún no se cargó
+DEFAULT_ESTADOS = ["PLANOS", "CONSTRUCCIÓN", "TERMINADO"]
+
 EXTRACT_FILTERS_PROMPT = """Analiza el siguiente mensaje del usuario y extrae ÚNICAMENTE los filtros de búsqueda de propiedades mencionados.
 
 Mensaje del usuario: "{user_message}"
@@ -60,7 +63,7 @@ Filtros actuales ya recopilados:
 ### NORMALIZACIÓN:
 - **distrito**: Capitalizar primera letra (ej: "san isidro" → "San Isidro")
 - **area_min**: Número decimal (ej: "80m2", "80 metros" → 80.0)
-- **estado_propiedad**: MAYÚSCULAS - opciones válidas: PLANOS, CONSTRUCCIÓN, TERMINADO
+- **estado_propiedad**: MAYÚSCULAS - opciones válidas: {estados}
   - Sé flexible, acepta variaciones o sinónimos como "en construcción", "construido" (→ CONSTRUCCIÓN)
 - **monto_maximo**: Número decimal sin símbolos (ej: "$500k", "500 mil" → 500000.0)
 - **dormitorios**: Número entero (ej: "dos", "2" → 2)
@@ -79,6 +82,20 @@ Ejemplo de output:
 NO incluyas explicaciones, solo el JSON.
 """
 
+# ============================================================================
+# PROMPT PARA REPARAR FILTROS INVÁLIDOS (un solo intento, solo campos con error)
+# ============================================================================
+
+REPAIR_FILTERS_PROMPT = """Algunos filtros extraídos del mensaje del usuario tienen valores inválidos.
+Corrige SOLO estos campos según el mensaje. Si el mensaje no permite corregir un campo, omítelo.
+Valores válidos para estado_propiedad: {estados}
+
+Campos inválidos:
+{errors}
+
+Mensaje del usuario: "{user_message}"
+"""
+
 # ============================================================================
 # PROMPT PARA GENERAR PREGUNTA POR FILTRO FALTANTE
 # ============================================================================
@@ -127,10 +144,8 @@ Genera el mensaje (máximo 30 palabras).
 # PROMPT PARA GENERAR SQL
 # ============================================================================
 
-GENERATE_SQL_PROMPT = """Genera una consulta SQL SELECT para buscar propiedades en PostgreSQL.
-
-## SCHEMA DE BASE DE DATOS:
-Schema: property_infrastructure
+# Schema por defecto si el catálogo aún no se cargó desde la base de datos
+DEFAULT_SCHEMA_INFO = """Schema: property_infrastructure
 
 Tabla: propiedad (alias: p)
 - id (uuid PRIMARY KEY)
@@ -154,7 +169,12 @@ Tabla: edificio (alias: e)
 - nombre (varchar)
 - direccion (text)
 - distrito (varchar) - ubicación del edificio
-- ciudad (varchar)
+- ciudad (varchar)"""
+
+GENERATE_SQL_PROMPT = """Genera una consulta SQL SELECT para buscar propiedades en PostgreSQL.
+
+## SCHEMA DE BASE DE DATOS:
+{schema_info}
 
 ## FILTROS DEL USUARIO:
 {filters_json}
@@ -250,4 +270,112 @@ Ejemplos:
 - "Lo siento, no encontré propiedades con esos criterios. ¿Quieres ajustar algún filtro?"
 
 Genera el mensaje (máximo 25 palabras).
-"""
\ No newline at end of file
+"""
+# ============================================================================
+# PROMPT PARA CORREGIR SQL
+# ============================================================================
+
+FIX_SQL_PROMPT = """El siguiente SQL falló con error:
+
+Query original:
+{original_query}
+
+Error:
+{error_message}
+
+Filtros de búsqueda:
+{filters_json}
+
+Schema:
+- Tabla: property_infrastructure.propiedad
+- Tabla relacionada: property_infrastructure.edificio
+- JOIN necesario: propiedad.edificio_id = edificio.id
+
+Analiza el error y genera un SQL corregido que:
+1. Solucione el problema específico del error
+2. Use los filtros correctamente
+3. Mantenga la estructura básica: SELECT con JOIN
+4. Incluya LIMIT 5
+
+Genera SOLO el SQL corregido, sin explicaciones.
+"""
+
+# ============================================================================
+# VERSIONES COMPACTAS (prefijo estático + sufijo dinámico)
+# ============================================================================
+# El prefijo solo depende de datos estáticos (estados, schema, límite) y el
+# compilador lo renderiza una sola vez. Con ~190-370 tokens estos prompts quedan
+# bajo el mínimo de 1024 tokens del prompt caching de OpenAI: no esperar hits
+# del cache del provider, el ahorro es solo de tokens enviados.
+# El sufijo lleva lo que cambia en cada llamada, con JSON compacto.
+
+EXTRACT_FILTERS_PREFIX_COMPACT = """Extrae del mensaje del usuario SOLO los filtros de búsqueda de departamentos nuevos (no repitas los ya recopilados).
+Normalización:
+- distrito: capitalizado ("san isidro" → "San Isidro")
+- area_min: float ("80m2", "80 metros" → 80.0)
+- estado_propiedad: uno de {estados} (acepta sinónimos: "en construcción" → CONSTRUCCIÓN)
+- monto_maximo: float sin símbolos ("$500k", "500 mil" → 500000.0)
+- dormitorios, banios: int ("dos" → 2)
+- permite_mascotas, balcon, terraza, amoblado: bool ("pet friendly" → true, "sin balcón" → false)
+Responde SOLO un objeto JSON, p.ej. {{"distrito":"San Isidro","dormitorios":2}}; si no hay filtros nuevos, {{}}.
+"""
+
+EXTRACT_FILTERS_SUFFIX_COMPACT = """Filtros actuales: {current_filters}
+Mensaje: "{user_message}"
+"""
+
+# Guía por filtro: la versión compacta solo incluye la del filtro que falta
+MISSING_FILTER_GUIDES = {
+    "distrito": "¿En qué distrito te gustaría buscar?",
+    "area_min": "¿Cuál es el área mínima que buscas (en m²)?",
+    "estado_propiedad": "¿Qué estado prefieres? ¿Disponible, en construcción, o con planos?",
+    "monto_maximo": "¿Cuál es tu presupuesto máximo?",
+    "dormitorios": "¿Cuántos dormitorios necesitas?",
+}
+
+MISSING_FILTER_QUESTION_PREFIX_COMPACT = """Genera una pregunta breve (máximo 15 palabras), natural y sin listas para pedir al usuario un filtro de búsqueda de departamento.
+"""
+
+MISSING_FILTER_QUESTION_SUFFIX_COMPACT = """Filtro que falta: {missing_filter} (ejemplo: "{missing_filter_guide}")
+Ya recopilados: {current_filters}
+"""
+
+ASK_ADDITIONAL_FILTERS_PREFIX_COMPACT = """El usuario completó los 5 filtros esenciales. Genera un mensaje amigable (máximo 30 palabras) preguntando si desea agregar filtros opcionales (pet-friendly, balcón, terraza, amoblado, número de baños) o buscar con los criterios actuales.
+"""
+
+ASK_ADDITIONAL_FILTERS_SUFFIX_COMPACT = """Filtros actuales: {current_filters}
+"""
+
+GENERATE_SQL_PREFIX_COMPACT = """Genera un SELECT de PostgreSQL para buscar propiedades. Responde SOLO el SQL, sin markdown ni explicaciones.
+
+{schema_info}
+
+Estructura obligatoria:
+SELECT p.*, e.nombre AS edificio_nombre, e.direccion AS edificio_direccion, e.distrito AS edificio_distrito
+FROM {schema}.propiedad p
+JOIN {schema}.edificio e ON p.edificio_id = e.id
+WHERE <una condición por filtro, unidas con AND>
+LIMIT {limit};
+Booleanos con = true / = false.
+"""
+
+GENERATE_SQL_SUFFIX_COMPACT = """Condiciones (filtro → SQL):
+{filter_conditions}
+Filtros: {filters_json}
+"""
+
+FORMAT_RESULTS_PREFIX_COMPACT = """Genera un mensaje corto y entusiasta (máximo 25 palabras) diciendo cuántas propiedades se encontraron y que puede ver los detalles en la lista. Si son 0, sugiere ajustar los filtros.
+"""
+
+FORMAT_RESULTS_SUFFIX_COMPACT = """Propiedades encontradas: {count}
+Filtros: {filters_json}
+"""
+
+FIX_SQL_PREFIX_COMPACT = """Corrige un SELECT de PostgreSQL que falló. Mantén la estructura: SELECT con JOIN {schema}.propiedad p JOIN {schema}.edificio e ON p.edificio_id = e.id, filtros unidos con AND y LIMIT {limit}. Responde SOLO el SQL corregido.
+"""
+
+FIX_SQL_SUFFIX_COMPACT = """Error: {error_message}
+Filtros: {filters_json}
+Query:
+{original_query}
+"""
@@ -0,0 +1,311 @@
+"""
+Auditoría de conversaciones: cada turno (mensaje, respuesta, filtros, SQL,
+tiempos y cantidad de resultados) queda en {schema}.conversation_audit aunque
+la sesión expire (DDL en db/migrations/004_conversation_audit.sql).
+
+El request no escribe en la base: `record()` arma una tupla y la deja en una
+cola acotada en memoria. Una tarea en background junta lotes (hasta
+AUDIT_LOG_BATCH_SIZE filas o AUDIT_LOG_FLUSH_INTERVAL segundos) y los escribe
+con COPY (copy_records_to_table). Si la cola se llena:
+- "drop" (default): el turno no espera y el registro se descarta (se cuenta)
+- "block": el turno espera hasta AUDIT_LOG_BLOCK_TIMEOUT segundos por lugar
+Al apagar la app se escriben los registros pendientes.
+
+Uso:
+    python -m tools.audit_log install   # crea la tabla de auditoría
+"""
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from models.settings import settings
+from models.state import AgentState
+from db import db
+
+
+MIGRATION_FILE = Path(__file__).parent.parent / "db" / "migrations" / "004_conversation_audit.sql"
+
+COLUMNS = [
+    "recorded_at", "session_id", "outcome", "user_message", "assistant_message", "node",
+    "filters", "generated_sql", "result_count", "wall_ms", "timings", "llm_calls", "error",
+]
+
+# Nodos que ejecutan la búsqueda (si corrieron en el turno hay SQL y resultados)
+SEARCH_NODES = ("execute_sql", "refine_search")
+
+DROP = "drop"
+BLOCK = "block"
+
+# Reintentos de un lote cuando la base no responde (después se descarta)
+MAX_RETRIES = 3
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+
+class AuditLog:
+    """Sink de auditoría: cola acotada en memoria + escritura por lotes con COPY."""
+
+    def __init__(self):
+        self.schema = settings.database_schema
+        self.enabled = settings.audit_log_enabled
+        self.queue_size = settings.audit_log_queue_size
+        self.batch_size = settings.audit_log_batch_size
+        self.flush_interval = settings.audit_log_flush_interval
+        self.overflow = settings.audit_log_overflow
+        self.block_timeout = settings.audit_log_block_timeout
+        self.shutdown_timeout = settings.audit_log_shutdown_timeout
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        # Lote que la tarea está juntando o escribiendo (se recupera al apagar)
+        self._batch: List[tuple] = []
+
+        # Métricas
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.lost = 0
+        self.last_flush_ms: Optional[float] = None
+
+    async def install(self):
+        """Aplica el DDL de la tabla de auditoría (idempotente)."""
+        ddl = MIGRATION_FILE.read_text(encoding="utf-8")
+        async with db.get_connection() as conn:
+            await conn.execute(ddl.format(schema=self.schema))
+        print(f"✅ Auditoría de conversaciones instalada en {self.schema}")
+
+    @staticmethod
+    def build_record(state: AgentState, user_message: str, outcome: str) -> tuple:
+        """Fila de auditoría de un turno (los JSON se codifican al escribir, no aquí)."""
+        last = state.messages[-1] if state.messages else {}
+        assistant_message = last.get("content") if last.get("role") == "assistant" else None
+        searched = any(node in state.turn_timings for node in SEARCH_NODES)
+
+        return (
+            datetime.now(timezone.utc),
+            state.session_id,
+            outcome,
+            user_message,
+            assistant_message,
+            state.current_node,
+            state.filters.model_dump(exclude_none=True),
+            state.generated_sql if searched else None,
+            len(state.query_results or []) if searched else None,
+            state.turn_wall_ms,
+            dict(state.turn_timings),
+            state.total_llm_calls(),
+            state.error_message,
+        )
+
+    def _build(self, state: AgentState, user_message: str, outcome: str) -> Optional[tuple]:
+        try:
+            item = self.build_record(state, user_message, outcome)
+        except Exception as e:
+            print(f"⚠️ No se pudo armar el registro de auditoría: {e}")
+            return None
+        self.recorded += 1
+        return item
+
+    def record_nowait(self, state: AgentState, user_message: str, outcome: str) -> bool:
+        """
+        Encola el turno para auditoría sin esperar nunca (cola llena = descarte).
+
+        Args:
+            state: Estado al terminar el turno
+            user_message: Mensaje del usuario del turno
+            outcome: Resultado del request (ver RequestTracker)
+
+        Returns:
+            False si el registro se descartó por cola llena
+        """
+        if self._queue is None:
+            return True
+        item = self._build(state, user_message, outcome)
+        if item is None:
+            return True
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            self._drop()
+            return False
+
+    async def record(self, state: AgentState, user_message: str, outcome: str):
+        """
+        Encola el turno aplicando la política de cola llena: con "drop" nunca
+        espera, con "block" espera lugar hasta AUDIT_LOG_BLOCK_TIMEOUT segundos.
+        """
+        if self._queue is None:
+            return
+        if self.overflow != BLOCK or self.block_timeout <= 0:
+            self.record_nowait(state, user_message, outcome)
+            return
+
+        item = self._build(state, user_message, outcome)
+        if item is None:
+            return
+        try:
+            self._queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            self.blocked += 1
+        try:
+            async with asyncio.timeout(self.block_timeout):
+                await self._queue.put(item)
+        except TimeoutError:
+            self._drop()
+
+    def _drop(self):
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            print(f"⚠️ Cola de auditoría llena: {self.dropped} registros descartados")
+
+    async def _fill_batch(self):
+        """Espera el primer registro y junta más hasta llenar el lote o vencer el intervalo."""
+        self._batch.append(await self._queue.get())
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._batch) < self.batch_size:
+            try:
+                self._batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # asyncio.timeout y no wait_for: wait_for puede tragarse la
+            # cancelación de stop() si el get ya recibió un registro
+            try:
+                async with asyncio.timeout(remaining):
+                    self._batch.append(await self._queue.get())
+            except TimeoutError:
+                break
+
+    async def _write(self, batch: List[tuple]):
+        """Un lote en un solo COPY."""
+        start = time.perf_counter()
+        records = [
+            (*item[:6], json.dumps(item[6], ensure_ascii=False), *item[7:10],
+             json.dumps(item[10]), *item[11:])
+            for item in batch
+        ]
+        async with db.get_connection() as conn:
+            await conn.copy_records_to_table(
+                "conversation_audit", schema_name=self.schema, records=records, columns=COLUMNS
+            )
+        self.batches += 1
+        self.written += len(batch)
+        self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    async def _write_with_retries(self, batch: List[tuple]):
+        delay = RETRY_DELAY
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                await self._write(batch)
+                return
+            except Exception as e:
+                self.failed_batches += 1
+                print(f"❌ Error escribiendo auditoría (intento {attempt}/{MAX_RETRIES}): {e}")
+                if attempt == MAX_RETRIES:
+                    break
+                # Mientras tanto la cola acotada absorbe (o descarta) los turnos nuevos
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+        self.lost += len(batch)
+
+    async def _work(self):
+        while True:
+            await self._fill_batch()
+            await self._write_with_retries(self._batch)
+            self._batch = []
+
+    async def flush(self):
+        """Escribe el lote en curso y todo lo que haya en la cola (sin reintentos)."""
+        while self._batch or (self._queue is not None and not self._queue.empty()):
+            batch, self._batch = self._batch, []
+            while len(batch) < self.batch_size and self._queue is not None and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self.failed_batches += 1
+                self.lost += len(batch)
+                print(f"❌ Error escribiendo auditoría pendiente: {e}")
+
+    def start(self):
+        """Crea la cola y la tarea de escritura (si está habilitado)."""
+        if not self.enabled or self._writer is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._writer = asyncio.create_task(self._work())
+        print(f"📝 Auditoría de conversaciones activa (cola de {self.queue_size})")
+
+    async def stop(self):
+        """Detiene la tarea y escribe lo pendiente (hasta AUDIT_LOG_SHUTDOWN_TIMEOUT segundos)."""
+        if self._writer is None:
+            return
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+
+        pending = len(self._batch) + self._queue.qsize()
+        written = self.written
+        try:
+            await asyncio.wait_for(self.flush(), timeout=self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            unwritten = len(self._batch) + self._queue.qsize()
+            print(f"⚠️ Auditoría: quedaron {unwritten} registros sin escribir al apagar")
+            self.lost += unwritten
+            self._batch = []
+        if pending:
+            print(f"📝 Auditoría: {self.written - written} de {pending} registros pendientes escritos al apagar")
+        self._queue = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "overflow": self.overflow,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "batches": self.batches,
+            "avg_batch": round(self.written / self.batches, 1) if self.batches else None,
+            "failed_batches": self.failed_batches,
+            "lost": self.lost,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+# Instancia global de auditoría
+audit_log = AuditLog()
+
+
+async def _main(command: str):
+    await db.connect()
+    try:
+        if command == "install":
+            await audit_log.install()
+        count = await db.fetch_val(f"SELECT count(*) FROM {audit_log.schema}.conversation_audit")
+        print(f"📝 conversation_audit: {count} turnos registrados")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command not in ("install", "status"):
+        print("Uso: python -m tools.audit_log [install|status]")
+        sys.exit(1)
+    asyncio.run(_main(command))
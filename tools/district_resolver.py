@@ -0,0 +1,238 @@
+"""
+Resolución difusa de distritos contra los valores reales de edificio.distrito.
+
+El filtro `e.distrito = '...'` es una comparación exacta: "Surco" vs "Santiago
+de Surco" o una tilde faltante devuelven 0 filas. El resolver carga los
+distritos del catálogo en un índice en memoria y traduce el texto del usuario
+al valor canónico:
+
+1. Igualdad normalizada (sin mayúsculas, tildes ni puntuación)
+2. Alias configurables (DISTRICT_ALIASES) y palabras que identifican a un
+   único distrito ("isidro" → "San Isidro")
+3. Distancia de edición acotada sobre los candidatos del índice invertido de
+   trigramas ("miraflors" → "Miraflores")
+4. Similitud de trigramas ("santiago surco" → "Santiago de Surco")
+
+El índice se reconstruye cada vez que el catálogo se recarga.
+"""
+import re
+import time
+import unicodedata
+from collections import OrderedDict, Counter
+from typing import Optional, Dict, Any, List, Tuple, Set
+from models.settings import settings
+from db import db
+
+
+# Palabras que no identifican a un distrito por sí solas
+STOPWORDS = {"de", "del", "la", "las", "los", "el", "san", "santa", "santiago", "villa", "jesus"}
+
+_PREFIX = re.compile(r"^(?:el )?distrito (?:de |del )?")
+
+
+def normalize_district(text: str) -> str:
+    """Minúsculas, sin tildes ni puntuación y con espacios colapsados."""
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    plain = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    plain = re.sub(r"[^a-z0-9 ]+", " ", plain)
+    return " ".join(plain.split())
+
+
+def parse_aliases(value: str) -> Dict[str, str]:
+    """
+    Parsea DISTRICT_ALIASES ("alias=Distrito canónico,...").
+
+    Returns:
+        {alias normalizado: distrito canónico}
+    """
+    aliases = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        alias, sep, district = entry.partition("=")
+        if not sep or not alias.strip() or not district.strip():
+            raise ValueError(f"Alias de distrito inválido: '{entry}' (formato alias=Distrito)")
+        aliases[normalize_district(alias)] = district.strip()
+    return aliases
+
+
+def levenshtein(a: str, b: str, limit: Optional[int] = None) -> int:
+    """
+    Distancia de edición. Con `limit` corta apenas se sabe que la distancia lo
+    supera y retorna limit + 1.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            substitution = previous[j - 1] + (ca != cb)
+            insertion = current[j - 1] + 1
+            deletion = previous[j] + 1
+            current.append(min(substitution, insertion, deletion))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DistrictResolver:
+    """
+    Índice de distritos canónicos (valores de edificio.distrito) + alias.
+    """
+
+    METHODS = ("exact", "alias", "edit_distance", "trigram")
+
+    def __init__(self):
+        self.aliases = parse_aliases(settings.district_aliases)
+        self.threshold = settings.district_match_threshold
+
+        self.canonical: Dict[str, str] = {}     # clave normalizada → distrito
+        self.keys: Dict[str, str] = {}          # alias/palabra normalizada → distrito
+        self.key_trigrams: Dict[str, Set[str]] = {}
+        self.postings: Dict[str, List[str]] = {}  # trigrama → claves que lo contienen
+        self._cache: "OrderedDict[str, Optional[Tuple[str, str]]]" = OrderedDict()
+
+        # Métricas
+        self.lookups = 0
+        self.resolved = {method: 0 for method in self.METHODS}
+        self.unresolved = 0
+        self.total_us = 0.0
+
+        db.catalog.on_change(lambda catalog: self.rebuild(catalog.distritos))
+
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self.canonical)
+
+    def rebuild(self, districts: List[str]):
+        """Reconstruye el índice con los distritos del catálogo."""
+        canonical = {normalize_district(d): d for d in districts if d and normalize_district(d)}
+
+        keys: Dict[str, str] = {}
+        # Alias configurados (solo si el destino existe en la tabla)
+        for alias, target in self.aliases.items():
+            district = canonical.get(normalize_district(target))
+            if district is not None and alias not in canonical:
+                keys[alias] = district
+
+        # Palabras que aparecen en un solo distrito ("isidro", "surco")
+        owners: Dict[str, Set[str]] = {}
+        for key, district in canonical.items():
+            for word in key.split():
+                if word not in STOPWORDS and len(word) >= 4:
+                    owners.setdefault(word, set()).add(district)
+        for word, districts_with_word in owners.items():
+            if len(districts_with_word) == 1 and word not in canonical:
+                keys.setdefault(word, next(iter(districts_with_word)))
+
+        key_trigrams = {key: trigrams(key) for key in list(canonical) + list(keys)}
+        postings: Dict[str, List[str]] = {}
+        for key, grams in key_trigrams.items():
+            for gram in grams:
+                postings.setdefault(gram, []).append(key)
+
+        self.canonical = canonical
+        self.keys = keys
+        self.key_trigrams = key_trigrams
+        self.postings = postings
+        self._cache.clear()
+
+        print(f"🗺️ Índice de distritos: {len(canonical)} distritos, {len(keys)} alias")
+
+    def _target(self, key: str) -> str:
+        return self.canonical.get(key) or self.keys[key]
+
+    def _lookup(self, query: str) -> Optional[Tuple[str, str]]:
+        """(distrito, método) o None si no hay un candidato único."""
+        if query in self.canonical:
+            return self.canonical[query], "exact"
+        if query in self.keys:
+            return self.keys[query], "alias"
+
+        # Candidatos: claves que comparten algún trigrama con el texto
+        query_trigrams = trigrams(query)
+        shared = Counter(key for gram in query_trigrams for key in self.postings.get(gram, ()))
+
+        # Distancia de edición: ~1 error cada 4 letras, máximo 2
+        radius = min(2, max(1, len(query) // 4))
+        matches = []
+        for key, count in shared.items():
+            # Cada edición cambia a lo sumo 3 trigramas: filtro antes de calcular la distancia
+            if abs(len(key) - len(query)) > radius:
+                continue
+            if count < max(len(query_trigrams), len(self.key_trigrams[key])) - 3 * radius:
+                continue
+            distance = levenshtein(query, key, radius)
+            if distance <= radius:
+                matches.append((distance, key))
+        if matches:
+            best = min(distance for distance, _ in matches)
+            districts = {self._target(key) for distance, key in matches if distance == best}
+            if len(districts) == 1:
+                return districts.pop(), "edit_distance"
+            return None
+
+        # Trigramas (coeficiente de Dice)
+        scores: Dict[str, float] = {}
+        for key, count in shared.items():
+            score = 2 * count / (len(query_trigrams) + len(self.key_trigrams[key]))
+            district = self._target(key)
+            scores[district] = max(scores.get(district, 0.0), score)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if ranked and ranked[0][1] >= self.threshold and (len(ranked) == 1 or ranked[1][1] < ranked[0][1]):
+            return ranked[0][0], "trigram"
+        return None
+
+    def resolve(self, text: str) -> Optional[str]:
+        """
+        Distrito canónico para `text`, o None si el índice no está cargado o
+        no hay un candidato único.
+        """
+        if not self.is_loaded or not text:
+            return None
+
+        start = time.perf_counter()
+        query = _PREFIX.sub("", normalize_district(text))
+
+        if query in self._cache:
+            self._cache.move_to_end(query)
+            result = self._cache[query]
+        else:
+            result = self._lookup(query)
+            self._cache[query] = result
+            if len(self._cache) > 1024:
+                self._cache.popitem(last=False)
+
+        self.lookups += 1
+        self.total_us += (time.perf_counter() - start) * 1e6
+        if result is None:
+            self.unresolved += 1
+            return None
+
+        district, method = result
+        self.resolved[method] += 1
+        return district
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "districts": len(self.canonical),
+            "aliases": len(self.keys),
+            "lookups": self.lookups,
+            "resolved": self.resolved,
+            "unresolved": self.unresolved,
+            "avg_lookup_us": round(self.total_us / self.lookups, 2) if self.lookups else None,
+        }
+
+
+# Instancia global del resolver de distritos
+district_resolver = DistrictResolver()
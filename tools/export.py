@@ -0,0 +1,193 @@
+"""
+Exportación masiva de los resultados de una sesión (CSV o NDJSON) para brokers
+
+Las filas van de PostgreSQL al response sin pasar por fetch_all:
+- CSV: `COPY (búsqueda) TO STDOUT WITH CSV HEADER`; el servidor arma el CSV y
+  los bloques pasan por una cola acotada (si el cliente lee lento, la cola se
+  llena y asyncpg deja de leer del socket)
+- NDJSON: cursor de servidor que trae EXPORT_FETCH_SIZE filas por vuelta; la
+  siguiente vuelta se pide recién cuando el response consumió la anterior
+
+En ambos casos la memoria es constante y la conexión queda reservada (clase de
+query "export") solo mientras dura el stream.
+"""
+import asyncio
+from typing import Dict, Any, AsyncIterator, List
+from models.settings import settings
+from models.serialization import dumps
+from db import db
+from tools.query_builder import build_search_query
+
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+MEDIA_TYPES = {
+    CSV: "text/csv; charset=utf-8",
+    NDJSON: "application/x-ndjson",
+}
+
+# Fin del COPY en la cola (el productor terminó)
+_COPY_DONE = object()
+
+
+class SearchExporter:
+    """Streams de exportación sobre la búsqueda determinística de build_search_query."""
+
+    def __init__(self):
+        self.max_rows = settings.export_max_rows
+        self.fetch_size = settings.export_fetch_size
+        self.buffer_chunks = settings.export_buffer_chunks
+
+        # Métricas
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.aborted = 0
+        self.in_flight = 0
+        self.rows = 0
+        self.bytes = 0
+
+    async def open(self, filters: Dict[str, Any], export_format: str) -> AsyncIterator[bytes]:
+        """
+        Abre el stream y espera su primer bloque, así la saturación o un error
+        del query se reportan antes de enviar headers.
+
+        Args:
+            filters: Filtros de la sesión (model_dump sin None)
+            export_format: "csv" o "ndjson"
+
+        Returns:
+            Iterador de bloques de bytes para un StreamingResponse
+
+        Raises:
+            ValueError si el formato no existe
+            QueryRejectedError si ya hay demasiadas exportaciones en curso
+        """
+        if export_format not in MEDIA_TYPES:
+            raise ValueError(f"Formato no soportado: {export_format} (usa {', '.join(MEDIA_TYPES)})")
+
+        stream = self._primed(self._stream(filters, export_format))
+        await stream.__anext__()
+        return stream
+
+    async def _primed(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Pide el primer bloque antes de ceder el control (un None de aviso), así
+        open() ya deja la conexión reservada y aclose() siempre la libera.
+        """
+        try:
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = b""
+            yield None
+            if first:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Cliente desconectado: cierra el COPY/cursor y libera la conexión
+            await chunks.aclose()
+
+    async def _stream(self, filters: Dict[str, Any], export_format: str) -> AsyncIterator[bytes]:
+        use_view = db.search_view.is_fresh
+        db.search_view.record_query(use_view)
+        query, params = build_search_query(filters, self.max_rows, use_view=use_view)
+
+        self.started += 1
+        self.in_flight += 1
+        finished = False
+        try:
+            async with db.streaming_connection(read_only=True, query_class="export") as conn:
+                if export_format == CSV:
+                    chunks = self._copy_csv(conn, query, params)
+                else:
+                    chunks = self._cursor_ndjson(conn, query, params)
+                try:
+                    async for chunk in chunks:
+                        self.bytes += len(chunk)
+                        yield chunk
+                finally:
+                    await chunks.aclose()
+            finished = True
+            self.completed += 1
+        except (asyncio.CancelledError, GeneratorExit):
+            self.aborted += 1
+            print("🔌 Exportación cortada por el cliente")
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Error en exportación: {e}")
+            raise
+        finally:
+            self.in_flight -= 1
+            if finished:
+                print(f"📦 Exportación {export_format} completa")
+
+    async def _copy_csv(self, conn, query: str, params: List[Any]) -> AsyncIterator[bytes]:
+        """Bloques del COPY a medida que llegan, con a lo sumo buffer_chunks en memoria."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.buffer_chunks)
+
+        async def produce():
+            # asyncpg espera a `queue.put` antes de leer el siguiente bloque.
+            # Si el consumidor se fue (cancelación) nadie espera el fin.
+            try:
+                return await conn.copy_from_query(query, *params, output=queue.put, format="csv", header=True)
+            finally:
+                if not asyncio.current_task().cancelling():
+                    await queue.put(_COPY_DONE)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is _COPY_DONE:
+                    break
+                yield chunk
+            status = await producer
+            self.rows += _copied_rows(status)
+        finally:
+            if not producer.done():
+                producer.cancel()
+                try:
+                    await producer
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+    async def _cursor_ndjson(self, conn, query: str, params: List[Any]) -> AsyncIterator[bytes]:
+        """Una línea JSON por fila; cada bloque es una vuelta del cursor."""
+        cursor = await conn.cursor(query, *params)
+        while True:
+            rows = await cursor.fetch(self.fetch_size)
+            if not rows:
+                break
+            self.rows += len(rows)
+            # Los codecs ya entregan valores serializables (db/codecs.py)
+            yield b"".join(dumps(dict(row)) + b"\n" for row in rows)
+            if len(rows) < self.fetch_size:
+                break
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "max_rows": self.max_rows,
+            "in_flight": self.in_flight,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "aborted": self.aborted,
+            "rows": self.rows,
+            "bytes": self.bytes,
+        }
+
+
+def _copied_rows(status: str) -> int:
+    """Filas de un status de COPY ("COPY 1234")."""
+    try:
+        return int(status.split()[-1])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+# Instancia global de exportaciones
+search_export = SearchExporter()
@@ -0,0 +1,460 @@
+"""
+Ingesta masiva de inventario (feeds CSV o NDJSON) en propiedad/edificio
+
+Cada lote de INGEST_BATCH_SIZE filas va en su propia transacción:
+1. COPY binario (copy_records_to_table) a una tabla temporal con todas las
+   columnas como text (sin convertir tipos en Python)
+2. un upsert set-based por tabla (edificio y luego propiedad) que castea en
+   PostgreSQL, se queda con la última fila de cada id y no reescribe filas
+   sin cambios (IS DISTINCT FROM: sin tuplas muertas ni avisos de más)
+
+El feed usa la misma forma de fila que /export: columnas de propiedad (`id`
+obligatorio) y, opcionalmente, columnas de su edificio como `edificio_<columna>`
+(`edificio_id` es la clave). Las columnas desconocidas se ignoran. En NDJSON
+las columnas son las claves del primer objeto.
+
+Los caches dependientes (búsquedas especulativas, catálogo, vista de búsqueda,
+búsquedas guardadas) se invalidan por el change feed: con el feed conectado
+lo hacen los triggers de cada upsert, si no se publica el mismo ChangeEvent
+en proceso con los ids y distritos del lote.
+
+Uso:
+    python -m tools.ingest feed.csv
+    python -m tools.ingest feed.ndjson --batch-size 10000
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import asyncpg
+from models.settings import settings
+from models.serialization import loads
+from db import db, ChangeEvent
+
+
+CSV = "csv"
+NDJSON = "ndjson"
+FORMATS = (CSV, NDJSON)
+
+EDIFICIO_PREFIX = "edificio_"
+STAGE_TABLE = "ingest_stage"
+
+# Tras cargas grandes se actualizan las estadísticas (planner y guarda de costo)
+ANALYZE_MIN_ROWS = 10_000
+
+COLUMN_TYPES_QUERY = """
+SELECT a.attname AS name, format_type(a.atttypid, a.atttypmod) AS type
+FROM pg_catalog.pg_attribute a
+WHERE a.attrelid = $1::text::regclass
+  AND a.attnum > 0
+  AND NOT a.attisdropped
+  AND a.attgenerated = ''
+ORDER BY a.attnum
+"""
+
+
+class IngestError(Exception):
+    """La ingesta se cortó; `report` tiene lo que ya quedó cargado."""
+
+    def __init__(self, message: str, report: Dict[str, Any], client_error: bool = False):
+        super().__init__(message)
+        self.report = report
+        self.client_error = client_error
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _text(value: Any) -> Optional[str]:
+    """Valor de NDJSON como texto para la tabla de staging."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Líneas UTF-8 (con su salto de línea) de un stream de bytes, sin BOM."""
+    buffer = b""
+    first = True
+    async for chunk in chunks:
+        if first:
+            chunk, first = chunk.removeprefix(codecs.BOM_UTF8), False
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8") + "\n"
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+async def read_batches(
+    chunks: AsyncIterator[bytes],
+    feed_format: str,
+    batch_size: int
+) -> AsyncIterator[Tuple[List[str], List[List[Optional[str]]]]]:
+    """
+    Filas del feed en lotes, alineadas con el header.
+
+    Yields:
+        (header, filas) donde cada fila es una lista de textos (None = NULL)
+
+    Raises:
+        ValueError si una fila no coincide con el header o no es JSON válido
+    """
+    header: Optional[List[str]] = None
+    batch: List[List[Optional[str]]] = []
+    line_number = 0
+
+    if feed_format == CSV:
+        # Un registro con saltos de línea entre comillas ocupa varias líneas:
+        # se parsean juntas cuando la cantidad de comillas vuelve a ser par
+        pending: List[str] = []
+        quotes = 0
+        async for line in iter_lines(chunks):
+            line_number += 1
+            pending.append(line)
+            quotes += line.count('"')
+            if quotes % 2:
+                continue
+            for record in csv.reader(pending):
+                if not record:
+                    continue
+                if header is None:
+                    header = [name.strip() for name in record]
+                    continue
+                if len(record) != len(header):
+                    raise ValueError(
+                        f"Línea {line_number}: {len(record)} columnas, se esperaban {len(header)}"
+                    )
+                # Sin forma de distinguir vacío de NULL en CSV: vacío = NULL
+                batch.append([value if value != "" else None for value in record])
+            pending.clear()
+            quotes = 0
+            if len(batch) >= batch_size:
+                yield header, batch
+                batch = []
+        if pending:
+            raise ValueError(f"Línea {line_number}: comillas sin cerrar al final del feed")
+    else:
+        async for line in iter_lines(chunks):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                item = loads(line)
+            except ValueError as e:
+                raise ValueError(f"Línea {line_number}: JSON inválido ({e})")
+            if not isinstance(item, dict):
+                raise ValueError(f"Línea {line_number}: se esperaba un objeto JSON")
+            if header is None:
+                header = list(item)
+            batch.append([_text(item.get(name)) for name in header])
+            if len(batch) >= batch_size:
+                yield header, batch
+                batch = []
+
+    if batch:
+        yield header, batch
+
+
+class IngestPlan:
+    """Columnas del feed → staging y upserts de edificio/propiedad."""
+
+    def __init__(self, header: List[str], columns: Dict[str, Dict[str, str]], schema: str):
+        """
+        Args:
+            header: Columnas del feed
+            columns: {tabla: {columna: tipo SQL}} de propiedad y edificio
+            schema: Schema de las tablas
+
+        Raises:
+            ValueError si falta la columna id o hay columnas repetidas
+        """
+        if len(set(header)) != len(header):
+            raise ValueError("El feed tiene columnas repetidas")
+        if "id" not in header:
+            raise ValueError("El feed necesita la columna id de la propiedad")
+
+        propiedad, edificio = columns["propiedad"], columns["edificio"]
+        self.schema = schema
+        self.types = columns
+
+        # Columna de propiedad → columna del feed
+        self.propiedad_columns = {name: name for name in header if name in propiedad and name != "id"}
+        # Columna de edificio → columna del feed (edificio_id es la clave)
+        self.edificio_columns = {
+            name[len(EDIFICIO_PREFIX):]: name
+            for name in header
+            if name.startswith(EDIFICIO_PREFIX)
+            and name[len(EDIFICIO_PREFIX):] in edificio
+            and name[len(EDIFICIO_PREFIX):] != "id"
+        }
+        if self.edificio_columns and "edificio_id" not in header:
+            raise ValueError("Las columnas edificio_* necesitan edificio_id")
+
+        used = {"id", *self.propiedad_columns.values(), *self.edificio_columns.values()}
+        if "edificio_id" in header:
+            used.add("edificio_id")
+        self.stage_columns = [name for name in header if name in used]
+        self.indices = [header.index(name) for name in self.stage_columns]
+        self.ignored_columns = [name for name in header if name not in used]
+
+    @property
+    def create_stage_sql(self) -> str:
+        columns = ",\n    ".join(f"{_ident(name)} text" for name in self.stage_columns)
+        return (
+            f"DROP TABLE IF EXISTS pg_temp.{STAGE_TABLE};\n"
+            f"CREATE TEMP TABLE {STAGE_TABLE} (\n    _ord bigint,\n    {columns}\n) ON COMMIT DELETE ROWS"
+        )
+
+    def records(self, rows: List[List[Optional[str]]], first_ord: int) -> List[tuple]:
+        indices = self.indices
+        return [(first_ord + offset, *[row[i] for i in indices]) for offset, row in enumerate(rows)]
+
+    def _upsert(self, table: str, key: str, columns: Dict[str, str], returning: str) -> str:
+        types = self.types[table]
+        key_cast = f"s.{_ident(key)}::{types['id']}"
+        targets = ", ".join(_ident(name) for name in ["id", *columns])
+        selects = ", ".join(
+            [key_cast] + [f"s.{_ident(source)}::{types[name]}" for name, source in columns.items()]
+        )
+
+        if columns:
+            assignments = ", ".join(f"{_ident(name)} = EXCLUDED.{_ident(name)}" for name in columns)
+            current = ", ".join(f"t.{_ident(name)}" for name in columns)
+            incoming = ", ".join(f"EXCLUDED.{_ident(name)}" for name in columns)
+            conflict = (
+                f"ON CONFLICT (id) DO UPDATE SET {assignments}\n"
+                f"    WHERE ROW({current}) IS DISTINCT FROM ROW({incoming})"
+            )
+        else:
+            conflict = "ON CONFLICT (id) DO NOTHING"
+
+        # Varias filas con el mismo id en el lote: gana la última del feed
+        return f"""INSERT INTO {self.schema}.{table} AS t ({targets})
+    SELECT DISTINCT ON ({key_cast}) {selects}
+    FROM pg_temp.{STAGE_TABLE} s
+    WHERE s.{_ident(key)} IS NOT NULL
+    ORDER BY {key_cast}, s._ord DESC
+    {conflict}
+    RETURNING {returning}"""
+
+    @property
+    def edificio_sql(self) -> Optional[str]:
+        if not self.edificio_columns:
+            return None
+        return self._upsert(
+            "edificio", "edificio_id", self.edificio_columns,
+            "t.id::text AS id, (t.xmax = 0) AS inserted, t.distrito"
+        )
+
+    @property
+    def propiedad_sql(self) -> str:
+        upsert = self._upsert(
+            "propiedad", "id", self.propiedad_columns,
+            "t.id, t.edificio_id, (t.xmax = 0) AS inserted"
+        )
+        return f"""WITH upserted AS (
+    {upsert}
+)
+SELECT u.id::text AS id, u.inserted, e.distrito
+FROM upserted u
+LEFT JOIN {self.schema}.edificio e ON e.id = u.edificio_id"""
+
+
+class InventoryIngestor:
+    """Ingesta por lotes con COPY + upsert e invalidación de caches."""
+
+    def __init__(self):
+        self.schema = settings.database_schema
+        self.batch_size = settings.ingest_batch_size
+        self.api_token = settings.ingest_api_token
+
+        # Métricas
+        self.runs = 0
+        self.failed = 0
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    async def _column_types(self) -> Dict[str, Dict[str, str]]:
+        columns = {}
+        for table in ("propiedad", "edificio"):
+            rows = await db.fetch_all(COLUMN_TYPES_QUERY, f"{self.schema}.{table}")
+            columns[table] = {row["name"]: row["type"] for row in rows}
+        return columns
+
+    async def _load_batch(
+        self,
+        conn: asyncpg.Connection,
+        plan: IngestPlan,
+        rows: List[List[Optional[str]]],
+        first_ord: int,
+        statement_timeout_ms: int
+    ) -> Tuple[List[asyncpg.Record], List[asyncpg.Record]]:
+        """Un lote en una transacción corta: COPY a staging + upserts."""
+        async with conn.transaction():
+            if statement_timeout_ms:
+                await conn.execute(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}")
+            await conn.copy_records_to_table(
+                STAGE_TABLE, records=plan.records(rows, first_ord), columns=["_ord", *plan.stage_columns]
+            )
+            edificios = await conn.fetch(plan.edificio_sql) if plan.edificio_sql else []
+            propiedades = await conn.fetch(plan.propiedad_sql)
+        return edificios, propiedades
+
+    def _publish(self, table: str, rows: List[asyncpg.Record]):
+        """Mismo aviso que los triggers del change feed cuando el feed no está conectado."""
+        if not rows or db.change_feed.is_live:
+            return
+        op = "INSERT" if all(row["inserted"] for row in rows) else "UPDATE"
+        distritos = sorted({row["distrito"] for row in rows if row["distrito"] is not None})
+        db.change_feed.publish(ChangeEvent(table, op, [row["id"] for row in rows], distritos))
+
+    async def ingest(self, chunks: AsyncIterator[bytes], feed_format: str) -> Dict[str, Any]:
+        """
+        Carga un feed completo, lote por lote.
+
+        Args:
+            chunks: Bytes del feed (body del request o archivo)
+            feed_format: "csv" o "ndjson"
+
+        Returns:
+            Reporte con filas, lotes, insertadas/actualizadas y throughput
+
+        Raises:
+            ValueError si el formato no existe
+            QueryRejectedError si ya hay una ingesta en curso
+            IngestError si el feed o un lote fallan (los lotes anteriores quedan cargados)
+        """
+        if feed_format not in FORMATS:
+            raise ValueError(f"Formato no soportado: {feed_format} (usa {', '.join(FORMATS)})")
+
+        report: Dict[str, Any] = {
+            "rows": 0,
+            "batches": 0,
+            "propiedades": {"inserted": 0, "updated": 0},
+            "edificios": {"inserted": 0, "updated": 0},
+            "unchanged": 0,
+            "ignored_columns": [],
+        }
+        start = time.perf_counter()
+        limits = db.query_classes["ingest"]
+
+        # Una ingesta a la vez, en el primario y con una sola conexión
+        async with limits.admit():
+            self.runs += 1
+            columns = await self._column_types()
+            async with db.get_connection() as conn:
+                plan: Optional[IngestPlan] = None
+                try:
+                    async for header, rows in read_batches(chunks, feed_format, self.batch_size):
+                        if plan is None:
+                            plan = IngestPlan(header, columns, self.schema)
+                            report["ignored_columns"] = plan.ignored_columns
+                            await conn.execute(plan.create_stage_sql)
+
+                        edificios, propiedades = await self._load_batch(
+                            conn, plan, rows, report["rows"], limits.statement_timeout_ms
+                        )
+                        self._count(report, "edificios", edificios)
+                        self._count(report, "propiedades", propiedades)
+                        report["rows"] += len(rows)
+                        report["batches"] += 1
+                        self._publish("edificio", edificios)
+                        self._publish("propiedad", propiedades)
+                except Exception as e:
+                    self.failed += 1
+                    self._finish(report, start)
+                    print(f"❌ Ingesta cortada tras {report['rows']} filas: {e}")
+                    client_error = isinstance(
+                        e, (ValueError, asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+                    )
+                    raise IngestError(str(e), report, client_error=client_error) from e
+                finally:
+                    if plan is not None:
+                        try:
+                            await conn.execute(f"DROP TABLE IF EXISTS pg_temp.{STAGE_TABLE}")
+                        except Exception as e:
+                            print(f"⚠️ No se pudo borrar la tabla de staging: {e}")
+
+                changed = report["rows"] - report["unchanged"]
+                if report["rows"] >= ANALYZE_MIN_ROWS and changed:
+                    await conn.execute(f"ANALYZE {self.schema}.edificio, {self.schema}.propiedad")
+
+        self._finish(report, start)
+        print(f"📥 Ingesta: {report['rows']} filas en {report['batches']} lotes "
+              f"({report['rows_per_minute']:.0f} filas/min)")
+        return report
+
+    def _count(self, report: Dict[str, Any], table: str, rows: List[asyncpg.Record]):
+        inserted = sum(1 for row in rows if row["inserted"])
+        report[table]["inserted"] += inserted
+        report[table]["updated"] += len(rows) - inserted
+
+    def _finish(self, report: Dict[str, Any], start: float):
+        seconds = time.perf_counter() - start
+        propiedades = report["propiedades"]
+        report["unchanged"] = report["rows"] - propiedades["inserted"] - propiedades["updated"]
+        report["seconds"] = round(seconds, 3)
+        report["rows_per_minute"] = round(report["rows"] / seconds * 60) if seconds else 0
+
+        self.rows += report["rows"]
+        self.inserted += propiedades["inserted"]
+        self.updated += propiedades["updated"]
+        self.last_run = report
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": bool(self.api_token),
+            "batch_size": self.batch_size,
+            "runs": self.runs,
+            "failed": self.failed,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "last_run": self.last_run,
+        }
+
+
+# Instancia global de ingesta de inventario
+inventory_ingest = InventoryIngestor()
+
+
+async def read_file(path: Path, chunk_size: int = 1 << 20) -> AsyncIterator[bytes]:
+    with open(path, "rb") as feed:
+        while chunk := feed.read(chunk_size):
+            yield chunk
+
+
+async def _main(path: Path, feed_format: str):
+    await db.connect()
+    try:
+        report = await inventory_ingest.ingest(read_file(path), feed_format)
+        print(report)
+    except IngestError as e:
+        print(f"Reporte parcial: {e.report}")
+        sys.exit(1)
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta de inventario (CSV o NDJSON)")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Default: según la extensión")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.batch_size:
+        inventory_ingest.batch_size = args.batch_size
+    feed_format = args.format or (NDJSON if args.path.suffix in (".ndjson", ".jsonl") else CSV)
+    asyncio.run(_main(args.path, feed_format))
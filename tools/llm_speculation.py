@@ -0,0 +1,121 @@
+"""
+Llamadas al LLM en paralelo dentro de un turno.
+
+Un nodo lanza en background una llamada cuyo resultado necesitará un nodo
+posterior, apostando por el resultado más probable (p.ej. el mensaje final con
+la cantidad de propiedades esperada mientras se genera/ejecuta el SQL). El nodo
+consumidor la toma solo si la clave coincide; si no, la descarta y llama normal.
+"""
+import asyncio
+import time
+from typing import Dict, Any, Optional, Hashable, Awaitable
+from models.state import AgentState
+from llm.scheduler import llm_scheduler, llm_priority, BACKGROUND
+
+
+class SpeculativeCall:
+    """Una llamada al LLM lanzada antes de saber si se va a usar."""
+
+    def __init__(self, name: str, key: Hashable, coro: Awaitable):
+        self.name = name
+        self.key = key
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.task: asyncio.Task = asyncio.create_task(self._run(coro))
+
+    async def _run(self, coro: Awaitable) -> Any:
+        # Prioridad baja en el scheduler (solo en el contexto de esta task)
+        llm_priority.set(BACKGROUND)
+        try:
+            return await coro
+        finally:
+            self.finished = time.perf_counter()
+
+    def elapsed_until(self, moment: float) -> float:
+        """Segundos que la llamada corrió antes de `moment` (en paralelo con otro trabajo)."""
+        end = min(self.finished, moment) if self.finished is not None else moment
+        return max(0.0, end - self.started)
+
+
+class LLMSpeculation:
+    """Registro de llamadas especulativas por sesión y nombre de nodo consumidor."""
+
+    def __init__(self):
+        self._calls: Dict[str, Dict[str, SpeculativeCall]] = {}
+
+        # Métricas
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, state: AgentState, name: str, key: Hashable, coro: Awaitable) -> None:
+        """
+        Lanza una llamada para el nodo `name` apostando por `key`.
+        Reemplaza (y descarta) una especulación previa del mismo nodo.
+        """
+        calls = self._calls.setdefault(state.session_id, {})
+        previous = calls.pop(name, None)
+        if previous is not None:
+            self._discard(state, previous)
+
+        calls[name] = SpeculativeCall(name, key, coro)
+        self.started += 1
+        print(f"🔀 Llamada en paralelo lanzada: {name} ({key if isinstance(key, str) else 'clave compuesta'})")
+
+    async def take(self, state: AgentState, name: str, key: Hashable) -> Optional[Any]:
+        """
+        Retorna el resultado especulativo si se apostó por `key`, o None.
+        Registra la llamada en las métricas de LLM del estado y el tiempo que
+        corrió en paralelo en state.turn_timings.
+        """
+        call = self._calls.get(state.session_id, {}).pop(name, None)
+        if call is None:
+            return None
+
+        if call.key != key:
+            print(f"↩️ Especulación descartada para {name}: se apostó por otro resultado")
+            self._discard(state, call)
+            return None
+
+        # Ahora sí se espera: si sigue en cola pasa adelante de las de background
+        llm_scheduler.promote(state.session_id)
+        taken_at = time.perf_counter()
+        try:
+            value = await call.task
+        except Exception as e:
+            print(f"⚠️ Llamada en paralelo falló ({name}): {e}")
+            self._discard(state, call)
+            return None
+
+        state.record_llm_call(name)
+        state.record_timing(f"{name} (paralelo)", call.elapsed_until(taken_at))
+        self.hits += 1
+        print(f"⚡ Resultado en paralelo utilizado: {name}")
+        return value
+
+    def _discard(self, state: AgentState, call: SpeculativeCall):
+        if not call.task.done():
+            call.task.cancel()
+        elif not call.task.cancelled():
+            call.task.exception()  # marcar la excepción (si hubo) como recuperada
+        state.record_llm_call(call.name, wasted=True)
+        state.record_timing(f"{call.name} (descartado)", call.elapsed_until(time.perf_counter()))
+        self.misses += 1
+
+    def finish_turn(self, state: AgentState):
+        """Descarta las especulaciones que ningún nodo consumió en el turno."""
+        for call in self._calls.pop(state.session_id, {}).values():
+            self._discard(state, call)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        decided = self.hits + self.misses
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / decided, 3) if decided else None,
+        }
+
+
+# Instancia global de llamadas especulativas
+llm_speculation = LLMSpeculation()
@@ -2,77 +2,167 @@
 Tools para extraer y manejar filtros de propiedades
 """
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
-from typing import Dict, Any, Optional
+from pydantic import ValidationError
+from typing import Dict, Any, Optional, Tuple
 import json
-from models.settings import settings
-from prompts.system_prompts import (
-    EXTRACT_FILTERS_PROMPT,
-    MISSING_FILTER_QUESTION_PROMPT,
-    ASK_ADDITIONAL_FILTERS_PROMPT,
-    FORMAT_RESULTS_PROMPT
-)
+import unicodedata
+from models.state import PropertyFilters
+from db import db
+from prompts.system_prompts import DEFAULT_ESTADOS
+from prompts.compiler import prompt_compiler
 
 
-# Inicializar LLM
-llm = ChatOpenAI(
-    model=settings.openai_model,
-    temperature=settings.openai_temperature,
-    api_key=settings.openai_api_key
-)
+def get_valid_estados() -> list:
+    """Estados válidos según el catálogo (o los estados por defecto si no cargó)."""
+    return db.catalog.estados or DEFAULT_ESTADOS
+
+
+def normalize_estado(value: str) -> Optional[str]:
+    """Estado válido del catálogo equivalente a `value` (ignora mayúsculas y tildes)."""
+    def plain(text: str) -> str:
+        decomposed = unicodedata.normalize("NFKD", str(text).strip().upper())
+        return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    
+    target = plain(value)
+    for estado in get_valid_estados():
+        if plain(estado) == target:
+            return estado
+    return None
+
+
+def check_extracted_filters(data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Valida filtros extraídos contra PropertyFilters (tipos y rangos) y el
+    estado contra el catálogo. Los campos inválidos se separan, los válidos se conservan.
+    
+    Args:
+        data: Filtros candidatos (dict)
+        
+    Returns:
+        (filtros válidos normalizados, {campo: descripción del error})
+    """
+    candidates = {
+        key: value for key, value in data.items()
+        if key in PropertyFilters.model_fields and value is not None
+    }
+    errors: Dict[str, str] = {}
+    
+    try:
+        PropertyFilters.model_validate(candidates)
+    except ValidationError as e:
+        for error in e.errors():
+            field = error["loc"][0]
+            errors[field] = f"{candidates.get(field)!r}: {error['msg']}"
+    
+    valid = PropertyFilters.model_validate(
+        {key: value for key, value in candidates.items() if key not in errors}
+    ).model_dump(exclude_none=True)
+    
+    if "estado_propiedad" in valid:
+        estado = normalize_estado(valid["estado_propiedad"])
+        if estado is None:
+            errors["estado_propiedad"] = (
+                f"{valid.pop('estado_propiedad')!r}: debe ser uno de {', '.join(get_valid_estados())}"
+            )
+        else:
+            valid["estado_propiedad"] = estado
+    
+    return valid, errors
+
+
+def _structured_candidates(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Filtros candidatos de una respuesta con salida estructurada.
+    Si el schema no validó, usa los argumentos crudos del function call (para
+    validar campo por campo); si no hubo function call, intenta el JSON del texto.
+    """
+    parsed = result.get("parsed")
+    if parsed is not None:
+        return parsed.model_dump(exclude_none=True)
+    
+    raw = result.get("raw")
+    tool_calls = getattr(raw, "tool_calls", None) or []
+    if tool_calls:
+        return tool_calls[0].get("args") or {}
+    
+    content = (getattr(raw, "content", "") or "").strip()
+    if content.startswith("```"):
+        content = content.replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(content)
+        return data if isinstance(data, dict) else None
+    except json.JSONDecodeError:
+        return None
 
 
 @tool
-def extract_property_filters(user_message: str, current_filters_json: str) -> str:
+async def extract_property_filters(user_message: str, current_filters_json: str) -> str:
     """
     Extrae filtros de búsqueda de propiedades del mensaje del usuario.
+    Usa salida estructurada ligada a PropertyFilters y, si algún campo es
+    inválido, un único intento de reparación solo para esos campos.
     
     Args:
         user_message: Mensaje del usuario
         current_filters_json: JSON string con filtros ya recopilados
         
     Returns:
-        JSON string con los nuevos filtros extraídos
+        JSON string con los nuevos filtros extraídos (solo valores válidos)
     """
     print(f"🔍 Extrayendo filtros de: '{user_message[:50]}...'")
     
     try:
         # Parse current filters
         current_filters = json.loads(current_filters_json) if current_filters_json else {}
+        estados = ", ".join(get_valid_estados())
         
-        # Construir prompt
-        prompt = EXTRACT_FILTERS_PROMPT.format(
+        # Llamar al LLM (function calling con el schema de PropertyFilters)
+        result = await prompt_compiler.ainvoke(
+            "extract_filters",
+            schema=PropertyFilters,
+            estados=estados,
             user_message=user_message,
-            current_filters=json.dumps(current_filters, indent=2, ensure_ascii=False)
+            current_filters=current_filters
         )
         
-        # Llamar al LLM
-        response = llm.invoke(prompt)
-        extracted = response.content.strip()
-        
-        # Limpiar respuesta (remover markdown si existe)
-        if extracted.startswith("```json"):
-            extracted = extracted.replace("```json", "").replace("```", "").strip()
-        elif extracted.startswith("```"):
-            extracted = extracted.replace("```", "").strip()
+        candidates = _structured_candidates(result)
+        if candidates is None:
+            print(f"⚠️ Respuesta sin filtros estructurados: {result.get('parsing_error')}")
+            extracted, errors = {}, {"todos": "la respuesta no tuvo el formato esperado, extrae de nuevo todos los filtros del mensaje"}
+        else:
+            extracted, errors = check_extracted_filters(candidates)
         
-        # Validar que sea JSON válido
-        parsed = json.loads(extracted)
+        # Reparación: un solo intento, solo con los campos inválidos
+        if errors:
+            print(f"🔧 Reparando filtros inválidos: {errors}")
+            repair = await prompt_compiler.ainvoke(
+                "repair_filters",
+                schema=PropertyFilters,
+                estados=estados,
+                errors="\n".join(f"- {field} = {detail}" for field, detail in errors.items()),
+                user_message=user_message
+            )
+            repaired, still_invalid = check_extracted_filters(_structured_candidates(repair) or {})
+            
+            # Solo se aceptan los campos que se pidió reparar (o todos si falló la respuesta completa)
+            allowed = set(PropertyFilters.model_fields) if "todos" in errors else set(errors)
+            for field, value in repaired.items():
+                if field in allowed:
+                    extracted[field] = value
+            
+            if still_invalid:
+                print(f"⚠️ Filtros descartados tras reparar: {still_invalid}")
         
-        print(f"✅ Filtros extraídos: {parsed}")
-        return json.dumps(parsed, ensure_ascii=False)
+        print(f"✅ Filtros extraídos: {extracted}")
+        return json.dumps(extracted, ensure_ascii=False)
         
-    except json.JSONDecodeError as e:
-        print(f"❌ Error parseando JSON: {e}")
-        print(f"Respuesta del LLM: {extracted}")
-        return "{}"
     except Exception as e:
         print(f"❌ Error extrayendo filtros: {e}")
         return "{}"
 
 
 @tool
-def generate_missing_filter_question(missing_filter: str, current_filters_json: str) -> str:
+async def generate_missing_filter_question(missing_filter: str, current_filters_json: str) -> str:
     """
     Genera una pregunta conversacional para solicitar un filtro faltante.
     
@@ -88,14 +178,12 @@ def generate_missing_filter_question(missing_filter: str, current_filters_json:
     try:
         current_filters = json.loads(current_filters_json) if current_filters_json else {}
         
-        # Construir prompt
-        prompt = MISSING_FILTER_QUESTION_PROMPT.format(
+        # Construir prompt y llamar al LLM
+        response = await prompt_compiler.ainvoke(
+            "missing_filter_question",
             missing_filter=missing_filter,
-            current_filters=json.dumps(current_filters, indent=2, ensure_ascii=False)
+            current_filters=current_filters
         )
-        
-        # Llamar al LLM
-        response = llm.invoke(prompt)
         question = response.content.strip()
         
         print(f"✅ Pregunta generada: {question}")
@@ -115,7 +203,7 @@ def generate_missing_filter_question(missing_filter: str, current_filters_json:
 
 
 @tool
-def ask_for_additional_filters(current_filters_json: str) -> str:
+async def ask_for_additional_filters(current_filters_json: str) -> str:
     """
     Genera un mensaje preguntando si el usuario quiere agregar filtros opcionales.
     
@@ -130,13 +218,11 @@ def ask_for_additional_filters(current_filters_json: str) -> str:
     try:
         current_filters = json.loads(current_filters_json) if current_filters_json else {}
         
-        # Construir prompt
-        prompt = ASK_ADDITIONAL_FILTERS_PROMPT.format(
-            current_filters=json.dumps(current_filters, indent=2, ensure_ascii=False)
+        # Construir prompt y llamar al LLM
+        response = await prompt_compiler.ainvoke(
+            "ask_additional_filters",
+            current_filters=current_filters
         )
-        
-        # Llamar al LLM
-        response = llm.invoke(prompt)
         message = response.content.strip()
         
         print(f"✅ Mensaje generado: {message}")
@@ -148,7 +234,7 @@ def ask_for_additional_filters(current_filters_json: str) -> str:
 
 
 @tool
-def format_search_results_message(filters_json: str, properties_count: int) -> str:
+async def format_search_results_message(filters_json: str, properties_count: int) -> str:
     """
     Genera un mensaje informando sobre los resultados de la búsqueda.
     
@@ -164,14 +250,12 @@ def format_search_results_message(filters_json: str, properties_count: int) -> s
     try:
         filters = json.loads(filters_json) if filters_json else {}
         
-        # Construir prompt
-        prompt = FORMAT_RESULTS_PROMPT.format(
-            filters_json=json.dumps(filters, indent=2, ensure_ascii=False),
+        # Construir prompt y llamar al LLM
+        response = await prompt_compiler.ainvoke(
+            "format_results",
+            filters_json=filters,
             count=properties_count
         )
-        
-        # Llamar al LLM
-        response = llm.invoke(prompt)
         message = response.content.strip()
         
         print(f"✅ Mensaje generado: {message}")
@@ -225,7 +309,7 @@ def validate_filter_value(filter_name: str, filter_value: str) -> str:
                 
         elif filter_name == "estado_propiedad":
             # Validar estados válidos
-            valid_states = ["DISPONIBLE", "OCUPADA", "MANTENIMIENTO", "VENDIDA"]
+            valid_states = get_valid_estados()
             normalized = filter_value.upper()
             if normalized in valid_states:
                 result["normalized_value"] = normalized
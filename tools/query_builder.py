@@ -0,0 +1,192 @@
+"""
+Constructor determinístico de queries de búsqueda a partir de PropertyFilters
+(sin LLM: se usa para búsquedas especulativas y filtrado local de candidatos).
+Puede apuntar a las tablas base (JOIN propiedad-edificio) o a la vista
+materializada propiedad_busqueda, que ya trae las columnas de edificio.
+"""
+import numbers
+import re
+from typing import Dict, Any, List, Optional, Tuple
+from models.settings import settings
+
+
+ESSENTIAL_FILTERS = ["distrito", "area_min", "estado_propiedad", "monto_maximo", "dormitorios"]
+OPTIONAL_FILTERS = ["permite_mascotas", "balcon", "terraza", "amoblado", "banios"]
+
+# Filtro → (columna SQL, operador, clave en la fila de resultados)
+FILTER_COLUMNS = {
+    "distrito": ("e.distrito", "=", "edificio_distrito"),
+    "area_min": ("p.area", ">=", "area"),
+    "estado_propiedad": ("p.estado", "=", "estado"),
+    "monto_maximo": ("p.valor_comercial", "<=", "valor_comercial"),
+    "dormitorios": ("p.dormitorios", "=", "dormitorios"),
+    "banios": ("p.banios", "=", "banios"),
+    "permite_mascotas": ("p.permite_mascotas", "=", "permite_mascotas"),
+    "balcon": ("p.balcon", "=", "balcon"),
+    "terraza": ("p.terraza", "=", "terraza"),
+    "amoblado": ("p.amoblado", "=", "amoblado"),
+}
+
+SEARCH_SELECT = """SELECT
+    p.*,
+    e.nombre AS edificio_nombre,
+    e.direccion AS edificio_direccion,
+    e.distrito AS edificio_distrito
+FROM {schema}.propiedad p
+JOIN {schema}.edificio e ON p.edificio_id = e.id"""
+
+# Misma forma de fila que SEARCH_SELECT, sin JOIN (db/search_view.py)
+SEARCH_VIEW_SELECT = """SELECT
+    v.*
+FROM {schema}.propiedad_busqueda v"""
+
+
+def essential_key(filters: Dict[str, Any]) -> Tuple:
+    """Clave que identifica una búsqueda por sus filtros esenciales."""
+    return tuple(filters.get(name) for name in ESSENTIAL_FILTERS)
+
+
+def build_search_query(
+    filters: Dict[str, Any],
+    limit: Optional[int] = None,
+    use_view: bool = False
+) -> Tuple[str, List[Any]]:
+    """
+    Construye un SELECT parametrizado para los filtros dados.
+
+    Args:
+        filters: Filtros (model_dump de PropertyFilters, sin None)
+        limit: LIMIT del query (None = sin límite)
+        use_view: Buscar sobre la vista materializada en lugar del JOIN
+
+    Returns:
+        (query con placeholders $1..$n, lista de parámetros)
+    """
+    conditions = []
+    params: List[Any] = []
+
+    for name, (column, operator, row_key) in FILTER_COLUMNS.items():
+        value = filters.get(name)
+        if value is None:
+            continue
+        params.append(value)
+        # En la vista cada columna se llama como la clave de la fila
+        if use_view:
+            column = f"v.{row_key}"
+        conditions.append(f"{column} {operator} ${len(params)}")
+
+    select = SEARCH_VIEW_SELECT if use_view else SEARCH_SELECT
+    query = select.format(schema=settings.database_schema)
+    if conditions:
+        query += "\nWHERE\n    " + "\n    AND ".join(conditions)
+    if limit is not None:
+        query += f"\nLIMIT {int(limit)}"
+
+    return query, params
+
+
+def sql_literal(value: Any) -> str:
+    """Literal SQL de un parámetro (para mostrar el query, nunca para ejecutar input del usuario)."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, numbers.Number):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def render_search_query(
+    filters: Dict[str, Any],
+    limit: Optional[int] = None,
+    use_view: bool = False
+) -> str:
+    """
+    El query de build_search_query con los parámetros como literales: es el
+    SQL que se guarda en state.generated_sql (/properties y auditoría), así
+    se puede leer y volver a correr tal como produjo los resultados.
+    """
+    query, params = build_search_query(filters, limit, use_view=use_view)
+    return re.sub(r"\$(\d+)", lambda match: sql_literal(params[int(match.group(1)) - 1]), query)
+
+
+def _as_number(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def matches_filters(row: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """
+    Evalúa en memoria si una fila de resultados cumple los filtros
+    (misma semántica que build_search_query).
+    """
+    for name, (_column, operator, row_key) in FILTER_COLUMNS.items():
+        expected = filters.get(name)
+        if expected is None:
+            continue
+
+        actual = row.get(row_key)
+        if actual is None:
+            return False
+
+        if operator == "=":
+            if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+                if _as_number(actual) != float(expected):
+                    return False
+            elif actual != expected:
+                return False
+        elif operator == ">=":
+            number = _as_number(actual)
+            if number is None or number < float(expected):
+                return False
+        elif operator == "<=":
+            number = _as_number(actual)
+            if number is None or number > float(expected):
+                return False
+
+    return True
+
+
+def narrows(filters: Dict[str, Any], base: Dict[str, Any]) -> bool:
+    """
+    ¿Toda fila que cumple `filters` cumple también `base`? (los resultados de
+    `base` sirven entonces como candidatos para `filters`)
+    """
+    for name, (_column, operator, _row_key) in FILTER_COLUMNS.items():
+        expected = base.get(name)
+        if expected is None:
+            continue
+
+        value = filters.get(name)
+        if value is None:
+            return False
+
+        if operator == "=":
+            if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+                if _as_number(value) != float(expected):
+                    return False
+            elif value != expected:
+                return False
+        elif operator == ">=":
+            if float(value) < float(expected):
+                return False
+        elif operator == "<=":
+            if float(value) > float(expected):
+                return False
+
+    return True
+
+
+def filter_rows(rows: List[Dict[str, Any]], filters: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Filtra filas en memoria y corta al límite (respetando el orden original)."""
+    matched = []
+    for row in rows:
+        if matches_filters(row, filters):
+            matched.append(row)
+            if limit is not None and len(matched) >= limit:
+                break
+    return matched
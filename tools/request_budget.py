@@ -0,0 +1,75 @@
+"""
+Presupuesto de tiempo por request de /chat.
+
+Cada mensaje corre con un deadline (CHAT_REQUEST_TIMEOUT) guardado en un
+contextvar: el gateway de LLM y la base de datos acotan sus timeouts al tiempo
+restante, el loop de corrección de SQL no reintenta sin margen, y el pipeline
+corta el grafo al vencer el deadline o cuando el cliente se desconecta.
+El trabajo hecho en requests que nadie recibió se reporta como desperdiciado.
+"""
+from typing import Dict, Any
+from models.settings import settings
+from models.budget import RequestBudget, RequestDeadlineExceeded, current_budget, remaining_budget
+
+
+def has_retry_budget() -> bool:
+    """¿Queda tiempo para un reintento (otra llamada al LLM) en este request?"""
+    remaining = remaining_budget()
+    return remaining is None or remaining > settings.chat_retry_min_budget
+
+
+class RequestTracker:
+    """Resultado de cada request y trabajo desperdiciado en los cortados."""
+
+    COMPLETED = "completed"
+    FAILED = "failed"
+    DEADLINE_EXCEEDED = "deadline_exceeded"
+    CLIENT_DISCONNECTED = "client_disconnected"
+
+    def __init__(self):
+        self.outcomes = {
+            self.COMPLETED: 0,
+            self.FAILED: 0,
+            self.DEADLINE_EXCEEDED: 0,
+            self.CLIENT_DISCONNECTED: 0,
+        }
+        self.wasted_ms = 0.0
+        self.wasted_llm_calls = 0
+        self.wasted_llm_tokens = 0
+        self.wasted_db_queries = 0
+
+    def begin(self, timeout: float) -> RequestBudget:
+        """Crea el presupuesto del request y lo deja en el contexto actual."""
+        budget = RequestBudget(timeout)
+        current_budget.set(budget)
+        return budget
+
+    def finish(self, budget: RequestBudget, outcome: str):
+        """
+        Registra el resultado y saca el presupuesto del contexto (el trabajo
+        en background lanzado después, como la búsqueda especulativa, no hereda
+        el deadline del request).
+        """
+        current_budget.set(None)
+        self.outcomes[outcome] += 1
+        if outcome == self.CLIENT_DISCONNECTED:
+            # El cliente nunca recibe la respuesta: todo el trabajo se perdió
+            self.wasted_ms += budget.elapsed_ms()
+            self.wasted_llm_calls += budget.llm_calls
+            self.wasted_llm_tokens += budget.llm_tokens
+            self.wasted_db_queries += budget.db_queries
+            print(f"🔌 Cliente desconectado: se cancelaron {budget.elapsed_ms():.0f} ms de trabajo "
+                  f"({budget.llm_calls} llamadas al LLM, {budget.db_queries} queries)")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self.outcomes,
+            "wasted_ms": round(self.wasted_ms, 2),
+            "wasted_llm_calls": self.wasted_llm_calls,
+            "wasted_llm_tokens": self.wasted_llm_tokens,
+            "wasted_db_queries": self.wasted_db_queries,
+        }
+
+
+# Instancia global del registro de requests
+request_tracker = RequestTracker()
@@ -0,0 +1,533 @@
+"""
+Búsquedas guardadas: los filtros finales de una sesión quedan como suscripción
+y cada propiedad insertada o actualizada (avisada por db.change_feed) se
+evalúa contra todas; las coincidencias se escriben en el outbox
+saved_search_match (DDL en db/migrations/003_saved_searches.sql).
+
+El matcher no recorre las suscripciones una por una: cada suscripción es un
+bit y el índice guarda, por filtro, máscaras (enteros de Python) de las
+suscripciones que aceptan cada valor:
+- Igualdad (distrito, estado, dormitorios, baños): un bucket por valor
+- Amenities (mascotas, balcón, terraza, amoblado): bitsets de "exige sí" / "exige no"
+- Rangos (área mínima, monto máximo): umbrales ordenados con máscaras
+  acumuladas por bloque; la fila hace bisect y toma el prefijo que la acepta
+La intersección de las máscaras son las suscripciones que coinciden (misma
+semántica que query_builder.matches_filters).
+
+Uso:
+    python -m tools.saved_searches install   # crea tablas de búsquedas y outbox
+"""
+import asyncio
+import json
+import sys
+import time
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+from models.settings import settings
+from db import db
+from db.change_feed import ChangeEvent
+from tools.query_builder import FILTER_COLUMNS, SEARCH_SELECT, matches_filters
+
+
+EQUALITY_FILTERS = ["distrito", "estado_propiedad", "dormitorios", "banios"]
+BOOLEAN_FILTERS = ["permite_mascotas", "balcon", "terraza", "amoblado"]
+RANGE_FILTERS = ["area_min", "monto_maximo"]
+
+MIGRATION_FILE = Path(__file__).parent.parent / "db" / "migrations" / "003_saved_searches.sql"
+
+# Con pocas candidatas tras igualdad/amenities se verifican una por una
+SCAN_LIMIT = 256
+# Suscripciones nuevas que se evalúan en lineal antes de reconstruir el índice
+REBUILD_THRESHOLD = 1024
+
+# Cambios descartados con la cola llena: se releen del registro por seq
+RESCAN_BATCH = 500
+RESCAN_QUERY = """
+SELECT id, table_name, op, ids, distritos
+FROM {schema}.property_change_log
+WHERE id > $1 AND id <= $2
+ORDER BY id
+LIMIT $3
+"""
+
+
+def _key(value: Any) -> Any:
+    """Clave de bucket: números como float (matches_filters compara así)."""
+    if isinstance(value, bool) or isinstance(value, str):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _iter_bits(bits: int) -> Iterator[int]:
+    """Posiciones de los bits en 1 (vía bin(), rápido incluso con muchos bits)."""
+    text = bin(bits)[:1:-1]
+    position = text.find("1")
+    while position != -1:
+        yield position
+        position = text.find("1", position + 1)
+
+
+class RangeIndex:
+    """
+    Umbrales de un filtro de rango ordenados, con la máscara acumulada cada
+    BLOCK umbrales. '>=' (área mínima <= valor de la fila) es un prefijo de los
+    umbrales ascendentes; '<=' (monto máximo >= valor) se guarda negado y
+    también es un prefijo.
+    """
+
+    BLOCK = 256
+
+    def __init__(self, operator: str, entries: List[Tuple[float, int]]):
+        self.sign = 1 if operator == ">=" else -1
+        ordered = sorted((self.sign * threshold, bit) for threshold, bit in entries)
+        self.keys = [key for key, _bit in ordered]
+        self.bits = [bit for _key, bit in ordered]
+
+        self.blocks = [0]
+        mask = 0
+        for count, bit in enumerate(self.bits, 1):
+            mask |= 1 << bit
+            if count % self.BLOCK == 0:
+                self.blocks.append(mask)
+
+    def matching(self, value: float) -> int:
+        """Máscara de suscripciones cuyo umbral acepta `value`."""
+        count = bisect_right(self.keys, self.sign * value)
+        block = count // self.BLOCK
+        mask = self.blocks[block]
+        for bit in self.bits[block * self.BLOCK:count]:
+            mask |= 1 << bit
+        return mask
+
+
+class SavedSearchIndex:
+    """Índice invertido de suscripciones (filtros por id de búsqueda guardada)."""
+
+    def __init__(self):
+        self.searches: Dict[int, Dict[str, Any]] = {}
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._bit_of: Dict[int, int] = {}
+        self._ids: List[int] = []
+        self._removed = 0
+        self._all = 0
+
+        self._equality: Dict[str, Dict[Any, int]] = {}
+        self._equality_any: Dict[str, int] = {}
+        self._require_true: Dict[str, int] = {}
+        self._require_false: Dict[str, int] = {}
+        self._ranges: Dict[str, RangeIndex] = {}
+        self._range_any: Dict[str, int] = {}
+
+        self.rebuilds = 0
+        self.rebuild(())
+
+    def __len__(self) -> int:
+        return len(self.searches)
+
+    def add(self, search_id: int, filters: Dict[str, Any]):
+        """Agrega una suscripción (se indexa en la próxima reconstrucción)."""
+        self.remove(search_id)
+        self.searches[search_id] = filters
+        self._pending[search_id] = filters
+        if len(self._pending) > REBUILD_THRESHOLD:
+            self.rebuild(self.searches.items())
+
+    def remove(self, search_id: int):
+        if self.searches.pop(search_id, None) is None:
+            return
+        if self._pending.pop(search_id, None) is None:
+            self._removed |= 1 << self._bit_of.pop(search_id)
+
+    def rebuild(self, searches):
+        """Reasigna bits 0..n-1 y arma todas las máscaras."""
+        searches = dict(searches)
+        self.searches = searches
+        self._pending = {}
+        self._removed = 0
+        self._ids = list(searches)
+        self._bit_of = {search_id: bit for bit, search_id in enumerate(self._ids)}
+        self._all = (1 << len(self._ids)) - 1
+
+        equality = {name: {} for name in EQUALITY_FILTERS}
+        equality_any = {name: 0 for name in EQUALITY_FILTERS}
+        require_true = {name: 0 for name in BOOLEAN_FILTERS}
+        require_false = {name: 0 for name in BOOLEAN_FILTERS}
+        range_entries = {name: [] for name in RANGE_FILTERS}
+        range_any = {name: 0 for name in RANGE_FILTERS}
+
+        for bit, search_id in enumerate(self._ids):
+            filters = searches[search_id]
+            flag = 1 << bit
+
+            for name in EQUALITY_FILTERS:
+                value = filters.get(name)
+                if value is None:
+                    equality_any[name] |= flag
+                else:
+                    bucket = equality[name]
+                    bucket[_key(value)] = bucket.get(_key(value), 0) | flag
+
+            for name in BOOLEAN_FILTERS:
+                value = filters.get(name)
+                if value is True:
+                    require_true[name] |= flag
+                elif value is False:
+                    require_false[name] |= flag
+
+            for name in RANGE_FILTERS:
+                value = filters.get(name)
+                if value is None:
+                    range_any[name] |= flag
+                else:
+                    range_entries[name].append((float(value), bit))
+
+        self._equality = equality
+        self._equality_any = equality_any
+        self._require_true = require_true
+        self._require_false = require_false
+        self._ranges = {
+            name: RangeIndex(FILTER_COLUMNS[name][1], entries) for name, entries in range_entries.items()
+        }
+        self._range_any = range_any
+        self.rebuilds += 1
+
+    def _candidates(self, row: Dict[str, Any]) -> int:
+        """Máscara tras los filtros de igualdad y amenities."""
+        bits = self._all & ~self._removed
+
+        for name in EQUALITY_FILTERS:
+            value = row.get(FILTER_COLUMNS[name][2])
+            allowed = self._equality_any[name]
+            if value is not None:
+                allowed |= self._equality[name].get(_key(value), 0)
+            bits &= allowed
+            if not bits:
+                return 0
+
+        for name in BOOLEAN_FILTERS:
+            value = row.get(FILTER_COLUMNS[name][2])
+            if value is True:
+                bits &= ~self._require_false[name]
+            elif value is False:
+                bits &= ~self._require_true[name]
+            else:
+                bits &= ~(self._require_true[name] | self._require_false[name])
+
+        return bits
+
+    def match(self, row: Dict[str, Any]) -> List[int]:
+        """
+        Ids de las búsquedas guardadas que aceptan la fila (formato de
+        SEARCH_SELECT: columnas de propiedad + edificio_distrito).
+        """
+        bits = self._candidates(row)
+
+        if bits and bits.bit_count() > SCAN_LIMIT:
+            for name in RANGE_FILTERS:
+                value = row.get(FILTER_COLUMNS[name][2])
+                allowed = self._range_any[name]
+                if value is not None:
+                    allowed |= self._ranges[name].matching(float(value))
+                bits &= allowed
+                if not bits:
+                    break
+            matched = [self._ids[bit] for bit in _iter_bits(bits)]
+        else:
+            matched = [
+                self._ids[bit] for bit in _iter_bits(bits)
+                if matches_filters(row, self.searches[self._ids[bit]])
+            ]
+
+        # Suscripciones aún no indexadas
+        matched.extend(
+            search_id for search_id, filters in self._pending.items() if matches_filters(row, filters)
+        )
+        return matched
+
+
+class SavedSearchManager:
+    """Persistencia de búsquedas guardadas y evaluación de cambios de inventario."""
+
+    def __init__(self):
+        self.enabled = settings.saved_searches_enabled
+        self.schema = settings.database_schema
+        self.max_per_session = settings.saved_searches_max_per_session
+        self.queue_size = settings.saved_searches_queue_size
+        self.index = SavedSearchIndex()
+        self.loaded = False
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Rango de seq (desde, hasta) descartado con la cola llena, pendiente de releer
+        self._rescan: Optional[Tuple[int, int]] = None
+        self._overflowing = False
+
+        # Métricas
+        self.rows_evaluated = 0
+        self.matches = 0
+        self.total_match_ms = 0.0
+        self.max_match_ms = 0.0
+        self.dropped_events = 0
+        self.lost_events = 0
+        self.rescanned_events = 0
+        self.errors = 0
+
+        db.change_feed.subscribe("saved_searches", self.on_data_change)
+
+    async def install(self):
+        """Aplica el DDL de búsquedas guardadas y outbox (idempotente)."""
+        ddl = MIGRATION_FILE.read_text(encoding="utf-8")
+        async with db.get_connection() as conn:
+            await conn.execute(ddl.format(schema=self.schema))
+        print(f"✅ Búsquedas guardadas instaladas en {self.schema}")
+
+    async def load(self):
+        """Carga las búsquedas activas y arma el índice."""
+        rows = await db.fetch_all(
+            f"SELECT id, filters FROM {self.schema}.saved_search WHERE active"
+        )
+        start = time.perf_counter()
+        self.index.rebuild((row["id"], json.loads(row["filters"])) for row in rows)
+        self.loaded = True
+        print(f"🔔 Búsquedas guardadas: {len(self.index)} indexadas en "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    async def save(self, session_id: str, filters: Dict[str, Any]) -> int:
+        """
+        Guarda los filtros como suscripción.
+
+        Raises:
+            ValueError si no hay filtros o la sesión llegó al máximo
+        """
+        if not filters:
+            raise ValueError("La sesión no tiene filtros para guardar")
+
+        count = await db.fetch_val(
+            f"SELECT count(*) FROM {self.schema}.saved_search WHERE session_id = $1 AND active",
+            session_id
+        )
+        if count >= self.max_per_session:
+            raise ValueError(f"Máximo de {self.max_per_session} búsquedas guardadas por sesión")
+
+        search_id = await db.fetch_val(
+            f"INSERT INTO {self.schema}.saved_search (session_id, filters) VALUES ($1, $2::jsonb) RETURNING id",
+            session_id, json.dumps(filters, ensure_ascii=False)
+        )
+        self.index.add(search_id, filters)
+        print(f"🔔 Búsqueda guardada #{search_id} para sesión {session_id[:8]}...")
+        return search_id
+
+    async def delete(self, session_id: str, search_id: int) -> bool:
+        deleted = await db.fetch_val(
+            f"UPDATE {self.schema}.saved_search SET active = false "
+            f"WHERE id = $1 AND session_id = $2 AND active RETURNING id",
+            search_id, session_id
+        )
+        if deleted is None:
+            return False
+        self.index.remove(search_id)
+        return True
+
+    async def list_for_session(self, session_id: str) -> List[Dict[str, Any]]:
+        """Búsquedas activas de la sesión con sus coincidencias sin entregar."""
+        rows = await db.fetch_all(
+            f"""
+            SELECT s.id, s.filters, s.created_at,
+                   COALESCE(array_agg(m.propiedad_id ORDER BY m.matched_at)
+                            FILTER (WHERE m.id IS NOT NULL), ARRAY[]::text[]) AS pending_matches
+            FROM {self.schema}.saved_search s
+            LEFT JOIN {self.schema}.saved_search_match m
+                   ON m.saved_search_id = s.id AND m.delivered_at IS NULL
+            WHERE s.session_id = $1 AND s.active
+            GROUP BY s.id
+            ORDER BY s.id
+            """,
+            session_id
+        )
+        return [
+            {
+                "id": row["id"],
+                "filters": json.loads(row["filters"]),
+                "created_at": row["created_at"],
+                "pending_matches": list(row["pending_matches"]),
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def _relevant(event: ChangeEvent) -> bool:
+        return not event.full and event.op in ("INSERT", "UPDATE")
+
+    def on_data_change(self, event: ChangeEvent) -> int:
+        """Encola propiedades insertadas/actualizadas para evaluarlas (db.change_feed)."""
+        if self._queue is None or not self._relevant(event):
+            return 0
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._drop(event)
+        return 0
+
+    def _drop(self, event: ChangeEvent):
+        """
+        Cola llena (p.ej. una ingesta grande): el evento no se encola. Si vino
+        del registro (tiene seq) se relee después; si se publicó en proceso se pierde.
+        """
+        if not self._overflowing:
+            self._overflowing = True
+            print(f"⚠️ Cola de búsquedas guardadas llena ({self.queue_size}): "
+                  f"se descartan eventos y se releerán del registro")
+        self.dropped_events += 1
+        if event.seq is None:
+            self.lost_events += 1
+            return
+        low, high = self._rescan or (event.seq, event.seq)
+        self._rescan = (min(low, event.seq), max(high, event.seq))
+
+    async def _rescan_log(self):
+        """Relee del registro los cambios descartados (el outbox ignora duplicados)."""
+        low, high = self._rescan
+        self._rescan = None
+        print(f"📥 Releyendo cambios {low}..{high} del registro para búsquedas guardadas")
+        seq = low - 1
+        while seq < high:
+            rows = await db.fetch_all(RESCAN_QUERY.format(schema=self.schema), seq, high, RESCAN_BATCH)
+            if not rows:
+                break
+            for row in rows:
+                seq = row["id"]
+                event = ChangeEvent.from_payload(dict(row))
+                if self._relevant(event):
+                    await self.process(event)
+                    self.rescanned_events += 1
+
+    async def _changed_rows(self, event: ChangeEvent) -> List[Dict[str, Any]]:
+        ids = event.ids
+        if ids is None and event.seq is not None:
+            # El NOTIFY omite los ids si son muchos: están en el registro
+            ids = await db.fetch_val(
+                f"SELECT ids FROM {self.schema}.property_change_log WHERE id = $1", event.seq
+            )
+        if not ids:
+            return []
+
+        column = "p.id" if event.table == "propiedad" else "e.id"
+        query = SEARCH_SELECT.format(schema=self.schema) + f"\nWHERE {column}::text = ANY($1::text[])"
+        return await db.fetch_all(query, list(ids))
+
+    async def process(self, event: ChangeEvent) -> int:
+        """Evalúa las filas cambiadas contra el índice y escribe el outbox."""
+        rows = await self._changed_rows(event)
+        search_ids: List[int] = []
+        property_ids: List[str] = []
+
+        for row in rows:
+            start = time.perf_counter()
+            matched = self.index.match(row)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.rows_evaluated += 1
+            self.total_match_ms += elapsed_ms
+            self.max_match_ms = max(self.max_match_ms, elapsed_ms)
+
+            search_ids.extend(matched)
+            property_ids.extend([str(row["id"])] * len(matched))
+
+        if search_ids:
+            await db.execute_query(
+                f"""
+                INSERT INTO {self.schema}.saved_search_match (saved_search_id, propiedad_id)
+                SELECT * FROM unnest($1::bigint[], $2::text[])
+                ON CONFLICT (saved_search_id, propiedad_id) DO NOTHING
+                """,
+                search_ids, property_ids
+            )
+            self.matches += len(search_ids)
+            print(f"🔔 {len(search_ids)} coincidencias de búsquedas guardadas ({len(rows)} propiedades)")
+        return len(search_ids)
+
+    async def _work(self):
+        while True:
+            # Los descartados se releen cuando la cola se vació
+            if self._queue.empty():
+                self._overflowing = False
+            if self._rescan is not None and self._queue.empty():
+                try:
+                    await self._rescan_log()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ Error releyendo cambios para búsquedas guardadas: {e}")
+                continue
+            event = await self._queue.get()
+            try:
+                await self.process(event)
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Error evaluando búsquedas guardadas: {e}")
+
+    async def start(self):
+        """Carga el índice y empieza a evaluar cambios (si está habilitado)."""
+        if not self.enabled:
+            return
+        if not db.change_feed.enabled:
+            print("⚠️ Búsquedas guardadas sin change feed: no se evaluarán propiedades nuevas")
+        await self.load()
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._worker = asyncio.create_task(self._work())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._queue = None
+            self._rescan = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        evaluated = self.rows_evaluated
+        return {
+            "enabled": self.enabled,
+            "subscriptions": len(self.index),
+            "index_rebuilds": self.index.rebuilds,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "dropped_events": self.dropped_events,
+            "lost_events": self.lost_events,
+            "rescanned_events": self.rescanned_events,
+            "pending_rescan": list(self._rescan) if self._rescan is not None else None,
+            "rows_evaluated": evaluated,
+            "matches": self.matches,
+            "avg_match_ms": round(self.total_match_ms / evaluated, 3) if evaluated else None,
+            "max_match_ms": round(self.max_match_ms, 3) if evaluated else None,
+            "errors": self.errors,
+        }
+
+
+# Instancia global de búsquedas guardadas
+saved_searches = SavedSearchManager()
+
+
+async def _main(command: str):
+    await db.connect()
+    try:
+        if command == "install":
+            await saved_searches.install()
+        await saved_searches.load()
+        print(saved_searches.get_metrics())
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command not in ("install", "status"):
+        print("Uso: python -m tools.saved_searches [install|status]")
+        sys.exit(1)
+    asyncio.run(_main(command))
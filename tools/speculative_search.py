@@ -0,0 +1,235 @@
+"""
+Búsqueda especulativa: al completar los 5 filtros esenciales se lanza en
+background la búsqueda solo con esenciales y se guarda el set de candidatos
+en la sesión. Si el usuario dice "búscalo" el resultado ya está listo, y si
+agrega opcionales se filtra el set de candidatos en memoria. Lo mismo vale
+para cualquier refinamiento posterior que solo acote la búsqueda (menor
+presupuesto, más área, una amenity): los candidatos sirven mientras los
+filtros nuevos sean más restrictivos que los de la búsqueda especulativa.
+
+Los candidatos se descartan cuando el change feed avisa cambios en su distrito
+o en alguna de sus filas; mientras el feed está conectado el TTL es largo.
+"""
+import asyncio
+import time
+from typing import Dict, Any, List, Optional
+from models.settings import settings
+from db import db
+from tools.query_builder import ESSENTIAL_FILTERS, essential_key, build_search_query, filter_rows, narrows
+from tools.sql_tools import serialize_rows
+
+
+async def execute_filters_search(filters: Dict[str, Any], limit: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    Ejecuta la búsqueda determinística de build_search_query (sin LLM).
+
+    Args:
+        filters: Filtros a aplicar
+        limit: Máximo de filas (None = sin límite)
+
+    Returns:
+        Filas serializables
+    """
+    # Sobre la vista materializada si está fresca (sin JOIN)
+    use_view = db.search_view.is_fresh
+    db.search_view.record_query(use_view)
+    query, params = build_search_query(filters, limit, use_view=use_view)
+    rows = await db.fetch_all(query, *params, read_only=True, query_class="search")
+    return serialize_rows(rows)
+
+
+class SpeculativeSearch:
+    """Una búsqueda especulativa en curso (o terminada) para una sesión."""
+
+    def __init__(self, filters: Dict[str, Any], candidate_limit: int):
+        self.key = essential_key(filters)
+        self.filters = {name: filters[name] for name in ESSENTIAL_FILTERS if filters.get(name) is not None}
+        self.candidate_limit = candidate_limit
+        self.created_at = time.monotonic()
+        self.task: asyncio.Task = asyncio.create_task(
+            execute_filters_search(self.filters, candidate_limit)
+        )
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    @property
+    def failed(self) -> bool:
+        return self.task.done() and (self.task.cancelled() or self.task.exception() is not None)
+
+
+class SpeculativeSearchManager:
+    """Registro de búsquedas especulativas por session_id."""
+
+    def __init__(self):
+        self.enabled = settings.speculative_search_enabled
+        self.candidate_limit = settings.speculative_candidate_limit
+        self.base_ttl = settings.speculative_search_ttl
+        self.live_ttl = settings.speculative_search_live_ttl
+        self._searches: Dict[str, SpeculativeSearch] = {}
+
+        # Métricas
+        self.started = 0
+        self.hits = 0
+        self.local_filter_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+        self.refinements_local = 0
+        self.refinements_queried = 0
+
+        db.change_feed.subscribe("speculative_search", self.invalidate)
+
+    @property
+    def ttl(self) -> float:
+        """TTL largo solo mientras el change feed invalida los candidatos."""
+        return self.live_ttl if db.change_feed.is_live else self.base_ttl
+
+    def _cleanup_expired(self):
+        expired = [sid for sid, search in self._searches.items() if search.age > self.ttl]
+        for sid in expired:
+            self.discard(sid)
+
+    def start(self, session_id: str, filters: Dict[str, Any]) -> bool:
+        """
+        Lanza la búsqueda solo con esenciales si no hay una vigente con los mismos valores.
+
+        Returns:
+            True si se lanzó una búsqueda nueva
+        """
+        if not self.enabled:
+            return False
+
+        self._cleanup_expired()
+
+        current = self._searches.get(session_id)
+        if current is not None and current.key == essential_key(filters) and not current.failed:
+            return False
+
+        self.discard(session_id)
+        self._searches[session_id] = SpeculativeSearch(filters, self.candidate_limit)
+        self.started += 1
+        print(f"🔮 Búsqueda especulativa lanzada para sesión {session_id[:8]}...")
+        return True
+
+    def is_available(self, session_id: str, filters: Dict[str, Any]) -> bool:
+        """¿Hay una búsqueda especulativa vigente cuyos candidatos cubren estos filtros?"""
+        search = self._searches.get(session_id)
+        return (
+            search is not None
+            and narrows(filters, search.filters)
+            and search.age <= self.ttl
+            and not search.failed
+        )
+
+    async def get_candidates(self, session_id: str, filters: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Espera (si hace falta) y retorna el set completo de candidatos.
+        Retorna None si no hay búsqueda vigente o si falló.
+        """
+        if not self.is_available(session_id, filters):
+            return None
+
+        search = self._searches[session_id]
+        try:
+            return await search.task
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Búsqueda especulativa falló: {e}")
+            return None
+
+    def is_complete(self, session_id: str, candidates: List[Dict[str, Any]]) -> bool:
+        """¿El set de candidatos contiene todas las filas que cumplen los esenciales?"""
+        search = self._searches.get(session_id)
+        return search is not None and len(candidates) < search.candidate_limit
+
+    async def get_results(
+        self,
+        session_id: str,
+        filters: Dict[str, Any],
+        limit: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Resultado final para los filtros actuales a partir de los candidatos.
+
+        Los opcionales (y esenciales más estrictos) se aplican en memoria. Si
+        el set de candidatos fue truncado y no alcanza para llenar `limit`,
+        retorna None (hay que consultar).
+        """
+        candidates = await self.get_candidates(session_id, filters)
+        if candidates is None:
+            self.misses += 1
+            return None
+
+        # Filtros más restrictivos que la búsqueda: se aplican en memoria
+        filtered_locally = filters != self._searches[session_id].filters
+        results = filter_rows(candidates, filters, limit)
+
+        if len(results) < limit and not self.is_complete(session_id, candidates):
+            print("ℹ️ Candidatos especulativos insuficientes tras filtrar opcionales")
+            self.misses += 1
+            return None
+
+        if filtered_locally:
+            self.local_filter_hits += 1
+        else:
+            self.hits += 1
+        return results
+
+    def record_refinement(self, local: bool):
+        """Cuenta un refinamiento resuelto en memoria (local) o con un query nuevo."""
+        if local:
+            self.refinements_local += 1
+        else:
+            self.refinements_queried += 1
+
+    @staticmethod
+    def _is_affected(search: SpeculativeSearch, event) -> bool:
+        """¿El cambio puede alterar los candidatos de esta búsqueda?"""
+        if event.full or search.filters.get("distrito") in event.distritos:
+            return True
+        if not (event.property_ids or event.edificio_ids) or not search.task.done() or search.failed:
+            return False
+        rows = search.task.result()
+        property_ids, edificio_ids = set(event.property_ids), set(event.edificio_ids)
+        return any(row.get("id") in property_ids or row.get("edificio_id") in edificio_ids for row in rows)
+
+    def invalidate(self, event) -> int:
+        """
+        Descarta las búsquedas afectadas por un cambio de inventario
+        (suscrito a db.change_feed).
+
+        Returns:
+            Cantidad de búsquedas descartadas
+        """
+        affected = [sid for sid, search in self._searches.items() if self._is_affected(search, event)]
+        for sid in affected:
+            self.discard(sid)
+        self.invalidations += len(affected)
+        return len(affected)
+
+    def discard(self, session_id: str):
+        """Descarta (y cancela si sigue en curso) la búsqueda de una sesión."""
+        search = self._searches.pop(session_id, None)
+        if search is not None and not search.task.done():
+            search.task.cancel()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "active": len(self._searches),
+            "started": self.started,
+            "hits": self.hits,
+            "local_filter_hits": self.local_filter_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "invalidations": self.invalidations,
+            "refinements_local": self.refinements_local,
+            "refinements_queried": self.refinements_queried,
+            "ttl": self.ttl,
+        }
+
+
+# Instancia global de búsquedas especulativas
+speculative_search = SpeculativeSearchManager()
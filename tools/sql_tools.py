@@ -2,21 +2,15 @@
 Tools para generar, validar y ejecutar SQL queries
 """
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 import re
 import json
+import asyncpg
 from typing import List, Dict, Any
-from models.settings import settings
-from prompts.system_prompts import GENERATE_SQL_PROMPT
-from db import db
-
-
-# Inicializar LLM
-llm = ChatOpenAI(
-    model=settings.openai_model,
-    temperature=settings.openai_temperature,
-    api_key=settings.openai_api_key
-)
+from prompts.system_prompts import DEFAULT_SCHEMA_INFO
+from prompts.compiler import prompt_compiler
+from db import db, QueryRejectedError
+from tools.sql_validator import sql_validator
+from tools.request_budget import RequestDeadlineExceeded
 
 
 @tool
@@ -38,8 +32,18 @@ async def get_database_schema() -> str:
         return f"Error obteniendo schema: {e}"
 
 
+def serialize_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Filas de asyncpg como dicts JSON serializables.
+    
+    Los codecs de db/codecs.py ya entregan numeric como float, uuid como str y
+    fechas como ISO 8601: no se recorre cada valor.
+    """
+    return [row if isinstance(row, dict) else dict(row) for row in rows]
+
+
 @tool
-def generate_property_sql(filters_json: str) -> str:
+async def generate_property_sql(filters_json: str) -> str:
     """
     Genera una consulta SQL SELECT para buscar propiedades basado en filtros.
     
@@ -54,13 +58,15 @@ def generate_property_sql(filters_json: str) -> str:
     try:
         filters = json.loads(filters_json) if filters_json else {}
         
-        # Construir prompt
-        prompt = GENERATE_SQL_PROMPT.format(
-            filters_json=json.dumps(filters, indent=2, ensure_ascii=False)
-        )
+        # Schema desde el catálogo en memoria (sin consultar la base)
+        schema_info = db.catalog.render_prompt_schema() if db.catalog.is_loaded else DEFAULT_SCHEMA_INFO
         
-        # Llamar al LLM
-        response = llm.invoke(prompt)
+        # Construir prompt y llamar al LLM
+        response = await prompt_compiler.ainvoke(
+            "generate_sql",
+            schema_info=schema_info,
+            filters_json=filters
+        )
         sql = response.content.strip()
         
         # Limpiar SQL (remover markdown)
@@ -90,82 +96,23 @@ def validate_sql_query(query: str) -> str:
     """
     print(f"🔍 Validando SQL: {query[:100]}...")
     
-    result = {"valid": False, "error": None, "clean_query": None}
-    
     try:
-        # Limpiar query
-        clean_query = query.strip()
-        
         # Remover markdown si existe
-        clean_query = re.sub(r'```sql\s*', '', clean_query, flags=re.IGNORECASE)
-        clean_query = re.sub(r'```\s*', '', clean_query)
-        clean_query = clean_query.strip()
+        clean_query = re.sub(r'```sql\s*', '', query.strip(), flags=re.IGNORECASE)
+        clean_query = re.sub(r'```\s*', '', clean_query).strip()
         
-        # Remover punto y coma final si existe
-        if clean_query.endswith(";"):
-            clean_query = clean_query[:-1].strip()
+        # Validación sobre el AST (whitelist de tablas, columnas y funciones + LIMIT)
+        result = sql_validator.validate(clean_query)
         
-        # Validación 1: Debe ser SELECT
-        if not clean_query.upper().startswith("SELECT"):
-            result["error"] = "Solo se permiten queries SELECT"
+        if result["valid"]:
+            print("✅ Query validado exitosamente")
+        else:
             print(f"❌ {result['error']}")
-            return json.dumps(result, ensure_ascii=False)
-        
-        # Validación 2: No múltiples statements
-        if clean_query.count(";") > 0:
-            result["error"] = "No se permiten múltiples statements"
-            print(f"❌ {result['error']}")
-            return json.dumps(result, ensure_ascii=False)
-        
-        # Validación 3: Bloquear operaciones peligrosas
-        dangerous_patterns = [
-            r'\b(INSERT|UPDATE|DELETE|ALTER|DROP|CREATE|REPLACE|TRUNCATE)\b',
-            r'\b(EXEC|EXECUTE)\b',
-            r'--',  # SQL comments
-            r'/\*',  # Block comments
-            r'\bINTO\s+OUTFILE\b',
-            r'\bLOAD_FILE\b'
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, clean_query, re.IGNORECASE):
-                result["error"] = "Query contiene operaciones no permitidas"
-                print(f"❌ {result['error']}: patrón {pattern}")
-                return json.dumps(result, ensure_ascii=False)
-        
-        # Validación 4: Debe tener FROM
-        if not re.search(r'\bFROM\b', clean_query, re.IGNORECASE):
-            result["error"] = "Query debe tener cláusula FROM"
-            print(f"❌ {result['error']}")
-            return json.dumps(result, ensure_ascii=False)
-        
-        # Validación 5: Solo un SELECT
-        select_count = len(re.findall(r'\bSELECT\b', clean_query, re.IGNORECASE))
-        if select_count > 1:
-            # Permitir subqueries, pero validar que no sean maliciosos
-            pass
-        
-        # Validación 6: Verificar paréntesis balanceados
-        if clean_query.count('(') != clean_query.count(')'):
-            result["error"] = "Paréntesis desbalanceados"
-            print(f"❌ {result['error']}")
-            return json.dumps(result, ensure_ascii=False)
-        
-        # Validación 7: Debe tener LIMIT
-        if not re.search(r'\bLIMIT\b', clean_query, re.IGNORECASE):
-            # Agregar LIMIT automáticamente
-            clean_query += f"\nLIMIT {settings.properties_limit}"
-            print(f"⚠️ LIMIT agregado automáticamente: {settings.properties_limit}")
-        
-        # Si pasó todas las validaciones
-        result["valid"] = True
-        result["clean_query"] = clean_query
-        print("✅ Query validado exitosamente")
         
         return json.dumps(result, ensure_ascii=False)
         
     except Exception as e:
-        result["error"] = f"Error en validación: {str(e)}"
+        result = {"valid": False, "error": f"Error en validación: {str(e)}", "clean_query": None}
         print(f"❌ {result['error']}")
         return json.dumps(result, ensure_ascii=False)
 
@@ -184,23 +131,17 @@ async def execute_property_sql(query: str) -> str:
     print(f"🚀 Ejecutando SQL: {query[:100]}...")
     
     try:
-        # Ejecutar query
-        results = await db.fetch_all(query)
+        # Pre-flight: costo estimado (normalmente ya cacheado por validate_sql)
+        cost_result = await sql_validator.check_cost(query)
+        if not cost_result.get("allowed"):
+            raise ValueError(cost_result.get("error", "Query rechazado por costo"))
+        
+        # Ejecutar query (solo lectura: puede ir a una réplica) con los límites
+        # de la clase "search": statement_timeout corto y concurrencia acotada
+        results = await db.fetch_all(query, read_only=True, query_class="search")
         
         # Convertir resultados a JSON serializable
-        # asyncpg retorna objetos Record, necesitamos convertir a dict
-        serializable_results = []
-        for row in results:
-            row_dict = {}
-            for key, value in row.items():
-                # Convertir tipos especiales a strings serializables
-                if hasattr(value, 'isoformat'):  # datetime, date
-                    row_dict[key] = value.isoformat()
-                elif isinstance(value, (int, float, str, bool, type(None))):
-                    row_dict[key] = value
-                else:
-                    row_dict[key] = str(value)
-            serializable_results.append(row_dict)
+        serializable_results = serialize_rows(results)
         
         result = {
             "success": True,
@@ -209,7 +150,38 @@ async def execute_property_sql(query: str) -> str:
         }
         
         print(f"✅ Query ejecutado: {len(serializable_results)} resultados")
-        return json.dumps(result, ensure_ascii=False)
+        # default=str solo para tipos sin codec (intervalos, bytea...), no por celda
+        return json.dumps(result, ensure_ascii=False, default=str)
+        
+    except QueryRejectedError as e:
+        error_result = {
+            "success": False,
+            "error": f"Búsqueda rechazada por saturación: {e}",
+            "count": 0,
+            "data": []
+        }
+        print(f"🚫 {error_result['error']}")
+        return json.dumps(error_result, ensure_ascii=False)
+        
+    except asyncpg.QueryCanceledError as e:
+        error_result = {
+            "success": False,
+            "error": f"Búsqueda cancelada por timeout: {e}",
+            "count": 0,
+            "data": []
+        }
+        print(f"⏱️ {error_result['error']}")
+        return json.dumps(error_result, ensure_ascii=False)
+        
+    except RequestDeadlineExceeded as e:
+        error_result = {
+            "success": False,
+            "error": f"Tiempo de respuesta agotado: {e}",
+            "count": 0,
+            "data": []
+        }
+        print(f"⌛ {error_result['error']}")
+        return json.dumps(error_result, ensure_ascii=False)
         
     except Exception as e:
         error_result = {
@@ -223,7 +195,7 @@ async def execute_property_sql(query: str) -> str:
 
 
 @tool
-def fix_sql_error(original_query: str, error_message: str, filters_json: str) -> str:
+async def fix_sql_error(original_query: str, error_message: str, filters_json: str) -> str:
     """
     Intenta corregir un query SQL que falló.
     
@@ -240,32 +212,13 @@ def fix_sql_error(original_query: str, error_message: str, filters_json: str) ->
     try:
         filters = json.loads(filters_json) if filters_json else {}
         
-        fix_prompt = f"""El siguiente SQL falló con error:
-
-Query original:
-{original_query}
-
-Error:
-{error_message}
-
-Filtros de búsqueda:
-{json.dumps(filters, indent=2, ensure_ascii=False)}
-
-Schema:
-- Tabla: property_infrastructure.propiedad
-- Tabla relacionada: property_infrastructure.edificio
-- JOIN necesario: propiedad.edificio_id = edificio.id
-
-Analiza el error y genera un SQL corregido que:
-1. Solucione el problema específico del error
-2. Use los filtros correctamente
-3. Mantenga la estructura básica: SELECT con JOIN
-4. Incluya LIMIT 5
-
-Genera SOLO el SQL corregido, sin explicaciones.
-"""
-        
-        response = llm.invoke(fix_prompt)
+        # Construir prompt y llamar al LLM
+        response = await prompt_compiler.ainvoke(
+            "fix_sql",
+            original_query=original_query,
+            error_message=error_message,
+            filters_json=filters
+        )
         fixed_sql = response.content.strip()
         
         # Limpiar SQL
@@ -0,0 +1,306 @@
+"""
+Validador de SQL basado en AST (sqlglot) con whitelist y guardas de costo
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Set
+import asyncpg
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+from models.settings import settings
+from db import db
+
+
+# Errores del query en sí (SQLSTATE clase 42: sintaxis, objetos inexistentes,
+# permisos; clase 22: datos/tipos). Son los únicos que vale la pena cachear.
+QUERY_ERRORS = (asyncpg.exceptions.SyntaxOrAccessError, asyncpg.exceptions.DataError)
+
+ALLOWED_TABLES = {"propiedad", "edificio"}
+
+# Funciones permitidas en el SQL generado (todo lo demás, p.ej. pg_sleep, se rechaza)
+ALLOWED_FUNCTIONS = {
+    "lower", "upper", "trim", "unaccent", "coalesce", "nullif",
+    "round", "abs", "cast", "count", "greatest", "least",
+}
+
+# Columnas por defecto si el catálogo aún no se cargó
+DEFAULT_COLUMNS = {
+    "id", "edificio_id", "numero", "piso", "tipo", "area", "dormitorios", "banios",
+    "balcon", "terraza", "amoblado", "permite_mascotas", "valor_comercial",
+    "mantenimiento_mensual", "estado", "nombre", "direccion", "distrito", "ciudad",
+}
+
+
+class LRUCache:
+    """Cache LRU mínima para resultados de validación."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def fingerprint(query: str) -> str:
+    """Huella de un query (normaliza espacios y mayúsculas de keywords vía sqlglot)."""
+    try:
+        normalized = sqlglot.transpile(query, read="postgres", write="postgres", comments=False)[0]
+    except Exception:
+        normalized = " ".join(query.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class SQLValidator:
+    """
+    Valida SQL generado por el LLM sobre su AST:
+    - Un solo statement SELECT (sin INTO, FOR UPDATE, CTEs ni UNION)
+    - Solo tablas propiedad/edificio del schema configurado
+    - Solo columnas del catálogo y funciones de la whitelist
+    - Sin cross joins (todo JOIN con USING o con una igualdad entre columnas de ambas tablas)
+    - LIMIT obligatorio y acotado, OFFSET acotado
+    Además ofrece una guarda de costo vía EXPLAIN. Ambos resultados se cachean
+    por huella del query.
+    """
+
+    def __init__(self):
+        self.schema = settings.database_schema
+        self.max_limit = settings.properties_limit
+        self.max_offset = settings.sql_max_offset
+        self.max_plan_cost = settings.sql_max_plan_cost
+        self.validation_cache = LRUCache(settings.sql_validation_cache_size)
+        self.cost_cache = LRUCache(settings.sql_validation_cache_size)
+        db.catalog.on_change(lambda _catalog: self.clear_cache())
+
+    def clear_cache(self):
+        """Invalida los resultados cacheados (p.ej. al cambiar el schema)."""
+        self.validation_cache.clear()
+        self.cost_cache.clear()
+
+    def allowed_columns(self) -> Set[str]:
+        if db.catalog.is_loaded:
+            columns = set()
+            for table in ALLOWED_TABLES:
+                columns.update(db.catalog.column_names(table))
+            return columns
+        return DEFAULT_COLUMNS
+
+    @staticmethod
+    def _function_name(func: exp.Func) -> str:
+        if isinstance(func, exp.Anonymous):
+            return func.name.lower()
+        return func.sql_name().lower()
+
+    def _check_tree(self, tree: exp.Expression) -> Optional[str]:
+        """Retorna un mensaje de error o None si el AST es aceptable."""
+        if not isinstance(tree, exp.Select):
+            return "Solo se permiten queries SELECT"
+
+        if tree.find(exp.With) or tree.find(exp.Union, exp.Except, exp.Intersect):
+            return "No se permiten CTEs ni UNION/EXCEPT/INTERSECT"
+
+        if tree.find(exp.Into) or tree.find(exp.Lock):
+            return "No se permiten SELECT INTO ni FOR UPDATE"
+
+        if not tree.args.get("from") and not tree.args.get("from_"):
+            return "Query debe tener cláusula FROM"
+
+        for table in tree.find_all(exp.Table):
+            if table.name not in ALLOWED_TABLES:
+                return f"Tabla no permitida: {table.name}"
+            if table.db and table.db != self.schema:
+                return f"Schema no permitido: {table.db}"
+            if table.catalog:
+                return "No se permiten referencias a otras bases de datos"
+            if not table.db:
+                # Calificar con el schema configurado (evita depender del search_path)
+                table.set("db", exp.to_identifier(self.schema))
+
+        for select in tree.find_all(exp.Select):
+            error = self._check_joins(select)
+            if error:
+                return error
+
+        for offset in tree.find_all(exp.Offset):
+            value = offset.expression
+            if not (isinstance(value, exp.Literal) and value.is_int) or int(value.this) > self.max_offset:
+                return f"OFFSET no permitido: debe ser un entero de hasta {self.max_offset}"
+
+        for func in tree.find_all(exp.Func):
+            # AND/OR y EXISTS (...) son Func en sqlglot pero no funciones SQL
+            if isinstance(func, (exp.Connector, exp.Exists)):
+                continue
+            name = self._function_name(func)
+            if name not in ALLOWED_FUNCTIONS:
+                return f"Función no permitida: {name}"
+
+        allowed_columns = self.allowed_columns()
+        aliases = {alias.alias for alias in tree.find_all(exp.Alias)}
+        for column in tree.find_all(exp.Column):
+            if isinstance(column.this, exp.Star):
+                continue
+            if column.name not in allowed_columns and column.name not in aliases:
+                return f"Columna no permitida: {column.name}"
+
+        return None
+
+    @staticmethod
+    def _joins_tables(condition: exp.Expression, right: str, left: Set[str]) -> bool:
+        """¿La condición es `a.col = b.col` con una tabla de cada lado del JOIN?"""
+        if not isinstance(condition, exp.EQ):
+            return False
+        a, b = condition.this, condition.expression
+        if not (isinstance(a, exp.Column) and isinstance(b, exp.Column)):
+            return False
+        return (a.table == right and b.table in left) or (b.table == right and a.table in left)
+
+    @classmethod
+    def _check_joins(cls, select: exp.Select) -> Optional[str]:
+        """
+        Todo JOIN debe tener USING o, entre los términos AND de su ON, una
+        igualdad entre una columna de la tabla unida y una de las anteriores
+        (calificadas). `ON true`, `ON p.id > 0 AND e.id > 0` o
+        `ON p.id IS NOT NULL AND e.id IS NOT NULL` son cross joins disfrazados.
+        """
+        from_ = select.args.get("from") or select.args.get("from_")
+        left = {from_.this.alias_or_name} if from_ is not None else set()
+
+        for join in select.args.get("joins") or []:
+            right = join.this.alias_or_name
+            on = join.args.get("on")
+            if join.args.get("kind", "").upper() == "CROSS" or not (on or join.args.get("using")):
+                return "No se permiten cross joins (todo JOIN debe tener ON)"
+
+            if on is not None:
+                conditions = on.flatten() if isinstance(on, exp.And) else [on]
+                if not any(cls._joins_tables(condition, right, left) for condition in conditions):
+                    return f"El JOIN con {right} debe igualar una columna suya con una de la otra tabla (p.ej. p.edificio_id = e.id)"
+
+            left.add(right)
+        return None
+
+    def _enforce_limit(self, tree: exp.Select):
+        limit = tree.args.get("limit")
+        value = None
+        if limit is not None and isinstance(limit.expression, exp.Literal) and limit.expression.is_int:
+            value = int(limit.expression.this)
+
+        if value is None or value > self.max_limit:
+            print(f"⚠️ LIMIT ajustado automáticamente: {self.max_limit}")
+            tree.set("limit", exp.Limit(expression=exp.Literal.number(self.max_limit)))
+
+    def validate(self, query: str) -> Dict[str, Any]:
+        """
+        Valida un query.
+
+        Returns:
+            {"valid": bool, "error": str | None, "clean_query": str | None}
+        """
+        key = fingerprint(query)
+        cached = self.validation_cache.get(key)
+        if cached is not None:
+            print("⚡ Validación obtenida de cache")
+            return dict(cached)
+
+        result = {"valid": False, "error": None, "clean_query": None}
+
+        try:
+            statements = [stmt for stmt in sqlglot.parse(query, read="postgres") if stmt is not None]
+        except ParseError as e:
+            result["error"] = f"SQL con sintaxis inválida: {str(e).splitlines()[0]}"
+            self.validation_cache.set(key, result)
+            return dict(result)
+
+        if len(statements) != 1:
+            result["error"] = "No se permiten múltiples statements"
+            self.validation_cache.set(key, result)
+            return dict(result)
+
+        tree = statements[0]
+        error = self._check_tree(tree)
+        if error:
+            result["error"] = error
+        else:
+            self._enforce_limit(tree)
+            result["valid"] = True
+            result["clean_query"] = tree.sql(dialect="postgres", pretty=True, comments=False)
+
+        self.validation_cache.set(key, result)
+        return dict(result)
+
+    async def check_cost(self, query: str) -> Dict[str, Any]:
+        """
+        Estima el costo del query con EXPLAIN (sin ejecutarlo).
+
+        Returns:
+            {"allowed": bool, "cost": float | None, "error": str | None}
+        """
+        key = fingerprint(query)
+        cached = self.cost_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+        result = {"allowed": True, "cost": None, "error": None}
+
+        try:
+            plan_json = await db.fetch_val(
+                f"EXPLAIN (FORMAT JSON) {query}",
+                read_only=True,
+                query_class="explain"
+            )
+            plan = json.loads(plan_json) if isinstance(plan_json, str) else plan_json
+            cost = float(plan[0]["Plan"]["Total Cost"])
+            result["cost"] = cost
+
+            if cost > self.max_plan_cost:
+                result["allowed"] = False
+                result["error"] = f"Query demasiado costoso (costo estimado {cost:.0f} > {self.max_plan_cost:.0f})"
+
+        except QUERY_ERRORS as e:
+            # EXPLAIN falla con los mismos errores que el query (columna inexistente, tipos, etc.)
+            result["allowed"] = False
+            result["error"] = f"Error en EXPLAIN: {e}"
+        except Exception as e:
+            # Transitorio (sin conexión, EXPLAIN cortado por statement_timeout, clase
+            # "explain" saturada, deadline del request): no hay estimación, así que
+            # no se bloquea ni se cachea; el mismo query puede estimarse después
+            print(f"⚠️ No se pudo estimar el costo: {type(e).__name__}: {e}")
+            return result
+
+        self.cost_cache.set(key, result)
+        return dict(result)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "validation_cache_size": len(self.validation_cache),
+            "validation_cache_hits": self.validation_cache.hits,
+            "validation_cache_misses": self.validation_cache.misses,
+            "cost_cache_size": len(self.cost_cache),
+            "cost_cache_hits": self.cost_cache.hits,
+            "cost_cache_misses": self.cost_cache.misses,
+        }
+
+
+# Instancia global del validador
+sql_validator = SQLValidator()